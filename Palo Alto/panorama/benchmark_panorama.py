@@ -0,0 +1,133 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+EXPORTERS = ['policies', 'policies_stream', 'policies_chunked', 'tags', 'duplicates']
+DEFAULT_EXPORTERS = ['policies', 'policies_stream', 'tags', 'duplicates']
+DEFAULT_SCALES = [1000, 10000, 100000]
+
+
+def run_exporter(name, url, filename):
+    # Worker side: runs in its own process so peak RSS belongs to this exporter alone
+    from panorama_client import PanoramaClient
+    from panorama_metrics import metrics
+    from mock_panorama_server import MOCK_API_KEY
+
+    metrics.reset(name)
+    client = PanoramaClient(url, api_key=MOCK_API_KEY, rate=0)
+    dgs = client.get_device_groups()
+    if name.startswith('policies'):
+        from panorama_export_policies import export_policies
+        export_policies(client, dgs, filename, stream=name == 'policies_stream',
+                        chunk_size=200 if name == 'policies_chunked' else None)
+    elif name == 'tags':
+        from panorama_export_tags import export_tags
+        export_tags(client, dgs, filename)
+    elif name == 'duplicates':
+        from panorama_check_duplicate_objects import check_duplicates
+        check_duplicates(client, ['shared'] + dgs, filename)
+    return metrics.summary()
+
+
+def start_mock_server(scale, device_groups, latency_ms):
+    cmd = [
+        sys.executable, os.path.join(SCRIPT_DIR, 'mock_panorama_server.py'), '--port', '0',
+        '--device-groups', str(device_groups), '--rules', str(scale),
+        '--addresses', str(scale), '--tags', str(max(10, scale // 10)), '--latency-ms', str(latency_ms),
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True, cwd=SCRIPT_DIR)
+    line = proc.stdout.readline()
+    if 'listening on' not in line:
+        proc.kill()
+        raise RuntimeError(f"Mock server failed to start: {line.strip()}")
+    return proc, line.split('listening on ')[1].split()[0]
+
+
+def bench(scale, exporter, url, workdir):
+    out_csv = os.path.join(workdir, f"{exporter}_{scale}.csv")
+    out_json = os.path.join(workdir, f"{exporter}_{scale}.json")
+    cmd = [sys.executable, os.path.abspath(__file__), '--worker', exporter, '--url', url,
+           '--csv', out_csv, '--result', out_json]
+    start = time.perf_counter()
+    subprocess.run(cmd, check=True, cwd=SCRIPT_DIR, stdout=subprocess.DEVNULL)
+    wall = time.perf_counter() - start
+    with open(out_json, 'r', encoding='utf-8') as f:
+        summary = json.load(f)
+    return {
+        'scale': scale,
+        'exporter': exporter,
+        'wall_seconds': round(wall, 3),
+        'export_seconds': summary['duration_seconds'],
+        'rows': summary['counters'].get('rows', 0),
+        'rows_per_second': summary['rows_per_second'],
+        'requests': summary['counters'].get('requests', 0),
+        'response_mb': round(summary['counters'].get('request_bytes', 0) / 1048576, 2),
+        'peak_rss_mb': round((summary['process_peak_rss_bytes'] or 0) / 1048576, 1),
+    }
+
+
+def print_table(results):
+    columns = ['scale', 'exporter', 'wall_seconds', 'export_seconds', 'rows', 'rows_per_second',
+               'requests', 'response_mb', 'peak_rss_mb']
+    widths = {c: max(len(c), *(len(str(r[c])) for r in results)) for c in columns}
+    print('  '.join(c.ljust(widths[c]) for c in columns))
+    for r in results:
+        print('  '.join(str(r[c]).ljust(widths[c]) for c in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the Panorama exporters against a local mock server with synthetic configs.')
+    parser.add_argument('--scales', default=','.join(str(s) for s in DEFAULT_SCALES),
+                        help='Comma-separated object counts (rules and address objects; tags are scale/10)')
+    parser.add_argument('--exporters', default=','.join(DEFAULT_EXPORTERS),
+                        help=f"Comma-separated subset of: {', '.join(EXPORTERS)}")
+    parser.add_argument('--device-groups', type=int, default=20)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Simulated API latency per request')
+    parser.add_argument('--output', help='Also write the results as JSON to this file')
+    # Internal: a single measured exporter run
+    parser.add_argument('--worker', choices=EXPORTERS, help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    parser.add_argument('--csv', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        summary = run_exporter(args.worker, args.url, args.csv)
+        with open(args.result, 'w', encoding='utf-8') as f:
+            json.dump(summary, f)
+        return
+
+    scales = [int(s) for s in args.scales.split(',') if s.strip()]
+    exporters = [e.strip() for e in args.exporters.split(',') if e.strip()]
+    unknown = [e for e in exporters if e not in EXPORTERS]
+    if unknown:
+        print(f"Unknown exporters: {', '.join(unknown)}")
+        sys.exit(1)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='panorama_bench_') as workdir:
+        for scale in scales:
+            print(f"Starting mock Panorama with {scale} rules/addresses...")
+            proc, url = start_mock_server(scale, args.device_groups, args.latency_ms)
+            try:
+                for exporter in exporters:
+                    print(f"  {exporter}...", flush=True)
+                    results.append(bench(scale, exporter, url, workdir))
+            finally:
+                proc.terminate()
+                proc.wait()
+    print()
+    print_table(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,88 +1,185 @@
-import requests
 import sys
+import csv
+import json
+import time
+import asyncio
 import getpass
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import xml.etree.ElementTree as ET
+
+import requests
+
+from panorama_client import DEFAULT_RATE, PanoramaClient, add_client_arguments, prompt_login
+from panorama_metrics import add_metrics_arguments, metrics, metrics_session
+
+FLEET_FIELDNAMES = [
+    'host', 'status', 'hostname', 'model', 'version', 'uptime',
+    'device_groups', 'shared_addresses', 'latency_ms', 'elapsed_ms', 'error'
+]
+
+
+def get_system_info(client):
+    root = ET.fromstring(client.op('<show><system><info></info></system></show>'))
+    return {
+        'hostname': root.findtext('.//hostname', 'N/A'),
+        'model': root.findtext('.//model', 'N/A'),
+        'version': root.findtext('.//sw-version', 'N/A'),
+        'uptime': root.findtext('.//uptime', 'N/A'),
+    }
+
+
+def get_device_group_names(client):
+    return client.get_device_groups()
 
-# Disable SSL warnings
-try:
-    import urllib3
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-except ImportError:
-    pass
 
+def get_shared_address_count(client):
+    root = ET.fromstring(client.config_get('/config/shared/address'))
+    return len(root.findall('.//entry'))
 
-def get_api_key(panorama_host, username, password):
-    key_url = f"https://{panorama_host}/api/?type=keygen&user={username}&password={password}"
+
+def read_inventory(path):
+    """
+    One host per line, optionally followed by a comma and an API key for that host.
+    Blank lines and lines starting with '#' are ignored.
+    """
+    hosts = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            host, _, api_key = line.partition(',')
+            hosts.append((host.strip(), api_key.strip() or None))
+    return hosts
+
+
+def query_host(host, api_key, username, password, timeout, rate=DEFAULT_RATE):
+    # Blocking part of the fleet sweep: login if needed, then the three calls in parallel.
+    # The host's `timeout` seconds start now, not when it was queued.
+    row = {'host': host, 'status': 'ok'}
+    client = PanoramaClient(host, api_key=api_key, max_workers=3, timeout=timeout, retries=1, rate=rate)
+    start = time.perf_counter()
+    client.deadline = time.monotonic() + timeout
     try:
-        r = requests.get(key_url, verify=False, timeout=10)
-        if '<key>' not in r.text:
-            return None
-        return r.text.split('<key>')[1].split('</key>')[0]
+        if not client.api_key and not client.login(username, password):
+            # login() reports errors itself; a failure at the deadline was a timeout
+            row.update(status='timeout' if time.monotonic() >= client.deadline else 'login_failed')
+            return row
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            calls_start = time.perf_counter()
+            info = pool.submit(get_system_info, client)
+            dgs = pool.submit(get_device_group_names, client)
+            addresses = pool.submit(get_shared_address_count, client)
+            row.update(info.result())
+            row['latency_ms'] = round((time.perf_counter() - calls_start) * 1000, 1)
+            row['device_groups'] = len(dgs.result())
+            row['shared_addresses'] = addresses.result()
+    except requests.Timeout:
+        row = {'host': host, 'status': 'timeout'}
     except Exception as e:
-        print(f"Error connecting to Panorama: {e}")
-        return None
+        row = {'host': host, 'status': 'error', 'error': str(e)}
+    finally:
+        client.close()
+        row['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    return row
 
-def main():
-    print("=== Panorama Login Test ===\n")
-    print("This script will test your Panorama login and display basic system information.")
-    panorama_host = input("Enter Panorama IP or hostname: ").strip()
-    print("You will be asked for your username and password.")
 
-    # Credential check loop
-    max_attempts = 3
-    for attempt in range(1, max_attempts + 1):
+async def sweep_fleet(hosts, username, password, concurrency, timeout, rate=DEFAULT_RATE):
+    """
+    Query every host concurrently, at most `concurrency` at a time.
+    Each host gets `timeout` seconds in total from when it starts (one retry at most),
+    enforced by the client's connect/read timeouts; slow or broken hosts are reported.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    async def run(host, api_key):
+        async with semaphore:
+            row = await loop.run_in_executor(executor, query_host, host, api_key, username, password, timeout, rate)
+            print(f"  {host}: {row['status']} ({row['elapsed_ms']} ms)")
+            return row
+
+    try:
+        return await asyncio.gather(*(run(host, api_key) for host, api_key in hosts))
+    finally:
+        executor.shutdown(wait=False)
+
+
+def write_fleet_report(rows, filename):
+    if filename.endswith('.json'):
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=2)
+        return
+    with open(filename, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FLEET_FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def fleet_main(args):
+    print("=== Panorama/Firewall Fleet Inventory ===\n")
+    hosts = read_inventory(args.inventory)
+    if not hosts:
+        print(f"No hosts found in {args.inventory}. Exiting.")
+        sys.exit(1)
+    username = password = None
+    if any(api_key is None for _, api_key in hosts):
+        print("Hosts without an API key in the inventory will log in with these credentials.")
         username = input("Enter username: ").strip()
         print("Please enter your password. (Input will be hidden)")
         password = getpass.getpass("Enter password: ")
-        api_key = get_api_key(panorama_host, username, password)
-        if api_key:
-            print(f"✓ Login successful! API key obtained.")
-            break
-        else:
-            print(f"✗ Login failed. Check credentials. Attempt {attempt} of {max_attempts}.")
-    else:
-        print("Too many failed login attempts. Exiting.")
-        sys.exit(1)
+
+    print(f"\nQuerying {len(hosts)} hosts (concurrency {args.concurrency}, timeout {args.timeout}s)...")
+    start = time.perf_counter()
+    rows = asyncio.run(sweep_fleet(hosts, username, password, args.concurrency, args.timeout, args.rate))
+    elapsed = time.perf_counter() - start
+
+    filename = args.output or f"fleet_inventory_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    write_fleet_report(rows, filename)
+    metrics.add_rows(len(rows))
+    ok = sum(1 for row in rows if row['status'] == 'ok')
+    print(f"\nSweep complete in {elapsed:.1f}s: {ok}/{len(rows)} hosts OK. Report saved to {filename}")
+
+
+def main(rate=DEFAULT_RATE):
+    print("=== Panorama Login Test ===\n")
+    print("This script will test your Panorama login and display basic system information.")
+    panorama_host = input("Enter Panorama IP or hostname: ").strip()
+    client = PanoramaClient(panorama_host, max_workers=1, rate=rate)
+    prompt_login(client)
+    print("✓ Login successful! API key obtained.")
 
     # Test API calls
     print("\n=== Testing API Calls ===")
-    
+
     # Get system info
     print("1. Getting system information...")
-    sys_url = f"https://{panorama_host}/api/?type=op&cmd=<show><system><info></info></system></show>&key={api_key}"
     try:
-        r = requests.get(sys_url, verify=False, timeout=10)
-        import xml.etree.ElementTree as ET
-        root = ET.fromstring(r.text)
-        hostname = root.findtext('.//hostname', 'N/A')
-        version = root.findtext('.//sw-version', 'N/A')
-        uptime = root.findtext('.//uptime', 'N/A')
-        print(f"   Hostname: {hostname}")
-        print(f"   Version: {version}")
-        print(f"   Uptime: {uptime}")
+        info = get_system_info(client)
+        print(f"   Hostname: {info['hostname']}")
+        print(f"   Version: {info['version']}")
+        print(f"   Uptime: {info['uptime']}")
     except Exception as e:
         print(f"   Error getting system info: {e}")
 
     # Get device groups count
     print("2. Getting device groups...")
-    dg_url = f"https://{panorama_host}/api/?type=config&action=get&xpath=/config/devices/entry/device-group&key={api_key}"
     try:
-        r = requests.get(dg_url, verify=False, timeout=10)
-        root = ET.fromstring(r.text)
-        dg_count = len(root.findall('.//entry'))
+        dg_names = get_device_group_names(client)
+        dg_count = len(dg_names)
         print(f"   Number of device groups: {dg_count}")
         if dg_count > 0:
-            dg_names = [entry.attrib.get('name', '') for entry in root.findall('.//entry')]
             print(f"   Device groups: {', '.join(dg_names[:5])}{'...' if len(dg_names) > 5 else ''}")
     except Exception as e:
         print(f"   Error getting device groups: {e}")
 
     # Get address objects count
     print("3. Getting address objects...")
-    addr_url = f"https://{panorama_host}/api/?type=config&action=get&xpath=/config/shared/address&key={api_key}"
     try:
-        r = requests.get(addr_url, verify=False, timeout=10)
-        root = ET.fromstring(r.text)
-        addr_count = len(root.findall('.//entry'))
+        addr_count = get_shared_address_count(client)
         print(f"   Number of shared address objects: {addr_count}")
     except Exception as e:
         print(f"   Error getting address objects: {e}")
@@ -91,4 +188,17 @@ def main():
     print("If you see the system information above, your login is working correctly!")
 
 if __name__ == "__main__":
-    main() 
+    parser = argparse.ArgumentParser(description='Panorama login test, or a concurrent fleet inventory sweep.')
+    parser.add_argument('--inventory', metavar='FILE',
+                        help='Fleet mode: file with one host per line (optionally "host,api_key")')
+    parser.add_argument('--concurrency', type=int, default=20, help='Hosts queried at the same time (default: 20)')
+    parser.add_argument('--timeout', type=float, default=15, help='Seconds allowed per host (default: 15)')
+    parser.add_argument('--output', help='Fleet report path; .json for JSON, anything else for CSV')
+    add_client_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    with metrics_session(args, 'get_basic_panorama_information'):
+        if args.inventory:
+            fleet_main(args)
+        else:
+            main(rate=args.rate)
@@ -0,0 +1,342 @@
+import re
+import sys
+import time
+import zlib
+import random
+import argparse
+import threading
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from panorama_bulk_config import LocalConfig
+
+MOCK_API_KEY = 'MOCKAPIKEY'
+MOCK_COMMIT_JOB = 1
+MOCK_NOW = 1700000000
+NAME_IN_PREDICATE = re.compile(r"""@name=(?:'([^']*)'|"([^"]*)")""")
+RECEIVE_TIME = re.compile(r"receive_time (geq|leq) '([^']+)'")
+LOG_TIME_FORMAT = '%Y/%m/%d %H:%M:%S'
+
+
+def generate_config(device_groups=10, rules=1000, tags=100, addresses=1000, seed=42) -> ET.Element:
+    """
+    Build a synthetic <config> shaped like a Panorama running config.
+    Rules, tags and address objects are totals spread over the device groups
+    (addresses also go to shared); every fifth device group is the parent of the next four.
+    Values are drawn from small pools so duplicates and overlapping subnets occur.
+    """
+    rnd = random.Random(seed)
+    config = ET.Element('config')
+    dg_root = ET.SubElement(ET.SubElement(ET.SubElement(config, 'devices'), 'entry', name='localhost.localdomain'),
+                            'device-group')
+    shared = ET.SubElement(config, 'shared')
+    readonly_dgs = ET.SubElement(ET.SubElement(ET.SubElement(ET.SubElement(config, 'readonly'), 'devices'), 'entry',
+                                               name='localhost.localdomain'), 'device-group')
+    dg_names = [f"DG-{i:03d}" for i in range(1, device_groups + 1)]
+    dg_elems = {}
+    for i, dg in enumerate(dg_names):
+        dg_elems[dg] = ET.SubElement(dg_root, 'entry', name=dg)
+        ro = ET.SubElement(readonly_dgs, 'entry', name=dg)
+        if i % 5:
+            ET.SubElement(ro, 'parent-dg').text = dg_names[i - i % 5]
+
+    def scope_of(i, with_shared=False):
+        # Spread items evenly; with_shared puts roughly one in five into shared
+        if with_shared and i % 5 == 0:
+            return shared
+        return dg_elems[dg_names[i % len(dg_names)]] if dg_names else shared
+
+    def child(parent, tag):
+        node = parent.find(tag)
+        return node if node is not None else ET.SubElement(parent, tag)
+
+    tag_names = [f"tag-{i}" for i in range(max(1, tags))]
+    for i, name in enumerate(tag_names[:tags]):
+        entry = ET.SubElement(child(scope_of(i), 'tag'), 'entry', name=name)
+        ET.SubElement(entry, 'color').text = f"color{rnd.randint(1, 16)}"
+        if rnd.random() < 0.3:
+            ET.SubElement(entry, 'comments').text = f"Synthetic tag {i}"
+
+    address_names = []
+    for i in range(addresses):
+        name = f"addr-{i}"
+        address_names.append(name)
+        entry = ET.SubElement(child(scope_of(i, with_shared=True), 'address'), 'entry', name=name)
+        kind = rnd.random()
+        a, b = rnd.randint(0, 40), rnd.randint(0, 255)
+        if kind < 0.55:
+            ET.SubElement(entry, 'ip-netmask').text = f"10.{a}.{b}.{rnd.randint(1, 254)}"
+        elif kind < 0.8:
+            ET.SubElement(entry, 'ip-netmask').text = f"10.{a}.{b}.0/{rnd.choice([16, 20, 24, 28])}"
+        elif kind < 0.9:
+            start = rnd.randint(1, 200)
+            ET.SubElement(entry, 'ip-range').text = f"10.{a}.{b}.{start}-10.{a}.{b}.{start + rnd.randint(1, 50)}"
+        else:
+            ET.SubElement(entry, 'fqdn').text = f"host{rnd.randint(0, addresses // 10 + 1)}.example.com"
+        if rnd.random() < 0.2:
+            ET.SubElement(ET.SubElement(entry, 'tag'), 'member').text = rnd.choice(tag_names)
+
+    applications = ['ssl', 'web-browsing', 'dns', 'ssh', 'ms-rdp', 'ldap', 'ntp', 'smtp']
+    for i in range(rules):
+        scope = scope_of(i)
+        kind = rnd.random()
+        rulebase, rule_type = ('pre-rulebase', 'security') if kind < 0.8 else \
+            ('post-rulebase', 'security') if kind < 0.9 else ('pre-rulebase', 'nat')
+        rules_elem = child(child(child(scope, rulebase), rule_type), 'rules')
+        entry = ET.SubElement(rules_elem, 'entry', name=f"rule-{i}")
+        for field in ('from', 'to'):
+            ET.SubElement(ET.SubElement(entry, field), 'member').text = rnd.choice(['trust', 'untrust', 'dmz', 'any'])
+        for field in ('source', 'destination'):
+            members = ET.SubElement(entry, field)
+            picks = ['any'] if rnd.random() < 0.2 or not address_names else \
+                rnd.sample(address_names, min(len(address_names), rnd.randint(1, 4)))
+            for name in picks:
+                ET.SubElement(members, 'member').text = name
+        if rule_type == 'nat':
+            ET.SubElement(entry, 'service').text = 'any'
+            if address_names:
+                translation = ET.SubElement(ET.SubElement(entry, 'destination-translation'), 'translated-address')
+                translation.text = rnd.choice(address_names)
+        else:
+            apps = ET.SubElement(entry, 'application')
+            for app in (['any'] if rnd.random() < 0.3 else rnd.sample(applications, rnd.randint(1, 3))):
+                ET.SubElement(apps, 'member').text = app
+            ET.SubElement(ET.SubElement(entry, 'service'), 'member').text = \
+                rnd.choice(['application-default', 'any', 'service-http', 'service-https'])
+            ET.SubElement(entry, 'action').text = 'allow' if rnd.random() < 0.85 else 'deny'
+        if rnd.random() < 0.3:
+            ET.SubElement(ET.SubElement(entry, 'tag'), 'member').text = rnd.choice(tag_names)
+        if rnd.random() < 0.05:
+            ET.SubElement(entry, 'disabled').text = 'yes'
+    return config
+
+
+class MockPanorama:
+    """
+    Answers the XML API calls these scripts make (keygen, op, config get) from a
+    generated or loaded config. Serialized responses are cached per xpath.
+    latency_ms adds a fixed delay per request; error_rate returns random HTTP 503s.
+    Log queries return one synthetic log every log_interval seconds of the queried
+    receive_time range; each log job reports FIN log_job_ms after it was submitted.
+    """
+    def __init__(self, config: ET.Element, latency_ms=0.0, error_rate=0.0, log_interval=1.0, log_job_ms=200.0):
+        self.local = LocalConfig(config)
+        self.latency = latency_ms / 1000.0
+        self.error_rate = error_rate
+        self.log_interval = log_interval
+        self.log_job_time = log_job_ms / 1000.0
+        self.jobs = {}
+        self.next_job = MOCK_COMMIT_JOB + 1
+        self.cache = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def config_get(self, xpath):
+        with self.lock:
+            if xpath in self.cache:
+                return self.cache[xpath]
+        response = ET.Element('response', status='success')
+        result = ET.SubElement(response, 'result')
+        if xpath.endswith('/entry/@name'):
+            node = self.local.find(xpath[:-len('/entry/@name')])
+            if node is not None:
+                for entry in node.findall('entry'):
+                    ET.SubElement(result, 'entry', name=entry.attrib.get('name', ''))
+        elif xpath.endswith(']') and ' or @name=' in xpath[xpath.rfind('/entry['):]:
+            # Name-list windows used by chunked retrieval: .../entry[@name='a' or @name='b']
+            base, predicate = xpath[:xpath.rfind('/entry[')], xpath[xpath.rfind('/entry['):]
+            wanted = {a or b for a, b in NAME_IN_PREDICATE.findall(predicate)}
+            node = self.local.find(base)
+            if node is not None:
+                result.extend(e for e in node.findall('entry') if e.attrib.get('name') in wanted)
+        else:
+            node = self.local.find(xpath)
+            if node is not None:
+                result.append(node)
+        body = ET.tostring(response)
+        with self.lock:
+            self.cache[xpath] = body
+        return body
+
+    def op(self, cmd):
+        if '<system><info>' in cmd:
+            return (b"<response status='success'><result><system><hostname>mock-panorama</hostname>"
+                    b"<model>Panorama</model><sw-version>11.1.0</sw-version>"
+                    b"<uptime>0 days, 1:00:00</uptime></system></result></response>")
+        if '<jobs>' in cmd:
+            return (f"<response status='success'><result><job><id>{MOCK_COMMIT_JOB}</id><type>CommitAll</type>"
+                    f"<status>FIN</status><result>OK</result></job></result></response>").encode()
+        if '<rule-hit-count>' in cmd:
+            return self.rule_hit_count(ET.fromstring(cmd))
+        return b"<response status='error'><msg>Unsupported op command in mock server</msg></response>"
+
+    def rule_hit_count(self, show):
+        # Deterministic counts per rule name, reported by two firewalls (some rules never hit)
+        response = ET.Element('response', status='success')
+        dg_out = ET.SubElement(ET.SubElement(ET.SubElement(response, 'result'), 'rule-hit-count'), 'device-group')
+        for dg in show.findall('rule-hit-count/device-group/entry'):
+            base_out = ET.SubElement(ET.SubElement(dg_out, 'entry', name=dg.attrib['name']), 'rule-base')
+            for type_entry in dg.findall('*/entry'):
+                rules_out = ET.SubElement(ET.SubElement(base_out, 'entry', name=type_entry.attrib['name']), 'rules')
+                for rule in type_entry.findall('rules/rule-name/entry'):
+                    name = rule.attrib['name']
+                    seed = zlib.crc32(f"{dg.attrib['name']}/{name}".encode())
+                    rule_out = ET.SubElement(rules_out, 'entry', name=name)
+                    devices = ET.SubElement(rule_out, 'device-vsys')
+                    for i, serial in enumerate(('007900000000001', '007900000000002')):
+                        hits = 0 if seed % 10 == 0 else (seed >> (8 * i)) % 100000
+                        device = ET.SubElement(devices, 'entry', name=f"{serial}/vsys1")
+                        ET.SubElement(device, 'hit-count').text = str(hits)
+                        ET.SubElement(device, 'last-hit-timestamp').text = str(MOCK_NOW - seed % 86400 * (i + 1)
+                                                                               if hits else 0)
+                    ET.SubElement(rule_out, 'rule-state').text = 'Used' if seed % 10 else 'Unused'
+        return ET.tostring(response)
+
+    def log(self, params):
+        if params.get('action') == 'finish':
+            with self.lock:
+                self.jobs.pop(params.get('job-id'), None)
+            return b"<response status='success'><result><msg>Job finished</msg></result></response>"
+        if params.get('action') == 'get':
+            with self.lock:
+                job = self.jobs.get(params.get('job-id'))
+            if job is None:
+                return b"<response status='error'><msg>Job not found</msg></response>"
+            if time.monotonic() - job['submitted'] < self.log_job_time:
+                return (f"<response status='success'><result><job><id>{params['job-id']}</id><status>ACT</status>"
+                        f"</job><log><logs count='0' progress='50'/></log></result></response>").encode()
+            with self.lock:
+                self.jobs.pop(params['job-id'], None)
+            return self.log_page(params['job-id'], job)
+        with self.lock:
+            job_id = str(self.next_job)
+            self.next_job += 1
+            self.jobs[job_id] = dict(params, submitted=time.monotonic())
+        return (f"<response status='success'><result><msg><line>query job enqueued with jobid {job_id}</line></msg>"
+                f"<job>{job_id}</job></result></response>").encode()
+
+    def log_page(self, job_id, job):
+        bounds = {op: datetime.strptime(value, LOG_TIME_FORMAT) for op, value in RECEIVE_TIME.findall(job['query'])}
+        first, last = bounds.get('geq'), bounds.get('leq')
+        if first is None or last is None:
+            return b"<response status='error'><msg>Mock log queries need a receive_time range</msg></response>"
+        # Logs fall on multiples of log_interval seconds since the epoch
+        first_ts, last_ts = first.timestamp(), last.timestamp()
+        step = self.log_interval
+        index = -int(-first_ts // step) + int(job.get('skip', 0))
+        response = ET.Element('response', status='success')
+        result = ET.SubElement(response, 'result')
+        ET.SubElement(ET.SubElement(result, 'job'), 'status').text = 'FIN'
+        logs = ET.SubElement(ET.SubElement(result, 'log'), 'logs', progress='100')
+        for _ in range(int(job.get('nlogs', 20))):
+            ts = index * step
+            # receive_time has whole seconds: leq '...:59' includes ...:59.5
+            if ts >= last_ts + 1:
+                break
+            seed = zlib.crc32(str(index).encode())
+            entry = ET.SubElement(logs, 'entry', logid=str(index))
+            for field, value in (('receive_time', datetime.fromtimestamp(ts).strftime(LOG_TIME_FORMAT)),
+                                 ('serial', '007900000000001'), ('device_name', 'fw-1'), ('vsys', 'vsys1'),
+                                 ('from', 'trust'), ('to', 'untrust'),
+                                 ('src', f"10.{seed % 256}.{seed >> 8 & 255}.{seed >> 16 & 255}"),
+                                 ('dst', f"192.0.2.{seed % 254 + 1}"), ('sport', str(1024 + seed % 60000)),
+                                 ('dport', str((443, 80, 53, 22)[seed % 4])), ('proto', 'tcp'),
+                                 ('app', ('ssl', 'web-browsing', 'dns', 'ssh')[seed % 4]), ('rule', 'rule-0'),
+                                 ('action', 'allow' if seed % 10 else 'deny'), ('bytes', str(seed % 100000)),
+                                 ('packets', str(seed % 100)), ('elapsed', str(seed % 60)),
+                                 ('session_end_reason', 'tcp-fin')):
+                ET.SubElement(entry, field).text = value
+            index += 1
+        logs.set('count', str(len(logs)))
+        return ET.tostring(response)
+
+    def handle(self, params):
+        # Returns (http status, body)
+        with self.lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            return 503, b"<response status='error'><msg>Injected failure</msg></response>"
+        req_type = params.get('type', '')
+        if req_type == 'keygen':
+            return 200, f"<response status='success'><result><key>{MOCK_API_KEY}</key></result></response>".encode()
+        if params.get('key') != MOCK_API_KEY:
+            return 403, b"<response status='error' code='403'><result><msg>Invalid credentials.</msg></result></response>"
+        if req_type == 'op':
+            return 200, self.op(params.get('cmd', ''))
+        if req_type == 'log':
+            return 200, self.log(params)
+        if req_type == 'config' and params.get('action') in ('get', 'show'):
+            return 200, self.config_get(params.get('xpath', ''))
+        return 400, b"<response status='error'><msg>Unsupported request in mock server</msg></response>"
+
+
+def make_handler(mock):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body are separate writes; without this, Nagle + delayed ACK add ~40 ms per request
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path.rstrip('/') != '/api':
+                status, body = 404, b"<response status='error'><msg>Not found</msg></response>"
+            else:
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                status, body = mock.handle(params)
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/xml')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(mock, host='127.0.0.1', port=0):
+    # Serve in a background thread; returns (server, base url usable as the Panorama host)
+    server = ThreadingHTTPServer((host, port), make_handler(mock))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the Panorama XML API (plain HTTP).')
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--bind', default='127.0.0.1')
+    parser.add_argument('--config', help='Serve this config XML instead of a generated one')
+    parser.add_argument('--device-groups', type=int, default=10)
+    parser.add_argument('--rules', type=int, default=1000, help='Total rules across device groups')
+    parser.add_argument('--tags', type=int, default=100, help='Total tags across device groups')
+    parser.add_argument('--addresses', type=int, default=1000, help='Total address objects incl. shared')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Delay added to every request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 503')
+    parser.add_argument('--log-interval', type=float, default=1.0, help='Seconds between synthetic logs')
+    parser.add_argument('--log-job-ms', type=float, default=200.0, help='Time until a log job reports FIN')
+    args = parser.parse_args()
+
+    if args.config:
+        config = ET.parse(args.config).getroot()
+    else:
+        config = generate_config(args.device_groups, args.rules, args.tags, args.addresses, args.seed)
+    mock = MockPanorama(config, args.latency_ms, args.error_rate, args.log_interval, args.log_job_ms)
+    server, url = start_server(mock, args.bind, args.port)
+    print(f"Mock Panorama listening on {url} (API key: {MOCK_API_KEY})", flush=True)
+    print("Use this URL as the Panorama host. Press Ctrl+C to stop.", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
+
+if __name__ == "__main__":
+    main()
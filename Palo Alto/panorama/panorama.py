@@ -0,0 +1,208 @@
+import os
+import sys
+import json
+import argparse
+from datetime import datetime
+import xml.etree.ElementTree as ET
+
+from panorama_credentials import (
+    DEFAULT_KEY_CACHE, DEFAULT_KEY_TTL_HOURS, ENV_HOST, ENV_API_KEY, ENV_USERNAME, ENV_PASSWORD,
+    ApiKeyCache, authenticated_client, check_auth, with_relogin
+)
+from panorama_metrics import add_metrics_arguments, metrics_session
+from panorama_output import add_format_arguments, output_filenames
+
+# Only the selected subcommand's modules are imported (requests, openpyxl, pyarrow, ...);
+# the bare --help never loads them.
+DESCRIPTION = f"""Non-interactive Panorama tools for scripts and cron.
+
+Credentials: {ENV_API_KEY}, or {ENV_USERNAME} with {ENV_PASSWORD} (or a keyring entry
+'panorama:<host>'). Keys from a login are cached for --key-ttl-hours. The host comes from
+--host or {ENV_HOST}. Device groups are discovered automatically unless -d is given."""
+
+
+def timestamp():
+    return datetime.now().strftime('%Y%m%d_%H%M%S')
+
+
+def require_host(args):
+    if not args.host:
+        print(f"No Panorama host: use --host or set {ENV_HOST}.")
+        sys.exit(2)
+    return args.host
+
+
+def key_cache(args):
+    return ApiKeyCache(args.key_cache, 0 if args.no_key_cache else args.key_ttl_hours * 3600)
+
+
+def device_groups(client):
+    # Names only; also the first API call of a run, so a rejected cached key shows up here
+    from panorama_client import DEVICE_GROUP_XPATH
+    r = check_auth(client.get({'type': 'config', 'action': 'get', 'xpath': f"{DEVICE_GROUP_XPATH}/entry/@name"}))
+    root = ET.fromstring(r.content)
+    if root.attrib.get('status') != 'success':
+        raise RuntimeError(f"Device group discovery failed: {root.findtext('.//msg', '')}")
+    return [entry.attrib['name'] for entry in root.findall('result/entry') if entry.attrib.get('name')]
+
+
+def live_client(args):
+    # (client, discovered device groups), logged in with the env / cached / keyring credentials
+    host = require_host(args)
+    cache = key_cache(args)
+    client, from_cache = authenticated_client(host, args.username, cache, max_workers=args.workers, rate=args.rate)
+    try:
+        return client, with_relogin(client, from_cache, device_groups, args.username, cache)
+    except Exception as e:
+        print(f"Failed to reach {host}: {e}")
+        sys.exit(1)
+
+
+def select_device_groups(args, available):
+    if not args.device_group:
+        return available
+    unknown = [dg for dg in args.device_group if dg not in available]
+    if unknown:
+        print(f"Unknown device group(s): {', '.join(unknown)}")
+        sys.exit(1)
+    return args.device_group
+
+
+def config_source(args):
+    """
+    (config source, selected device groups): the latest cached snapshot with --offline,
+    otherwise the API. The selection is checked before any config is pulled.
+    """
+    from panorama_snapshot_cache import open_config_source
+    if args.offline:
+        source = open_config_source(require_host(args), args)
+        return source, select_device_groups(args, source.get_device_groups())
+    client, available = live_client(args)
+    dgs = select_device_groups(args, available)
+    return open_config_source(args.host, args, client), dgs
+
+
+def add_common_arguments(parser):
+    parser.add_argument('--host', default=os.environ.get(ENV_HOST), help=f'Panorama host (default: ${ENV_HOST})')
+    parser.add_argument('--username', help=f'Login user when no API key is available (default: ${ENV_USERNAME})')
+    parser.add_argument('--key-cache', default=DEFAULT_KEY_CACHE, help=f'API key cache file (default: {DEFAULT_KEY_CACHE})')
+    parser.add_argument('--key-ttl-hours', type=float, default=DEFAULT_KEY_TTL_HOURS,
+                        help=f'Reuse a cached API key for this long (default: {DEFAULT_KEY_TTL_HOURS})')
+    parser.add_argument('--no-key-cache', action='store_true', help='Neither read nor store cached API keys')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent API requests (default: 8)')
+    parser.add_argument('--rate', type=float, default=10.0,
+                        help='Maximum API requests per second, 0 for no limit (default: 10)')
+    add_metrics_arguments(parser)
+
+
+def add_export_arguments(parser, name):
+    from panorama_snapshot_cache import add_cache_arguments
+    add_cache_arguments(parser)
+    add_format_arguments(parser)
+    parser.add_argument('-d', '--device-group', action='append',
+                        help='Device group to export, repeat for several (default: all)')
+    parser.add_argument('-o', '--output', metavar='BASE',
+                        help=f'Output path without extension (default: {name}_<timestamp>)')
+
+
+def add_info_arguments(parser):
+    parser.add_argument('--json', action='store_true', help='Print the result as JSON')
+
+
+def run_info(args):
+    from get_basic_panorama_information import get_system_info, get_shared_address_count
+    client, dgs = live_client(args)
+    info = get_system_info(client)
+    info['device_groups'] = len(dgs)
+    info['shared_addresses'] = get_shared_address_count(client)
+    if args.json:
+        print(json.dumps(info))
+    else:
+        for key, value in info.items():
+            print(f"{key.replace('_', ' ').capitalize()}: {value}")
+
+
+def add_policies_arguments(parser):
+    add_export_arguments(parser, 'panorama_export_policies')
+    parser.add_argument('--stream', action='store_true', help='Write each rule as soon as it is parsed')
+    parser.add_argument('--chunk-size', type=int, metavar='N',
+                        help='Fetch rules in parallel windows of N rules (live API only, implies --no-cache)')
+    parser.add_argument('--resolve', action='store_true',
+                        help='Add columns with address/service groups expanded to prefixes and ports')
+    parser.add_argument('--hit-counts', action='store_true',
+                        help='Add rule hit counts and last-hit times (live API only, implies --no-cache)')
+
+
+def run_policies(args):
+    from panorama_export_policies import export_policies
+    if args.chunk_size or args.hit_counts:
+        args.no_cache = True
+    source, dgs = config_source(args)
+    filenames = output_filenames(args.output or f"panorama_export_policies_{timestamp()}", args.formats or ['csv'])
+    export_policies(source, dgs, filenames, stream=args.stream, chunk_size=args.chunk_size,
+                    resolve=args.resolve, hit_counts=args.hit_counts)
+    print(f"Policies saved to {', '.join(filenames)}")
+
+
+def add_tags_arguments(parser):
+    add_export_arguments(parser, 'panorama_export_tags')
+
+
+def run_tags(args):
+    from panorama_export_tags import export_tags
+    source, dgs = config_source(args)
+    filenames = output_filenames(args.output or f"panorama_export_tags_{timestamp()}", args.formats or ['csv'])
+    export_tags(source, dgs, filenames)
+    print(f"Tags saved to {', '.join(filenames)}")
+
+
+def add_duplicates_arguments(parser):
+    add_export_arguments(parser, 'panorama_duplicate_objects')
+    parser.add_argument('--no-cross-scope', action='store_true',
+                        help='Do not compare device groups against their parents and shared')
+
+
+def run_duplicates(args):
+    from panorama_check_duplicate_objects import check_duplicates
+    source, dgs = config_source(args)
+    cross_scope = not args.no_cross_scope
+    if cross_scope and not args.device_group:
+        dgs = ['shared'] + dgs
+    filenames = output_filenames(args.output or f"panorama_duplicate_objects_{timestamp()}", args.formats or ['csv'])
+    check_duplicates(source, dgs, filenames, cross_scope=cross_scope)
+    print(f"Duplicate objects saved to {', '.join(filenames)}")
+
+
+# name: (help, add_arguments, run)
+COMMANDS = {
+    'info': ('Show system information and the number of device groups', add_info_arguments, run_info),
+    'policies': ('Export security and NAT policies', add_policies_arguments, run_policies),
+    'tags': ('Export tags', add_tags_arguments, run_tags),
+    'duplicates': ('Find duplicate, overlapping and contained address objects',
+                   add_duplicates_arguments, run_duplicates),
+}
+
+
+def build_parser(command=None):
+    # Arguments are only built for the selected subcommand, which keeps its imports lazy
+    parser = argparse.ArgumentParser(prog='panorama', description=DESCRIPTION,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', metavar='COMMAND', required=True)
+    for name, (help_text, add_arguments, _) in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help_text, description=help_text)
+        if name == command:
+            add_common_arguments(subparser)
+            add_arguments(subparser)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    command = next((arg for arg in argv if arg in COMMANDS), None)
+    args = build_parser(command).parse_args(argv)
+    with metrics_session(args, f"panorama_{args.command}"):
+        COMMANDS[args.command][2](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import io
+import gzip
+import xml.etree.ElementTree as ET
+
+from panorama_client import DEVICE_GROUP_XPATH, READONLY_DG_XPATH, SHARED_XPATH
+from panorama_metrics import metrics
+
+
+def fetch_bulk_config(client, action: str = 'get') -> ET.Element:
+    """
+    Pull the whole device-group subtree and /config/shared with one request each
+    (plus the small readonly device-group section that holds the hierarchy)
+    and assemble them into a single <config> document shaped like the running config.
+    action='get' pulls the candidate config, action='show' the running config.
+    """
+    config = ET.Element('config')
+    device_entry = ET.SubElement(ET.SubElement(config, 'devices'), 'entry', name='localhost.localdomain')
+    readonly_entry = ET.SubElement(ET.SubElement(ET.SubElement(config, 'readonly'), 'devices'),
+                                   'entry', name='localhost.localdomain')
+    for xpath, parent in ((DEVICE_GROUP_XPATH, device_entry), (SHARED_XPATH, config),
+                          (READONLY_DG_XPATH, readonly_entry)):
+        print(f"Pulling {xpath} ...")
+        r = client.config_get_stream(xpath, action)
+        try:
+            # Download and parse overlap here, so they are timed as one phase
+            with metrics.phase('bulk_pull'):
+                root = ET.parse(r.raw).getroot()
+        finally:
+            r.close()
+        result = root.find('result')
+        if root.get('status') != 'success' or result is None:
+            raise RuntimeError(f"Config {action} for {xpath} failed: {root.findtext('.//msg', '')}")
+        parent.extend(list(result))
+    return config
+
+
+def save_config(config: ET.Element, filename: str):
+    ET.ElementTree(config).write(filename, encoding='utf-8', xml_declaration=True)
+
+
+def load_config(filename: str) -> 'LocalConfig':
+    # Plain or gzip-compressed XML (e.g. a snapshot from the cache)
+    opener = gzip.open if filename.endswith('.gz') else open
+    with metrics.phase('parse'), opener(filename, 'rb') as f:
+        return LocalConfig(ET.parse(f).getroot())
+
+
+class LocalResponse:
+    # Minimal stand-in for a streamed requests.Response (only .raw and .close() are used)
+    def __init__(self, body: bytes):
+        self.raw = io.BytesIO(body)
+
+    def close(self):
+        self.raw.close()
+
+
+class LocalConfig:
+    """
+    Serves config get requests from an in-memory <config> document.
+    Exposes the same methods the exporters use on PanoramaClient, so the policy,
+    tag and duplicate exports can run against one bulk pull without further API calls.
+    """
+    def __init__(self, config: ET.Element):
+        self.config = config
+
+    def find(self, xpath: str):
+        # ElementTree understands the simple path/entry[@name='x'] xpaths the scripts use
+        if xpath.rstrip('/') == '/config':
+            return self.config
+        if not xpath.startswith('/config/'):
+            raise ValueError(f"Unsupported xpath: {xpath}")
+        return self.config.find(xpath[len('/config/'):])
+
+    def config_get_element(self, xpath: str, action: str = 'get') -> ET.Element:
+        # Wrap the node like the XML API does: <response><result>node</result></response>.
+        # action is accepted for PanoramaClient compatibility; the document is whichever
+        # config (candidate or running) it was pulled from
+        response = ET.Element('response', status='success')
+        result = ET.SubElement(response, 'result')
+        node = self.find(xpath)
+        if node is not None:
+            result.append(node)
+        return response
+
+    def config_get(self, xpath: str, action: str = 'get') -> str:
+        return ET.tostring(self.config_get_element(xpath), encoding='unicode')
+
+    def config_get_stream(self, xpath: str, action: str = 'get') -> LocalResponse:
+        return LocalResponse(ET.tostring(self.config_get_element(xpath)))
+
+    def get_device_groups(self):
+        dgs = [entry.attrib.get('name') for entry in self.config.findall('devices/entry/device-group/entry')]
+        return [dg for dg in dgs if dg]
+
+    def map_ordered(self, func, items):
+        # Parsing is CPU-bound and local, so there is nothing to gain from threads here
+        for item in items:
+            yield func(item)
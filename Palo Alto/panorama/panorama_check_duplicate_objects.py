@@ -1,32 +1,25 @@
-import requests
 import sys
+import argparse
 from datetime import datetime
-import getpass
-import csv
+import bisect
 import ipaddress
 
-# Disable SSL warnings
-try:
-    import urllib3
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-except ImportError:
-    pass
+from panorama_client import DEFAULT_RATE, PanoramaClient, add_client_arguments, get_dg_parents, prompt_login, scope_chain, scope_xpath
+from panorama_metrics import add_metrics_arguments, metrics, metrics_session
+from panorama_records import RecordParser
+from panorama_output import add_format_arguments, OpenSink, output_filenames
+
+FIELDNAMES = [
+    'device_group', 'object_name', 'object_value', 'duplicate_type', 'duplicate_with'
+]
+# Address types compared by the checker; contiguous wildcard masks (10.0.0.0/0.0.0.255)
+# get a range like the netmask they equal, other wildcards are compared by value
+COMPARED_TYPES = ('ip-netmask', 'fqdn', 'ip-range', 'ip-wildcard')
 
 def prompt_with_default(prompt, default):
     value = input(f"{prompt} (default: {default}): ").strip()
     return value if value else default
 
-def get_api_key(panorama_host, username, password):
-    key_url = f"https://{panorama_host}/api/?type=keygen&user={username}&password={password}"
-    try:
-        r = requests.get(key_url, verify=False, timeout=10)
-        if '<key>' not in r.text:
-            return None
-        return r.text.split('<key>')[1].split('</key>')[0]
-    except Exception as e:
-        print(f"Error connecting to Panorama: {e}")
-        return None
-
 def normalize_ip(value):
     # Normalize IPs: 1.1.1.1 and 1.1.1.1/32 are the same
     try:
@@ -40,43 +33,251 @@ def normalize_ip(value):
     except Exception:
         return value.strip()
 
-def main():
+def address_range(value):
+    # (ip version, first, last) as integers for ip-netmask / ip-range values, None otherwise (fqdn, ...)
+    try:
+        if '-' in value:
+            first, last = (ipaddress.ip_address(v.strip()) for v in value.split('-', 1))
+            if first.version != last.version or int(last) < int(first):
+                return None
+            return first.version, int(first), int(last)
+        net = ipaddress.ip_network(value.strip(), strict=False)
+        return net.version, int(net.network_address), int(net.broadcast_address)
+    except ValueError:
+        return None
+
+class AddressObject:
+    __slots__ = ('name', 'value', 'key', 'rng')
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+        self.rng = address_range(value)
+        # Objects with the same key are value duplicates (10.0.0.0/24 == 10.0.0.0-10.0.0.255);
+        # objects without a value have none
+        self.key = self.rng or (normalize_ip(value) if value else None)
+
+def address_value(record):
+    # record: panorama_records.AddressRecord
+    return record.value if record.type in COMPARED_TYPES else ''
+
+def parse_address_objects(root, parser=None):
+    parser = parser or RecordParser()
+    return [AddressObject(record.name, address_value(record))
+            for record in map(parser.address, root.findall('.//address/entry'))]
+
+class AddressIndex:
+    """
+    Index over the address objects of one scope (shared or a device group).
+    Names and values are hashed; ip ranges are kept per IP version sorted by
+    (first, -last) with a running maximum of 'last', so "is this range contained in /
+    overlapped by an object of this scope" is a single bisect.
+    """
+    def __init__(self, scope, objects):
+        self.scope = scope
+        self.names = set()
+        self.by_key = {}
+        self.intervals = {}
+        for obj in objects:
+            self.names.add(obj.name)
+            if obj.key is not None:
+                self.by_key.setdefault(obj.key, []).append(obj.name)
+            if obj.rng:
+                version, first, last = obj.rng
+                self.intervals.setdefault(version, []).append(((first, -last), last, obj.name))
+        for version, items in self.intervals.items():
+            items.sort()
+            keys, names, max_last = [], [], []
+            best = (-1, '')
+            for key, last, name in items:
+                if last > best[0]:
+                    best = (last, name)
+                keys.append(key)
+                names.append(name)
+                max_last.append(best)
+            self.intervals[version] = (keys, names, max_last)
+
+    def containing(self, rng):
+        # Name of an object strictly containing rng (the one reaching furthest), or None
+        version, first, last = rng
+        if version not in self.intervals:
+            return None
+        keys, _, max_last = self.intervals[version]
+        i = bisect.bisect_left(keys, (first, -last))
+        if i and max_last[i - 1][0] >= last:
+            return max_last[i - 1][1]
+        return None
+
+    def overlapping(self, rng):
+        # Name of an object that partially overlaps rng or lies inside it, or None
+        version, first, last = rng
+        if version not in self.intervals:
+            return None
+        keys, names, max_last = self.intervals[version]
+        # Starts before rng and ends inside it
+        i = bisect.bisect_left(keys, (first, float('-inf')))
+        if i and first <= max_last[i - 1][0] < last:
+            return max_last[i - 1][1]
+        # Starts inside rng, including at its first address (but not the same range)
+        i = bisect.bisect_right(keys, (first, -last))
+        if i < len(keys) and keys[i][0] <= last:
+            return names[i]
+        return None
+
+def sweep_overlaps(objects):
+    """
+    Containment and partial overlap between objects of one scope: sort by (first, -last)
+    and keep a stack of ranges that are still open. Each range is compared with every open
+    one, so a range inside several others reports all of them; the cost is O(n log n)
+    plus the number of pairs found.
+    Yields (name, 'contained' or 'overlap', other_name); exact value matches are skipped.
+    """
+    by_version = {}
+    for obj in objects:
+        if obj.rng:
+            by_version.setdefault(obj.rng[0], []).append(obj)
+    for items in by_version.values():
+        items.sort(key=lambda o: (o.rng[1], -o.rng[2], o.name))
+        stack = []
+        for obj in items:
+            _, first, last = obj.rng
+            # Every range still on the stack starts at or before obj
+            stack = [open_obj for open_obj in stack if open_obj.rng[2] >= first]
+            for open_obj in stack:
+                if open_obj.rng == obj.rng:
+                    # Already a value duplicate
+                    continue
+                if open_obj.rng[2] >= last:
+                    yield obj.name, 'contained', open_obj.name
+                else:
+                    yield obj.name, 'overlap', open_obj.name
+                    yield open_obj.name, 'overlap', obj.name
+            stack.append(obj)
+
+def find_duplicates(dg, objects, ancestors=()):
+    """
+    Returns CSV rows for every object of scope dg that duplicates, is contained in
+    or overlaps another object of the same scope or of a scope it inherits from.
+    ancestors: AddressIndex of each inherited scope, nearest first (parents, then shared).
+    Matches in other scopes are reported as 'scope/name'.
+    """
+    index = AddressIndex(dg, objects)
+    name_counts = {}
+    for obj in objects:
+        name_counts[obj.name] = name_counts.get(obj.name, 0) + 1
+    found = {}
+
+    def add(name, duplicate_type, other=None):
+        types, others = found.setdefault(name, ([], set()))
+        if duplicate_type not in types:
+            types.append(duplicate_type)
+        if other:
+            others.add(other)
+
+    for obj in objects:
+        # Name duplicates
+        if name_counts[obj.name] > 1:
+            add(obj.name, 'name')
+        # Value duplicates
+        for other in index.by_key.get(obj.key, ()):
+            if other != obj.name:
+                add(obj.name, 'value', other)
+        # Inherited scopes: name overrides, same values, covering or overlapping ranges
+        for anc in ancestors:
+            if obj.name in anc.names:
+                add(obj.name, 'name', f"{anc.scope}/{obj.name}")
+            if obj.key in anc.by_key:
+                for other in anc.by_key[obj.key]:
+                    add(obj.name, 'value', f"{anc.scope}/{other}")
+            elif obj.rng:
+                other = anc.containing(obj.rng)
+                if other:
+                    add(obj.name, 'contained', f"{anc.scope}/{other}")
+                else:
+                    other = anc.overlapping(obj.rng)
+                    if other:
+                        add(obj.name, 'overlap', f"{anc.scope}/{other}")
+    for name, duplicate_type, other in sweep_overlaps(objects):
+        add(name, duplicate_type, other)
+
+    rows = []
+    seen = set()
+    for obj in objects:
+        if obj.name not in found or obj.name in seen:
+            continue
+        seen.add(obj.name)
+        types, others = found[obj.name]
+        rows.append({
+            'device_group': dg,
+            'object_name': obj.name,
+            'object_value': obj.value,
+            'duplicate_type': ','.join(types),
+            'duplicate_with': ','.join(sorted(others))
+        })
+    return rows
+
+def fetch_address_objects(client, scope, parser=None):
+    # Runs on a worker thread; returns the parsed address objects of one scope (or None on failure)
+    print(f"Checking address objects for device group: {scope}")
+    try:
+        return parse_address_objects(client.config_get_element(scope_xpath(scope, '/address')), parser)
+    except Exception as e:
+        print(f"Failed to parse address objects for {scope}: {e}")
+        return None
+
+def check_duplicates(client, dgs, filename, cross_scope=True):
+    """
+    client can be a PanoramaClient or any config source with the same interface (e.g. LocalConfig).
+    With cross_scope, each device group is also compared with its parent device groups and shared.
+    filename can be a list; each file gets the format of its extension (see panorama_output).
+    """
+    parents = get_dg_parents(client) if cross_scope else {}
+    chains = {dg: (scope_chain(dg, parents) if cross_scope else [dg]) for dg in dgs}
+    scopes = []
+    for dg in dgs:
+        for scope in chains[dg]:
+            if scope not in scopes:
+                scopes.append(scope)
+    # One parser for all scopes: names and values repeated across device groups are stored once
+    parser = RecordParser()
+    objects = dict(zip(scopes, client.map_ordered(lambda scope: fetch_address_objects(client, scope, parser), scopes)))
+    indexes = {}
+
+    def get_index(scope):
+        if scope not in indexes:
+            indexes[scope] = AddressIndex(scope, objects[scope] or [])
+        return indexes[scope]
+
+    with OpenSink(filename, FIELDNAMES) as sink:
+        writer = metrics.wrap_writer(sink)
+        writer.writeheader()
+        # Rows are written in device group order
+        for dg in dgs:
+            if objects.get(dg) is None:
+                continue
+            ancestors = [get_index(scope) for scope in chains[dg][1:]]
+            writer.writerows(find_duplicates(dg, objects[dg], ancestors))
+
+def main(formats=None, rate=DEFAULT_RATE):
     print("=== Panorama Duplicate Address Object Checker ===\n")
     print("Please enter your Panorama credentials.")
     panorama_host = input("Enter Panorama IP or hostname: ").strip()
-    print("You will be asked for your username and password.")
-
-    # Credential check loop
-    max_attempts = 3
-    for attempt in range(1, max_attempts + 1):
-        username = input("Enter username: ").strip()
-        print("Please enter your password. (Input will be hidden)")
-        password = getpass.getpass("Enter password: ")
-        api_key = get_api_key(panorama_host, username, password)
-        if api_key:
-            break
-        else:
-            print(f"Login failed. Check credentials. Attempt {attempt} of {max_attempts}.")
-    else:
-        print("Too many failed login attempts. Exiting.")
-        sys.exit(1)
+    client = PanoramaClient(panorama_host, rate=rate)
+    prompt_login(client)
 
     device_group = prompt_with_default(
         "Enter device group to check (or leave blank for all)", "all"
     )
+    cross_scope = prompt_with_default(
+        "Also compare against parent device groups and shared? (y/n)", "y"
+    ).lower() == 'y'
 
     # Get device groups if needed
     if device_group == "all":
-        dg_url = f"https://{panorama_host}/api/?type=config&action=get&xpath=/config/devices/entry/device-group&key={api_key}"
-        r = requests.get(dg_url, verify=False)
-        dgs = []
-        import xml.etree.ElementTree as ET
         try:
-            root = ET.fromstring(r.text)
-            for entry in root.findall('.//entry'):
-                dg_name = entry.attrib.get('name')
-                if dg_name:
-                    dgs.append(dg_name)
+            dgs = client.get_device_groups()
+            if cross_scope:
+                dgs = ['shared'] + dgs
         except Exception as e:
             print(f"Failed to parse device groups: {e}")
             sys.exit(1)
@@ -84,63 +285,15 @@ def main():
         dgs = [device_group]
 
     now = datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f"panorama_duplicate_objects_{now}.csv"
-    fieldnames = [
-        'device_group', 'object_name', 'object_value', 'duplicate_type', 'duplicate_with'
-    ]
-    with open(filename, 'w', encoding='utf-8', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        for dg in dgs:
-            print(f"Checking address objects for device group: {dg}")
-            xpath = f"/config/devices/entry/device-group/entry[@name='{dg}']/address"
-            url = f"https://{panorama_host}/api/?type=config&action=get&xpath={xpath}&key={api_key}"
-            r = requests.get(url, verify=False)
-            import xml.etree.ElementTree as ET
-            try:
-                root = ET.fromstring(r.text)
-                objects = root.findall('.//entry')
-                name_map = {}
-                value_map = {}
-                obj_info = {}
-                for obj in objects:
-                    name = obj.attrib.get('name', '')
-                    value = obj.findtext('ip-netmask') or obj.findtext('fqdn') or obj.findtext('ip-range') or ''
-                    norm_value = normalize_ip(value)
-                    obj_info[name] = (value, norm_value)
-                    # Name map
-                    if name in name_map:
-                        name_map[name].append(name)
-                    else:
-                        name_map[name] = [name]
-                    # Value map
-                    if norm_value in value_map:
-                        value_map[norm_value].append(name)
-                    else:
-                        value_map[norm_value] = [name]
-                # Find duplicates
-                for name, (value, norm_value) in obj_info.items():
-                    duplicate_type = []
-                    duplicate_with = set()
-                    # Name duplicates
-                    if len(name_map[name]) > 1:
-                        duplicate_type.append('name')
-                        duplicate_with.update([n for n in name_map[name] if n != name])
-                    # Value duplicates
-                    if len(value_map[norm_value]) > 1:
-                        duplicate_type.append('value')
-                        duplicate_with.update([n for n in value_map[norm_value] if n != name])
-                    if duplicate_type:
-                        writer.writerow({
-                            'device_group': dg,
-                            'object_name': name,
-                            'object_value': value,
-                            'duplicate_type': ','.join(duplicate_type),
-                            'duplicate_with': ','.join(sorted(duplicate_with))
-                        })
-            except Exception as e:
-                print(f"Failed to parse address objects for {dg}: {e}")
-    print(f"\nCheck complete. Duplicate objects saved to {filename}")
+    filenames = output_filenames(f"panorama_duplicate_objects_{now}", formats or ['csv'])
+    check_duplicates(client, dgs, filenames, cross_scope=cross_scope)
+    print(f"\nCheck complete. Duplicate objects saved to {', '.join(filenames)}")
 
 if __name__ == "__main__":
-    main() 
+    parser = argparse.ArgumentParser(description='Find duplicate, overlapping and contained address objects.')
+    add_client_arguments(parser)
+    add_metrics_arguments(parser)
+    add_format_arguments(parser)
+    args = parser.parse_args()
+    with metrics_session(args, 'panorama_check_duplicate_objects'):
+        main(formats=args.formats, rate=args.rate)
@@ -0,0 +1,327 @@
+import sys
+import time
+import random
+import getpass
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import xml.etree.ElementTree as ET
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from panorama_metrics import metrics
+
+# Disable SSL warnings
+try:
+    import urllib3
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+except ImportError:
+    pass
+
+DEFAULT_TIMEOUT = 30
+DEFAULT_WORKERS = 8
+DEFAULT_RETRIES = 4
+DEFAULT_RATE = 10.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Transient transport failures, also while the body is being read
+RETRY_ERRORS = (requests.ConnectionError, requests.Timeout,
+                requests.exceptions.ChunkedEncodingError, requests.exceptions.ContentDecodingError)
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+DEVICE_GROUP_XPATH = "/config/devices/entry/device-group"
+SHARED_XPATH = "/config/shared"
+READONLY_DG_XPATH = "/config/readonly/devices/entry[@name='localhost.localdomain']/device-group"
+
+
+def dg_xpath(dg, suffix=''):
+    # XPath of a device group entry, optionally followed by a sub-path (e.g. '/tag')
+    return f"{DEVICE_GROUP_XPATH}/entry[@name='{dg}']{suffix}"
+
+
+def scope_xpath(scope, suffix=''):
+    # Same as dg_xpath, but 'shared' maps to /config/shared
+    if scope == 'shared':
+        return f"{SHARED_XPATH}{suffix}"
+    return dg_xpath(scope, suffix)
+
+
+def get_dg_parents(client):
+    """
+    Map each device group to its parent device group (None = directly below shared),
+    read from the readonly section of the config. Returns {} if it cannot be read.
+    """
+    try:
+        root = client.config_get_element(READONLY_DG_XPATH)
+    except Exception as e:
+        print(f"Could not read device group hierarchy: {e}")
+        return {}
+    return {
+        entry.attrib.get('name'): (entry.findtext('parent-dg') or None)
+        for entry in root.findall('.//device-group/entry')
+    }
+
+
+def scope_chain(dg, parents):
+    # Lookup order for objects referenced in dg: dg, its parents (nearest first), then shared
+    chain = []
+    scope = dg
+    while scope and scope != 'shared' and scope not in chain:
+        chain.append(scope)
+        scope = parents.get(scope)
+    chain.append('shared')
+    return chain
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: on average `rate` requests per second, bursts up to `burst`.
+    A rate of None or 0 disables limiting.
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveLimiter:
+    """
+    Caps in-flight requests with an additive-increase / multiplicative-decrease limit.
+    Successful responses raise the limit by one per window (up to max_limit); failed
+    requests, 429/5xx responses and a sustained latency rise halve it (down to 1).
+    Latency is compared as a fast moving average against a slowly decaying baseline,
+    so one large config get among small op calls is not taken for congestion.
+    """
+    FAST_WEIGHT = 0.3
+    SLOW_WEIGHT = 0.05
+    MIN_SAMPLES = 5
+
+    def __init__(self, max_limit, slow_factor=3.0):
+        self.max_limit = max(1, max_limit)
+        self.limit = float(self.max_limit)
+        self.slow_factor = slow_factor
+        self.in_flight = 0
+        self.baseline = None
+        self.recent = None
+        self.samples = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                self.cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency=None, ok=True):
+        with self.cond:
+            self.in_flight -= 1
+            congested = not ok
+            if ok and latency is not None:
+                congested = self.observe(latency)
+            if congested:
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                # +1 per full window of successful requests
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self.cond.notify_all()
+
+    def observe(self, latency):
+        # Update both averages; True if latency has been trending well above the baseline
+        if self.baseline is None:
+            self.baseline = self.recent = latency
+        else:
+            self.baseline += self.SLOW_WEIGHT * (latency - self.baseline)
+            self.recent += self.FAST_WEIGHT * (latency - self.recent)
+        self.samples += 1
+        if self.samples < self.MIN_SAMPLES or self.recent <= self.slow_factor * max(self.baseline, 0.05):
+            return False
+        # Back off once, then measure the new level from scratch
+        self.recent = self.baseline
+        self.samples = 0
+        return True
+
+
+class PanoramaClient:
+    """
+    Shared client for the Panorama XML API.
+    Keeps one keep-alive session with a connection pool sized to the worker count,
+    so repeated calls reuse TLS connections instead of opening a new one per request.
+    Every request goes through a token bucket (rate requests/sec) and an adaptive
+    concurrency limit, and is retried with jittered exponential backoff on connection
+    errors, timeouts and 429/5xx responses.
+    Setting deadline (a time.monotonic() value) bounds all calls of the client: connect
+    and read timeouts shrink to the time left, and requests.Timeout is raised once it passes.
+    """
+    def __init__(self, panorama_host: str, api_key: str = None,
+                 max_workers: int = DEFAULT_WORKERS, timeout: int = DEFAULT_TIMEOUT,
+                 retries: int = DEFAULT_RETRIES, rate: float = DEFAULT_RATE):
+        self.panorama_host = panorama_host
+        self.api_key = api_key
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+        self.retries = max(0, retries)
+        self.deadline = None
+        self.bucket = TokenBucket(rate, burst=self.max_workers)
+        self.limiter = AdaptiveLimiter(self.max_workers)
+        # Hosts may carry an explicit scheme/port (e.g. a local test server)
+        if '://' in panorama_host:
+            self.base_url = f"{panorama_host.rstrip('/')}/api/"
+        else:
+            self.base_url = f"https://{panorama_host}/api/"
+        self.session = requests.Session()
+        self.session.verify = False
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get(self, params: dict, **kwargs) -> requests.Response:
+        if self.api_key and 'key' not in params:
+            params = dict(params, key=self.api_key)
+        kwargs.setdefault('timeout', self.timeout)
+        # Passed per request: a session-level verify=False is overridden by REQUESTS_CA_BUNDLE
+        kwargs.setdefault('verify', False)
+        for attempt in range(self.retries + 1):
+            if self.deadline is not None:
+                kwargs['timeout'] = min(self.timeout, self.time_left())
+            self.bucket.acquire()
+            self.limiter.acquire()
+            start = time.monotonic()
+            r = error = latency = None
+            try:
+                r = self.session.get(self.base_url, params=params, **kwargs)
+                # Streamed bodies are not read yet; count their advertised length instead
+                size = int(r.headers.get('Content-Length') or 0) if kwargs.get('stream') else len(r.content)
+                latency = time.monotonic() - start
+            except RETRY_ERRORS as e:
+                error = e
+            finally:
+                # The slot goes back whatever happened; throttling, 5xx and failed reads back off
+                self.limiter.release(latency, ok=latency is not None and r.status_code not in RETRY_STATUSES)
+            if error is not None:
+                metrics.record_request(time.monotonic() - start, 0, ok=False)
+                if attempt == self.retries:
+                    raise error
+                delay = self.backoff(attempt)
+                print(f"Request failed ({type(error).__name__}), retrying in {delay:.1f}s...")
+                time.sleep(self.capped(delay))
+                continue
+            ok = r.status_code not in RETRY_STATUSES
+            metrics.record_request(latency, size, ok=ok)
+            if ok or attempt == self.retries:
+                return r
+            delay = self.backoff(attempt, r.headers.get('Retry-After'))
+            print(f"Panorama returned HTTP {r.status_code}, retrying in {delay:.1f}s...")
+            r.close()
+            time.sleep(self.capped(delay))
+
+    def time_left(self):
+        left = self.deadline - time.monotonic()
+        if left <= 0:
+            raise requests.Timeout(f"Deadline for {self.panorama_host} exceeded")
+        return left
+
+    def capped(self, delay):
+        # Never sleep past the deadline; the next attempt then raises Timeout
+        return delay if self.deadline is None else min(delay, max(0.0, self.deadline - time.monotonic()))
+
+    def backoff(self, attempt, retry_after=None):
+        # Full jitter: random delay up to base * 2^attempt, or the server's Retry-After if longer
+        delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(BACKOFF_CAP, float(retry_after)))
+        return delay
+
+    def login(self, username: str, password: str):
+        try:
+            r = self.get({'type': 'keygen', 'user': username, 'password': password})
+            if '<key>' not in r.text:
+                return None
+            self.api_key = r.text.split('<key>')[1].split('</key>')[0]
+            return self.api_key
+        except Exception as e:
+            print(f"Error connecting to Panorama: {e}")
+            return None
+
+    def config_get(self, xpath: str, action: str = 'get') -> str:
+        # action='get' reads the candidate config, action='show' the running config
+        return self.get({'type': 'config', 'action': action, 'xpath': xpath}).text
+
+    def config_get_element(self, xpath: str, action: str = 'get') -> ET.Element:
+        text = self.config_get(xpath, action)
+        with metrics.phase('parse'):
+            return ET.fromstring(text)
+
+    def config_get_stream(self, xpath: str, action: str = 'get') -> requests.Response:
+        """
+        Same as config_get, but the body is left unread.
+        Parse r.raw incrementally and close the response when done.
+        """
+        r = self.get({'type': 'config', 'action': action, 'xpath': xpath}, stream=True)
+        r.raw.decode_content = True
+        return r
+
+    def op(self, cmd: str) -> str:
+        return self.get({'type': 'op', 'cmd': cmd}).text
+
+    def get_device_groups(self):
+        # Ask for the names only; the full device-group subtree can be hundreds of MB
+        root = self.config_get_element(f"{DEVICE_GROUP_XPATH}/entry/@name")
+        dgs = [entry.attrib.get('name') for entry in root.findall('result/entry')]
+        return [dg for dg in dgs if dg]
+
+    def map_ordered(self, func, items):
+        """
+        Run func over items on a bounded thread pool.
+        Results are yielded in the order of items, so callers can write output
+        in a stable order while later items are still being fetched.
+        """
+        items = list(items)
+        if self.max_workers == 1 or len(items) <= 1:
+            for item in items:
+                yield func(item)
+            return
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for result in pool.map(func, items):
+                yield result
+
+    def close(self):
+        self.session.close()
+
+
+def add_client_arguments(parser):
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help=f'Maximum API requests per second, 0 for no limit (default: {DEFAULT_RATE:g})')
+
+
+def get_api_key(panorama_host, username, password):
+    return PanoramaClient(panorama_host, max_workers=1).login(username, password)
+
+
+def prompt_login(client: PanoramaClient, max_attempts: int = 3):
+    # Credential check loop shared by all scripts; exits after max_attempts failures
+    print("You will be asked for your username and password.")
+    for attempt in range(1, max_attempts + 1):
+        username = input("Enter username: ").strip()
+        print("Please enter your password. (Input will be hidden)")
+        password = getpass.getpass("Enter password: ")
+        api_key = client.login(username, password)
+        if api_key:
+            return api_key
+        print(f"Login failed. Check credentials. Attempt {attempt} of {max_attempts}.")
+    print("Too many failed login attempts. Exiting.")
+    sys.exit(1)
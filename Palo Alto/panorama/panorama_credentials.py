@@ -0,0 +1,133 @@
+import os
+import sys
+import json
+import time
+
+# Environment variables read by the non-interactive entry point
+ENV_HOST = 'PANORAMA_HOST'
+ENV_API_KEY = 'PANORAMA_API_KEY'
+ENV_USERNAME = 'PANORAMA_USERNAME'
+ENV_PASSWORD = 'PANORAMA_PASSWORD'
+# Passwords are looked up in the system keyring under "panorama:<host>" / username
+KEYRING_SERVICE = 'panorama'
+DEFAULT_KEY_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'panorama_cli', 'api_keys.json')
+DEFAULT_KEY_TTL_HOURS = 8.0
+
+
+class InvalidApiKey(Exception):
+    pass
+
+
+class ApiKeyCache:
+    """
+    API keys per host in a small JSON file (mode 600), reused for ttl seconds so
+    repeated runs skip the keygen round trip. A ttl of 0 disables the cache.
+    """
+    def __init__(self, path=DEFAULT_KEY_CACHE, ttl=DEFAULT_KEY_TTL_HOURS * 3600):
+        self.path = path
+        self.ttl = ttl
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, keys):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(keys, f)
+        os.replace(tmp_path, self.path)
+
+    def get(self, host):
+        if self.ttl <= 0:
+            return None
+        entry = self._load().get(host)
+        if not entry or time.time() - entry.get('created', 0) > self.ttl:
+            return None
+        return entry.get('key')
+
+    def put(self, host, key):
+        if self.ttl <= 0:
+            return
+        keys = self._load()
+        keys[host] = {'key': key, 'created': time.time()}
+        self._save(keys)
+
+    def drop(self, host):
+        keys = self._load()
+        if keys.pop(host, None) is not None:
+            self._save(keys)
+
+
+def keyring_password(host, username):
+    # Optional dependency: without keyring installed, passwords only come from the environment
+    try:
+        import keyring
+    except ImportError:
+        return None
+    try:
+        return keyring.get_password(f"{KEYRING_SERVICE}:{host}", username)
+    except Exception as e:
+        print(f"Keyring lookup failed: {e}")
+        return None
+
+
+def check_auth(r):
+    # Panorama answers a revoked or expired key with HTTP 403
+    if r.status_code == 403:
+        raise InvalidApiKey('Panorama rejected the API key')
+    return r
+
+
+def login(client, username=None, cache=None):
+    """
+    Get a new API key with keygen. The password comes from the environment or the keyring;
+    on a terminal without stored credentials, fall back to the interactive prompt.
+    """
+    from panorama_client import prompt_login
+    username = username or os.environ.get(ENV_USERNAME)
+    password = os.environ.get(ENV_PASSWORD) or (keyring_password(client.panorama_host, username) if username else None)
+    if username and password:
+        if not client.login(username, password):
+            print(f"Login failed for {username} on {client.panorama_host}.")
+            sys.exit(1)
+    elif sys.stdin.isatty():
+        prompt_login(client)
+    else:
+        print(f"No credentials: set {ENV_API_KEY}, or {ENV_USERNAME} and {ENV_PASSWORD} "
+              f"(or store the password in the keyring under '{KEYRING_SERVICE}:{client.panorama_host}').")
+        sys.exit(2)
+    if cache:
+        cache.put(client.panorama_host, client.api_key)
+    return client.api_key
+
+
+def authenticated_client(host, username=None, cache=None, **client_args):
+    """
+    PanoramaClient with an API key from the environment, the key cache, or a fresh login
+    (in that order). Returns (client, from_cache); see with_relogin for stale cached keys.
+    """
+    from panorama_client import PanoramaClient
+    client = PanoramaClient(host, **client_args)
+    client.api_key = os.environ.get(ENV_API_KEY) or (cache.get(host) if cache else None)
+    if client.api_key:
+        return client, not os.environ.get(ENV_API_KEY)
+    login(client, username, cache)
+    return client, False
+
+
+def with_relogin(client, from_cache, func, username=None, cache=None):
+    # Run func(client); if a cached key was rejected (InvalidApiKey), log in again and retry once
+    try:
+        return func(client)
+    except InvalidApiKey:
+        if not from_cache:
+            raise
+        print("Cached API key was rejected, logging in again.")
+        cache.drop(client.panorama_host)
+        login(client, username, cache)
+        return func(client)
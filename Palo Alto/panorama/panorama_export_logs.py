@@ -0,0 +1,292 @@
+import sys
+import time
+import argparse
+import threading
+from datetime import datetime, timedelta
+import xml.etree.ElementTree as ET
+
+from panorama_client import PanoramaClient, add_client_arguments, prompt_login
+from panorama_metrics import add_metrics_arguments, metrics, metrics_session
+from panorama_output import add_format_arguments, OpenSink, output_filenames
+
+# Columns written per log type (any other field can be picked with --fields)
+LOG_FIELDNAMES = {
+    'traffic': ['receive_time', 'serial', 'device_name', 'vsys', 'from', 'to', 'src', 'dst', 'sport', 'dport',
+                'proto', 'app', 'rule', 'action', 'bytes', 'packets', 'elapsed', 'session_end_reason'],
+    'threat': ['receive_time', 'serial', 'device_name', 'vsys', 'from', 'to', 'src', 'dst', 'dport', 'app',
+               'rule', 'action', 'subtype', 'threatid', 'severity', 'direction', 'misc'],
+    'url': ['receive_time', 'serial', 'device_name', 'src', 'dst', 'app', 'rule', 'action', 'category', 'misc'],
+    'system': ['receive_time', 'serial', 'device_name', 'subtype', 'eventid', 'severity', 'opaque'],
+    'config': ['receive_time', 'serial', 'device_name', 'admin', 'client', 'cmd', 'path', 'result'],
+}
+# Largest page the log API returns per job
+MAX_PAGE_SIZE = 5000
+DEFAULT_SLICES = 8
+DEFAULT_MAX_WAIT = 600
+POLL_FIRST = 0.25
+POLL_CAP = 5.0
+# Rows handed to the shared writer at a time
+WRITE_BATCH_ROWS = 500
+TIME_FORMAT = '%Y/%m/%d %H:%M:%S'
+
+
+def prompt_with_default(prompt, default):
+    value = input(f"{prompt} (default: {default}): ").strip()
+    return value if value else default
+
+
+def parse_time(value):
+    for fmt in (TIME_FORMAT, '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ValueError(f"Unrecognized time: {value} (use YYYY-MM-DD HH:MM:SS)")
+
+
+def time_slices(start, end, slices):
+    """
+    Split [start, end] into up to `slices` non-overlapping windows of whole seconds,
+    as (first, last) pairs. Log queries use geq/leq, so each window ends one second
+    before the next one starts.
+    """
+    start = start.replace(microsecond=0)
+    total = int((end - start).total_seconds()) + 1
+    slices = max(1, min(slices, total))
+    bounds = [start + timedelta(seconds=total * i // slices) for i in range(slices + 1)]
+    return [(first, last - timedelta(seconds=1)) for first, last in zip(bounds, bounds[1:])]
+
+
+def slice_query(query, first, last):
+    window = f"(receive_time geq '{first.strftime(TIME_FORMAT)}') and (receive_time leq '{last.strftime(TIME_FORMAT)}')"
+    return f"({query}) and {window}" if query else window
+
+
+def api_error(root):
+    msg = ' '.join(t.strip() for t in root.itertext() if t.strip())
+    return msg or 'unknown error'
+
+
+def submit_job(client, log_type, query, page_size, skip):
+    r = client.get({'type': 'log', 'log-type': log_type, 'query': query,
+                    'nlogs': str(page_size), 'skip': str(skip), 'dir': 'forward'})
+    root = ET.fromstring(r.content)
+    job = root.findtext('result/job')
+    if root.attrib.get('status') != 'success' or not job:
+        raise RuntimeError(f"Log query rejected: {api_error(root)}")
+    return job.strip()
+
+
+def iter_log_response(fileobj):
+    """
+    Incrementally parse a log job poll response: yields the job status text, then each
+    <logs>/<entry> as soon as its closing tag is read (detached afterwards, so memory
+    stays flat however large the page is).
+    """
+    stack = []
+    for event, elem in ET.iterparse(fileobj, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            continue
+        stack.pop()
+        if elem.tag == 'status' and stack and stack[-1].tag == 'job':
+            yield elem.text
+        elif elem.tag == 'entry' and stack and stack[-1].tag == 'logs':
+            yield elem
+            stack[-1].remove(elem)
+        elif not stack and elem.attrib.get('status') != 'success':
+            raise RuntimeError(api_error(elem))
+
+
+def job_logs(client, job_id, max_wait=DEFAULT_MAX_WAIT):
+    """
+    Poll a log job with a growing interval until it is FIN, then yield its log entries
+    straight from the response stream.
+    """
+    deadline = time.monotonic() + max_wait
+    delay = POLL_FIRST
+    while True:
+        r = client.get({'type': 'log', 'action': 'get', 'job-id': job_id}, stream=True)
+        r.raw.decode_content = True
+        try:
+            parts = iter_log_response(r.raw)
+            try:
+                status = next(parts, None)
+            except (RuntimeError, ET.ParseError) as e:
+                raise RuntimeError(f"Log job {job_id} failed: {e}")
+            if status == 'FIN':
+                yield from parts
+                return
+        finally:
+            r.close()
+        if time.monotonic() + delay > deadline:
+            raise TimeoutError(f"Log job {job_id} did not finish within {max_wait}s")
+        time.sleep(delay)
+        delay = min(POLL_CAP, delay * 1.5)
+
+
+def finish_job(client, job_id):
+    # Free the job on Panorama; best effort
+    try:
+        client.get({'type': 'log', 'action': 'finish', 'job-id': job_id}).close()
+    except Exception:
+        pass
+
+
+class LockedWriter:
+    # Slices run on worker threads; each batch of rows is written in one piece
+    def __init__(self, writer):
+        self.writer = writer
+        self.lock = threading.Lock()
+
+    def writerows(self, rows):
+        with self.lock:
+            self.writer.writerows(rows)
+
+
+class SliceIncomplete(Exception):
+    # A slice failed part way; rows holds the logs of that slice already written
+    def __init__(self, rows, error):
+        super().__init__(str(error))
+        self.rows = rows
+
+
+def export_slice(client, log_type, query, fieldnames, writer, page_size, max_wait):
+    """
+    Page through one time slice: every page is its own log job (skip/nlogs), and its
+    entries are written while the response is still being read. Returns the number of logs;
+    on failure raises SliceIncomplete with the number already written.
+    """
+    count = 0
+    skip = 0
+    while True:
+        try:
+            job_id = submit_job(client, log_type, query, page_size, skip)
+        except Exception as e:
+            raise SliceIncomplete(count, e) from e
+        rows = []
+        try:
+            for entry in job_logs(client, job_id, max_wait):
+                values = {child.tag: child.text for child in entry}
+                rows.append({f: values.get(f) or '' for f in fieldnames})
+                if len(rows) >= WRITE_BATCH_ROWS:
+                    writer.writerows(rows)
+                    count += len(rows)
+                    rows = []
+        except Exception as e:
+            finish_job(client, job_id)
+            raise SliceIncomplete(count, e) from e
+        writer.writerows(rows)
+        count += len(rows)
+        if count - skip < page_size:
+            return count
+        skip += page_size
+
+
+def export_logs(client, log_type, query, start, end, filename, slices=DEFAULT_SLICES,
+                page_size=MAX_PAGE_SIZE, max_wait=DEFAULT_MAX_WAIT, fieldnames=None):
+    """
+    Export logs received between start and end (inclusive). The range is split into time
+    slices that are queried concurrently on the client's thread pool; rows are streamed
+    to the output as each job's response is parsed, so memory does not grow with the logs.
+    Rows from different slices interleave in the output. Returns the number of logs written
+    and the slices that failed part way, as (first, last, logs written) tuples.
+    """
+    fieldnames = fieldnames or LOG_FIELDNAMES[log_type]
+    windows = time_slices(start, end, slices)
+    total = 0
+    failed = []
+    with OpenSink(filename, fieldnames) as sink:
+        writer = metrics.wrap_writer(sink)
+        writer.writeheader()
+        writer = LockedWriter(writer)
+
+        def run(window):
+            first, last = window
+            try:
+                count = export_slice(client, log_type, slice_query(query, first, last), fieldnames,
+                                     writer, page_size, max_wait)
+                print(f"  {first} - {last}: {count} logs")
+                return count, None
+            except SliceIncomplete as e:
+                print(f"  {first} - {last}: failed after {e.rows} logs ({e}), logs of this slice are incomplete")
+                return e.rows, (first, last, e.rows)
+
+        with metrics.phase('logs'):
+            for count, failure in client.map_ordered(run, windows):
+                total += count
+                if failure:
+                    failed.append(failure)
+    metrics.count('failed_slices', len(failed))
+    return total, failed
+
+
+def main(client, args):
+    now = datetime.now().replace(microsecond=0)
+    log_type = args.log_type or prompt_with_default(f"Log type ({'/'.join(LOG_FIELDNAMES)})", 'traffic')
+    if log_type not in LOG_FIELDNAMES:
+        print(f"Unknown log type: {log_type}")
+        sys.exit(1)
+    try:
+        start = parse_time(args.start) if args.start else now - timedelta(hours=args.hours)
+        end = parse_time(args.end) if args.end else now
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    if end < start:
+        print("End time is before start time.")
+        sys.exit(1)
+
+    fieldnames = [f.strip() for f in args.fields.split(',') if f.strip()] if args.fields else None
+    filenames = output_filenames(f"panorama_export_logs_{log_type}_{now.strftime('%Y%m%d_%H%M%S')}",
+                                 args.formats or ['csv'])
+    print(f"\nExporting {log_type} logs from {start} to {end} in {args.slices} slices...")
+    total, failed = export_logs(client, log_type, args.query or '', start, end, filenames, args.slices,
+                                args.page_size, args.max_wait, fieldnames)
+    if failed:
+        print(f"\nExport INCOMPLETE. {total} logs saved to {', '.join(filenames)}; "
+              f"{len(failed)} slices failed:")
+        for first, last, count in failed:
+            print(f"  {first} - {last}: only {count} logs exported")
+        return False
+    print(f"\nExport complete. {total} logs saved to {', '.join(filenames)}")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export Panorama traffic, threat and other logs to CSV.')
+    add_client_arguments(parser)
+    add_metrics_arguments(parser)
+    add_format_arguments(parser)
+    parser.add_argument('--log-type', choices=sorted(LOG_FIELDNAMES))
+    parser.add_argument('--query', help="Log filter, e.g. \"(addr.src in 10.0.0.0/8) and (action eq deny)\"")
+    parser.add_argument('--start', help='Start time (YYYY-MM-DD HH:MM:SS, default: --hours before now)')
+    parser.add_argument('--end', help='End time (default: now)')
+    parser.add_argument('--hours', type=float, default=1.0, help='Time range when --start is not given (default: 1)')
+    parser.add_argument('--slices', type=int, default=DEFAULT_SLICES,
+                        help=f'Time slices queried in parallel (default: {DEFAULT_SLICES})')
+    parser.add_argument('--page-size', type=int, default=MAX_PAGE_SIZE,
+                        help=f'Logs per request, at most {MAX_PAGE_SIZE} (default: {MAX_PAGE_SIZE})')
+    parser.add_argument('--max-wait', type=int, default=DEFAULT_MAX_WAIT,
+                        help=f'Seconds to wait for one log job (default: {DEFAULT_MAX_WAIT})')
+    parser.add_argument('--fields', help='Comma-separated log fields to export instead of the defaults')
+    args = parser.parse_args()
+    args.slices = max(1, args.slices)
+    args.page_size = max(1, min(MAX_PAGE_SIZE, args.page_size))
+
+    print("=== Palo Alto Panorama Log Exporter ===\n")
+    print("Please enter your Panorama credentials.")
+    panorama_host = input("Enter Panorama IP: ").strip()
+    client = PanoramaClient(panorama_host, max_workers=args.slices, rate=args.rate)
+    prompt_login(client)
+
+    # Exit status 1 if any run left a slice incomplete
+    complete = True
+    while True:
+        with metrics_session(args, 'panorama_export_logs'):
+            complete = main(client, args) and complete
+        again = input("\nDo you want to run the script again (log export)? (y/n): ").strip().lower()
+        if again != 'y':
+            print("Exiting.")
+            break
+    sys.exit(0 if complete else 1)
@@ -1,33 +1,269 @@
-import requests
 import sys
+import argparse
 from datetime import datetime
-import getpass
-import csv
+import xml.etree.ElementTree as ET
 
- 
-# Disable SSL warnings
-try:
-    import urllib3
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-except ImportError:
-    pass
+from panorama_client import add_client_arguments, dg_xpath
+from panorama_incremental import incremental_export
+from panorama_snapshot_cache import add_cache_arguments, open_config_source
+from panorama_metrics import add_metrics_arguments, metrics, metrics_session
+from panorama_output import add_format_arguments, OpenSink, output_filenames
+from panorama_objects import load_object_resolver
+from panorama_records import RecordParser
+from panorama_hit_counts import HIT_COUNT_FIELDNAMES, fetch_hit_counts, timestamp
+
+# Exported rulebases, in evaluation order
+RULEBASES = [
+    'pre-rulebase/security', 'post-rulebase/security', 'pre-rulebase/nat', 'post-rulebase/nat'
+]
+FIELDNAMES = [
+    'device_group', 'rulebase', 'rule_name', 'source', 'destination', 'application', 'service', 'action', 'enabled'
+]
+# Extra columns written with --resolve
+RESOLVED_FIELDNAMES = ['source_resolved', 'destination_resolved', 'service_resolved']
+DEFAULT_CHUNK_SIZE = 200
+# Keep name-list xpaths well below common URL length limits
+MAX_XPATH_CHARS = 4000
+# For rules turned into a row right away: interning would only cost time
+ROW_PARSER = RecordParser(intern=False)
 
 def prompt_with_default(prompt, default):
     value = input(f"{prompt} (default: {default}): ").strip()
     return value if value else default
 
-def get_api_key(panorama_host, username, password):
-    key_url = f"https://{panorama_host}/api/?type=keygen&user={username}&password={password}"
+def rules_xpath(dg, rulebase, suffix=''):
+    return dg_xpath(dg, f'/{rulebase}/rules{suffix}')
+
+def record_to_row(dg, rule):
+    # rule: panorama_records.RuleRecord
+    return {
+        'device_group': dg,
+        'rulebase': rule.rulebase,
+        'rule_name': rule.name,
+        'source': ','.join(rule.source),
+        'destination': ','.join(rule.destination),
+        'application': ','.join(rule.application),
+        'service': ','.join(rule.service),
+        'action': rule.action,
+        'enabled': 'no' if rule.disabled else 'yes'
+    }
+
+def rule_to_row(dg, rule, rulebase='pre-rulebase/security'):
+    return record_to_row(dg, ROW_PARSER.rule(rule, rulebase))
+
+def parse_policies(dg, root):
+    # root holds a whole device group (e.g. a bulk config subtree); rows follow RULEBASES order
+    rows = []
+    for rulebase in RULEBASES:
+        for rules in root.findall(f'.//{rulebase}/rules'):
+            rows.extend(rule_to_row(dg, rule, rulebase) for rule in rules.findall('entry'))
+    return rows
+
+def fetch_policies(client, dg):
+    # Runs on a worker thread; returns the RuleRecords of one device group (or None on failure)
+    print(f"Exporting policies for device group: {dg}")
+    parser = RecordParser()
     try:
-        r = requests.get(key_url, verify=False, timeout=10)
-        if '<key>' not in r.text:
-            return None
-        return r.text.split('<key>')[1].split('</key>')[0]
+        rules = []
+        for rulebase in RULEBASES:
+            root = client.config_get_element(rules_xpath(dg, rulebase))
+            rules.extend(parser.rule(rule, rulebase) for rule in root.findall('.//rules/entry'))
+        return rules
     except Exception as e:
-        print(f"Error connecting to Panorama: {e}")
+        print(f"Failed to parse policies for {dg}: {e}")
         return None
 
-def main(panorama_host, api_key):
+def xpath_literal(value):
+    # XPath 1.0 has no escaping: quote with whichever quote character the value doesn't contain
+    return f'"{value}"' if "'" in value else f"'{value}'"
+
+def name_chunks(names, chunk_size):
+    # Split rule names into lists of at most chunk_size whose name-list xpath stays short enough
+    chunk, length = [], 0
+    for name in names:
+        cost = len(name) + 14
+        if chunk and (len(chunk) >= chunk_size or length + cost > MAX_XPATH_CHARS):
+            yield chunk
+            chunk, length = [], 0
+        chunk.append(name)
+        length += cost
+    if chunk:
+        yield chunk
+
+def fetch_rule_names(client, dg, rulebase):
+    root = client.config_get_element(rules_xpath(dg, rulebase, '/entry/@name'))
+    return [entry.attrib['name'] for entry in root.findall('result/entry') if 'name' in entry.attrib]
+
+def fetch_rule_chunk(client, dg, rulebase, names):
+    condition = ' or '.join(f"@name={xpath_literal(name)}" for name in names)
+    root = client.config_get_element(rules_xpath(dg, rulebase, f'/entry[{condition}]'))
+    # Only top-level entries: rules can contain nested <entry> elements (e.g. target devices)
+    return {rule.attrib.get('name', ''): rule for rule in root.findall('result/entry')}
+
+def fetch_policies_chunked(client, dg, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Fetch large rulebases without one huge config get: list the rule names first,
+    then pull the rules in name-list windows on the client's thread pool and
+    reassemble them in rulebase order. Requires a live PanoramaClient.
+    Returns RuleRecords.
+    """
+    print(f"Exporting policies for device group (chunked): {dg}")
+    parser = RecordParser()
+    records = []
+    try:
+        for rulebase in RULEBASES:
+            names = fetch_rule_names(client, dg, rulebase)
+            if not names:
+                continue
+            chunks = list(name_chunks(names, chunk_size))
+            rules = {}
+            for chunk_rules in client.map_ordered(lambda chunk: fetch_rule_chunk(client, dg, rulebase, chunk), chunks):
+                rules.update(chunk_rules)
+            missing = [name for name in names if name not in rules]
+            if missing:
+                print(f"  {len(missing)} rules in {dg} {rulebase} disappeared while exporting")
+            records.extend(parser.rule(rules[name], rulebase) for name in names if name in rules)
+        return records
+    except Exception as e:
+        print(f"Failed to parse policies for {dg}: {e}")
+        return None
+
+def iter_entries(fileobj, container='rules'):
+    """
+    Incrementally parse an XML API response and yield each <container>/<entry>
+    as soon as its closing tag is read. Yielded entries are detached afterwards,
+    so memory stays flat regardless of response size.
+    """
+    stack = []
+    for event, elem in ET.iterparse(fileobj, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            continue
+        stack.pop()
+        if elem.tag == 'entry' and stack and stack[-1].tag == container:
+            yield elem
+            stack[-1].remove(elem)
+
+def stream_policies(client, dg, writer):
+    # Writes each rule as soon as it is parsed; returns the number of rules written
+    print(f"Streaming policies for device group: {dg}")
+    count = 0
+    for rulebase in RULEBASES:
+        r = client.config_get_stream(rules_xpath(dg, rulebase))
+        try:
+            for rule in iter_entries(r.raw):
+                writer.writerow(rule_to_row(dg, rule, rulebase))
+                count += 1
+        except Exception as e:
+            print(f"Failed to parse policies for {dg} {rulebase}: {e}")
+        finally:
+            r.close()
+    return count
+
+class ResolvingWriter:
+    # Adds the *_resolved columns to each row on its way to the sink
+    def __init__(self, writer, resolver):
+        self.writer = writer
+        self.resolver = resolver
+
+    def resolve(self, row):
+        for column in ('source', 'destination', 'service'):
+            names = [n for n in row[column].split(',') if n]
+            kind = 'service' if column == 'service' else 'address'
+            row[f'{column}_resolved'] = ','.join(self.resolver.resolve(row['device_group'], kind, names))
+        return row
+
+    def writeheader(self):
+        self.writer.writeheader()
+
+    def writerow(self, row):
+        self.writer.writerow(self.resolve(row))
+
+    def writerows(self, rows):
+        self.writer.writerows([self.resolve(row) for row in rows])
+
+class HitCountWriter:
+    # Joins hit counts into each row by (device group, rulebase, rule name); rules without data stay blank
+    def __init__(self, writer, counts):
+        self.writer = writer
+        self.counts = counts
+
+    def enrich(self, row):
+        hits, last = self.counts.get((row['device_group'], row['rulebase'], row['rule_name']), ('', 0))
+        row['hit_count'] = hits
+        row['last_hit'] = timestamp(last)
+        return row
+
+    def writeheader(self):
+        self.writer.writeheader()
+
+    def writerow(self, row):
+        self.writer.writerow(self.enrich(row))
+
+    def writerows(self, rows):
+        self.writer.writerows([self.enrich(row) for row in rows])
+
+def load_hit_counts(client, dgs):
+    # Rule names per (device group, rulebase) first, then the batched hit-count queries
+    targets = [(dg, rulebase) for dg in dgs for rulebase in RULEBASES]
+
+    def names(target):
+        try:
+            return fetch_rule_names(client, *target)
+        except Exception as e:
+            print(f"Failed to list rules for {' '.join(target)}: {e}")
+            return []
+
+    rule_names = dict(zip(targets, client.map_ordered(names, targets)))
+    return fetch_hit_counts(client, {target: names for target, names in rule_names.items() if names})
+
+def export_policies(client, dgs, filename, stream=False, chunk_size=None, resolve=False, hit_counts=False):
+    """
+    client can be a PanoramaClient or any config source with the same interface (e.g. LocalConfig).
+    filename can be a list; each file gets the format of its extension (see panorama_output).
+    With resolve, address/service members are also written expanded to prefixes and ports
+    (see panorama_objects.ObjectResolver). hit_counts adds hit_count/last_hit columns and
+    needs a live PanoramaClient.
+    """
+    fieldnames = list(FIELDNAMES)
+    resolver = counts = None
+    if resolve:
+        with metrics.phase('load_objects'):
+            resolver = load_object_resolver(client, dgs)
+        fieldnames += RESOLVED_FIELDNAMES
+    if hit_counts:
+        if hasattr(client, 'op'):
+            counts = load_hit_counts(client, dgs)
+            fieldnames += HIT_COUNT_FIELDNAMES
+        else:
+            print("Hit counts need a live Panorama connection; skipping them for this config source.")
+    with OpenSink(filename, fieldnames) as sink:
+        writer = metrics.wrap_writer(sink)
+        if resolver:
+            writer = ResolvingWriter(writer, resolver)
+        if counts is not None:
+            writer = HitCountWriter(writer, counts)
+        writer.writeheader()
+        # Rules arrive as records; rows only exist while being written
+        if chunk_size:
+            # One device group at a time, its rule windows fetched in parallel
+            for dg in dgs:
+                rules = fetch_policies_chunked(client, dg, chunk_size)
+                if rules:
+                    writer.writerows(record_to_row(dg, rule) for rule in rules)
+        elif stream:
+            # One device group at a time, each rule written as soon as its <entry> closes
+            for dg in dgs:
+                stream_policies(client, dg, writer)
+        else:
+            # Device groups are fetched concurrently; rows are written in selection order
+            for dg, rules in zip(dgs, client.map_ordered(lambda dg: fetch_policies(client, dg), dgs)):
+                if rules:
+                    writer.writerows(record_to_row(dg, rule) for rule in rules)
+    if resolver:
+        print(f"Resolved {resolver.misses} objects ({resolver.hits} lookups answered from cache)")
+
+def main(client, incremental=None, chunk_size=None, formats=None, resolve=False, hit_counts=False):
     # Hardcoded device group list (fill this out with your device groups)
     # Device group is case-sensitive.
     device_groups = [
@@ -60,70 +296,55 @@ def main(panorama_host, api_key):
     else:
         dgs = [device_groups[i-1] for i in selected_indices]
 
-    # Prepare CSV file
+    if incremental and (resolve or hit_counts):
+        # Object changes outside the device group subtree (or new hits) would not trigger a re-export
+        print("--resolve and --hit-counts cannot be combined with --incremental.")
+        sys.exit(1)
+
+    if incremental:
+        incremental_export(client, dgs, incremental, FIELDNAMES, [f'/{rulebase}' for rulebase in RULEBASES],
+                           parse_policies)
+        print(f"\nExport complete. Policies saved to {incremental}")
+        return
+
+    stream = not chunk_size and prompt_with_default(
+        "Stream rules straight to the output (for very large rulebases)? (y/n)", "n"
+    ).lower() == 'y'
+
+    # Prepare output files
     now = datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f"panorama_export_policies_{now}.csv"
-    fieldnames = [
-        'device_group', 'rule_name', 'source', 'destination', 'application', 'service', 'action', 'enabled'
-    ]
-    with open(filename, 'w', encoding='utf-8', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        for dg in dgs:
-            print(f"Exporting policies for device group: {dg}")
-            xpath = f"/config/devices/entry/device-group/entry[@name='{dg}']/pre-rulebase/security/rules"
-            url = f"https://{panorama_host}/api/?type=config&action=get&xpath={xpath}&key={api_key}"
-            r = requests.get(url, verify=False)
-            import xml.etree.ElementTree as ET
-            try:
-                root = ET.fromstring(r.text)
-                rules = root.findall('.//entry')
-                for rule in rules:
-                    disabled_elem = rule.find('disabled')
-                    enabled = not (disabled_elem is not None and (disabled_elem.text or '').strip().lower() == 'yes')
-                    rule_name = rule.attrib.get('name', '')
-                    source = ','.join([src.text for src in rule.findall('source/member') if src.text is not None])
-                    destination = ','.join([dst.text for dst in rule.findall('destination/member') if dst.text is not None])
-                    application = ','.join([app.text for app in rule.findall('application/member') if app.text is not None])
-                    service = ','.join([svc.text for svc in rule.findall('service/member') if svc.text is not None])
-                    action = rule.findtext('action', '')
-                    writer.writerow({
-                        'device_group': dg,
-                        'rule_name': rule_name,
-                        'source': source,
-                        'destination': destination,
-                        'application': application,
-                        'service': service,
-                        'action': action,
-                        'enabled': 'yes' if enabled else 'no'
-                    })
-            except Exception as e:
-                print(f"Failed to parse policies for {dg}: {e}")
-    print(f"\nExport complete. Policies saved to {filename}")
+    filenames = output_filenames(f"panorama_export_policies_{now}", formats or ['csv'])
+    export_policies(client, dgs, filenames, stream=stream, chunk_size=chunk_size, resolve=resolve,
+                    hit_counts=hit_counts)
+    print(f"\nExport complete. Policies saved to {', '.join(filenames)}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export Panorama security and NAT policies to CSV.')
+    add_cache_arguments(parser)
+    add_client_arguments(parser)
+    add_metrics_arguments(parser)
+    add_format_arguments(parser)
+    parser.add_argument('--incremental', metavar='CSV',
+                        help='Merge into this CSV (CSV only), re-exporting only device groups changed since the last run')
+    parser.add_argument('--chunk-size', type=int, metavar='N',
+                        help='Fetch rules in parallel windows of N rules (live API only, implies --no-cache)')
+    parser.add_argument('--resolve', action='store_true',
+                        help='Add columns with address/service groups expanded to prefixes and ports')
+    parser.add_argument('--hit-counts', action='store_true',
+                        help='Add rule hit counts and last-hit times (live API only, implies --no-cache)')
+    args = parser.parse_args()
+    if args.chunk_size or args.hit_counts:
+        args.no_cache = True
+
     print("=== Palo Alto Panorama Policy Exporter ===\n")
     print("Please enter your Panorama credentials.")
     panorama_host = input("Enter Panorama IP: ").strip()
-    print("You will be asked for your username and password.")
-
-    # Credential check loop
-    max_attempts = 3
-    for attempt in range(1, max_attempts + 1):
-        username = input("Enter username: ").strip()
-        print("Please enter your password. (Input will be hidden)")
-        password = getpass.getpass("Enter password: ")
-        api_key = get_api_key(panorama_host, username, password)
-        if api_key:
-            break
-        else:
-            print(f"Login failed. Check credentials. Attempt {attempt} of {max_attempts}.")
-    else:
-        print("Too many failed login attempts. Exiting.")
-        sys.exit(1)
+    client = open_config_source(panorama_host, args)
 
     while True:
-        main(panorama_host, api_key)
+        with metrics_session(args, 'panorama_export_policies'):
+            main(client, incremental=args.incremental, chunk_size=args.chunk_size, formats=args.formats,
+                 resolve=args.resolve, hit_counts=args.hit_counts)
         again = input("\nDo you want to run the script again (device group selection and export)? (y/n): ").strip().lower()
         if again != 'y':
             print("Exiting.")
@@ -1,32 +1,65 @@
-import requests
 import sys
+import argparse
 from datetime import datetime
-import getpass
-import csv
 
-# Disable SSL warnings
-try:
-    import urllib3
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-except ImportError:
-    pass
+from panorama_client import add_client_arguments, dg_xpath
+from panorama_incremental import incremental_export
+from panorama_snapshot_cache import add_cache_arguments, open_config_source
+from panorama_metrics import add_metrics_arguments, metrics, metrics_session
+from panorama_output import add_format_arguments, OpenSink, output_filenames
+from panorama_records import RecordParser
+
+TAGS_SUFFIX = '/tag'
+FIELDNAMES = [
+    'device_group', 'tag_name', 'color', 'comments'
+]
+# For tags turned into a row right away: interning would only cost time
+ROW_PARSER = RecordParser(intern=False)
 
 def prompt_with_default(prompt, default):
     value = input(f"{prompt} (default: {default}): ").strip()
     return value if value else default
 
-def get_api_key(panorama_host, username, password):
-    key_url = f"https://{panorama_host}/api/?type=keygen&user={username}&password={password}"
+def record_to_row(dg, tag):
+    # tag: panorama_records.TagRecord
+    return {
+        'device_group': dg,
+        'tag_name': tag.name,
+        'color': tag.color,
+        'comments': tag.comments
+    }
+
+def tag_to_row(dg, tag):
+    return record_to_row(dg, ROW_PARSER.tag(tag))
+
+def parse_tags(dg, root):
+    return [tag_to_row(dg, tag) for tag in root.findall('.//tag/entry')]
+
+def fetch_tags(client, dg):
+    # Runs on a worker thread; returns the TagRecords of one device group (or None on failure)
+    print(f"Exporting tags for device group: {dg}")
     try:
-        r = requests.get(key_url, verify=False, timeout=10)
-        if '<key>' not in r.text:
-            return None
-        return r.text.split('<key>')[1].split('</key>')[0]
+        root = client.config_get_element(dg_xpath(dg, TAGS_SUFFIX))
+        parser = RecordParser()
+        return [parser.tag(tag) for tag in root.findall('.//tag/entry')]
     except Exception as e:
-        print(f"Error connecting to Panorama: {e}")
+        print(f"Failed to parse tags for {dg}: {e}")
         return None
 
-def main(panorama_host, api_key):
+def export_tags(client, dgs, filename):
+    """
+    client can be a PanoramaClient or any config source with the same interface (e.g. LocalConfig).
+    filename can be a list; each file gets the format of its extension (see panorama_output).
+    """
+    with OpenSink(filename, FIELDNAMES) as sink:
+        writer = metrics.wrap_writer(sink)
+        writer.writeheader()
+        # Device groups are fetched concurrently; rows are written in selection order
+        for dg, tags in zip(dgs, client.map_ordered(lambda dg: fetch_tags(client, dg), dgs)):
+            if tags:
+                writer.writerows(record_to_row(dg, tag) for tag in tags)
+
+def main(client, incremental=None, formats=None):
     # Hardcoded device group list (edit this with your device group names)
     device_groups = [
         #Example "USA", "EU", "Asia"
@@ -58,73 +91,35 @@ def main(panorama_host, api_key):
     else:
         dgs = [device_groups[i-1] for i in selected_indices]
 
-    # Prepare CSV file
+    if incremental:
+        incremental_export(client, dgs, incremental, FIELDNAMES, [TAGS_SUFFIX], parse_tags)
+        print(f"\nExport complete. Tags saved to {incremental}")
+        return
+
+    # Rows go straight to every requested format in one pass (CSV and Excel by default)
     now = datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f"panorama_export_tags_from_device_groups_{now}.csv"
-    fieldnames = [
-        'device_group', 'tag_name', 'color', 'comments'
-    ]
-    with open(filename, 'w', encoding='utf-8', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        for dg in dgs:
-            print(f"Exporting tags for device group: {dg}")
-            xpath = f"/config/devices/entry/device-group/entry[@name='{dg}']/tag"
-            url = f"https://{panorama_host}/api/?type=config&action=get&xpath={xpath}&key={api_key}"
-            r = requests.get(url, verify=False)
-            import xml.etree.ElementTree as ET
-            try:
-                root = ET.fromstring(r.text)
-                tags = root.findall('.//entry')
-                for tag in tags:
-                    tag_name = tag.attrib.get('name', '')
-                    color = tag.findtext('color', '')
-                    comments = tag.findtext('comments', '')
-                    writer.writerow({
-                        'device_group': dg,
-                        'tag_name': tag_name,
-                        'color': color,
-                        'comments': comments
-                    })
-            except Exception as e:
-                print(f"Failed to parse tags for {dg}: {e}")
-    print(f"\nExport complete. Tags saved to {filename}")
-
-    # Export CSV to Excel
-    try:
-        import pandas as pd
-        excel_filename = filename.replace('.csv', '.xlsx')
-        df = pd.read_csv(filename)
-        df.to_excel(excel_filename, index=False)
-        print(f"Tags also saved to {excel_filename}")
-    except ImportError:
-        print("pandas is not installed. Skipping Excel export. To enable, run: pip install pandas openpyxl")
-    except Exception as e:
-        print(f"Failed to export to Excel: {e}")
+    filenames = output_filenames(f"panorama_export_tags_from_device_groups_{now}", formats or ['csv', 'xlsx'])
+    export_tags(client, dgs, filenames)
+    print(f"\nExport complete. Tags saved to {', '.join(filenames)}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export Panorama device group tags to CSV/Excel.')
+    add_cache_arguments(parser)
+    add_client_arguments(parser)
+    add_metrics_arguments(parser)
+    add_format_arguments(parser, default='csv and xlsx')
+    parser.add_argument('--incremental', metavar='CSV',
+                        help='Merge into this CSV (CSV only), re-exporting only device groups changed since the last run')
+    args = parser.parse_args()
+
     print("=== Palo Alto Panorama Tag Exporter (Device Groups) ===\n")
     print("Please enter your Panorama credentials.")
     panorama_host = input("Enter Panorama IP: ").strip()
-    print("You will be asked for your username and password.")
-
-    # Credential check loop
-    max_attempts = 3
-    for attempt in range(1, max_attempts + 1):
-        username = input("Enter username: ").strip()
-        print("Please enter your password. (Input will be hidden)")
-        password = getpass.getpass("Enter password: ")
-        api_key = get_api_key(panorama_host, username, password)
-        if api_key:
-            break
-        else:
-            print(f"Login failed. Check credentials. Attempt {attempt} of {max_attempts}.")
-    else:
-        print("Too many failed login attempts. Exiting.")
-        sys.exit(1)
+    client = open_config_source(panorama_host, args)
 
     while True:
-        main(panorama_host, api_key)
+        with metrics_session(args, 'panorama_export_tags'):
+            main(client, incremental=args.incremental, formats=args.formats)
         again = input("\nDo you want to run the script again (device group selection and export)? (y/n): ").strip().lower()
         if again != 'y':
             print("Exiting.")
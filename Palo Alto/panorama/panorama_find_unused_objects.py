@@ -0,0 +1,178 @@
+import sys
+import argparse
+import csv
+from datetime import datetime
+
+from panorama_client import DEFAULT_RATE, PanoramaClient, add_client_arguments, get_dg_parents, prompt_login, scope_chain, scope_xpath
+from panorama_objects import filter_tags, parse_tag_filter
+from panorama_records import RecordParser
+from panorama_metrics import add_metrics_arguments, metrics, metrics_session
+
+FIELDNAMES = [
+    'scope', 'object_type', 'object_name'
+]
+OBJECT_TYPES = ['address', 'address-group', 'service', 'service-group', 'tag']
+# Which object types a reference of each category can resolve to, in lookup order
+REFERENCE_TYPES = {
+    'address': ('address', 'address-group'),
+    'service': ('service', 'service-group'),
+    'tag': ('tag',),
+}
+
+def prompt_with_default(prompt, default):
+    value = input(f"{prompt} (default: {default}): ").strip()
+    return value if value else default
+
+class ReferenceIndex:
+    """
+    Reverse-reference index for address, address-group, service, service-group and tag objects.
+    Every scope (shared and each device group) is walked once: object definitions go into
+    per-scope name sets, and every reference found in rules (security, NAT and the other
+    rulebases, pre and post), address groups, service groups and object tags is resolved
+    through the device group hierarchy (device group, parents, shared) and recorded.
+    Address objects whose tags match a dynamic address group's filter count as used by it.
+    Checking whether an object is used is then a single set lookup.
+    """
+    def __init__(self, parents):
+        self.parents = parents
+        self.defined = {}
+        self.references = {}
+        self.referenced = set()
+        # scope -> dynamic group filters / {address name: tag set}
+        self.filters = {}
+        self.address_tags = {}
+
+    def add_scope(self, records):
+        # records: panorama_records.ScopeRecords of one scope
+        objects = records.objects
+        self.defined[records.name] = {kind: set(objects[kind]) for kind in OBJECT_TYPES}
+        refs = self.references.setdefault(records.name, [])
+        self.filters[records.name] = [group.filter for group in objects['address-group'].values()
+                                      if group.static is None and group.filter]
+        self.address_tags[records.name] = {name: set(obj.tags) for name, obj in objects['address'].items()}
+        # Rules: all rulebase types (security, nat, decryption, pbf, ...)
+        for rules in records.rules.values():
+            for rule in rules:
+                # NAT translated addresses included
+                for names in (rule.source, rule.destination, rule.translated):
+                    refs.extend(('address', name) for name in names)
+                refs.extend(('service', name) for name in rule.service)
+                refs.extend(('tag', name) for name in rule.tags)
+                if rule.group_tag:
+                    refs.append(('tag', rule.group_tag))
+        # Groups and object tags
+        for group in objects['address-group'].values():
+            refs.extend(('address', name) for name in group.static or ())
+            refs.extend(('tag', name) for name in filter_tags(group.filter))
+        for group in objects['service-group'].values():
+            refs.extend(('service', name) for name in group.members)
+        for kind in ('address', 'address-group', 'service', 'service-group'):
+            for obj in objects[kind].values():
+                refs.extend(('tag', name) for name in obj.tags)
+
+    def resolve(self):
+        # Resolve every collected reference to the scope that actually defines the object
+        for scope, refs in self.references.items():
+            chain = scope_chain(scope, self.parents)
+            for category, name in set(refs):
+                found = False
+                for owner in chain:
+                    for kind in REFERENCE_TYPES[category]:
+                        if name in self.defined.get(owner, {}).get(kind, ()):
+                            self.referenced.add((owner, kind, name))
+                            found = True
+                            break
+                    if found:
+                        break
+        self.resolve_dynamic()
+        self.references = {}
+        self.filters = {}
+
+    def resolve_dynamic(self):
+        # Firewalls evaluate a dynamic group against the objects of its own scope, the scopes
+        # above it and the device groups below it
+        for scope, filters in self.filters.items():
+            matches = [match for match in map(parse_tag_filter, filters) if match is not None]
+            if not matches:
+                continue
+            for owner, tagged in self.address_tags.items():
+                if scope not in scope_chain(owner, self.parents) and owner not in scope_chain(scope, self.parents):
+                    continue
+                for name, tags in tagged.items():
+                    if any(match(tags) for match in matches):
+                        self.referenced.add((owner, 'address', name))
+
+    def is_referenced(self, scope, kind, name):
+        return (scope, kind, name) in self.referenced
+
+    def unused(self, scopes):
+        for scope in scopes:
+            for kind in OBJECT_TYPES:
+                for name in sorted(self.defined.get(scope, {}).get(kind, ())):
+                    if not self.is_referenced(scope, kind, name):
+                        yield {'scope': scope, 'object_type': kind, 'object_name': name}
+
+def fetch_scope(client, scope, parser):
+    # Runs on a worker thread; returns the parsed records of one scope (None if it has no config)
+    print(f"Indexing references for: {scope}")
+    try:
+        elem = client.config_get_element(scope_xpath(scope)).find('result/*')
+    except Exception as e:
+        # A scope whose references are missing would make objects above it look unused
+        raise RuntimeError(f"failed to read config for {scope}: {e}") from e
+    return parser.scope(scope, elem) if elem is not None else None
+
+def build_reference_index(client, dgs):
+    """
+    Index shared plus all device groups: objects in shared or a parent device group
+    may be used by any device group below it, so every scope has to be walked.
+    """
+    index = ReferenceIndex(get_dg_parents(client))
+    scopes = ['shared'] + list(dgs)
+    parser = RecordParser()
+    for records in client.map_ordered(lambda scope: fetch_scope(client, scope, parser), scopes):
+        if records is not None:
+            index.add_scope(records)
+    index.resolve()
+    return index
+
+def export_unused(client, filename, report_scopes=None):
+    dgs = client.get_device_groups()
+    index = build_reference_index(client, dgs)
+    counts = {}
+    with open(filename, 'w', encoding='utf-8', newline='') as csvfile:
+        writer = metrics.wrap_writer(csv.DictWriter(csvfile, fieldnames=FIELDNAMES))
+        writer.writeheader()
+        for row in index.unused(report_scopes or ['shared'] + dgs):
+            writer.writerow(row)
+            counts[row['object_type']] = counts.get(row['object_type'], 0) + 1
+    return counts
+
+def main(rate=DEFAULT_RATE):
+    print("=== Panorama Unused Object Finder ===\n")
+    print("Please enter your Panorama credentials.")
+    panorama_host = input("Enter Panorama IP or hostname: ").strip()
+    client = PanoramaClient(panorama_host, rate=rate)
+    prompt_login(client)
+
+    scope = prompt_with_default(
+        "Enter scope to report (device group name, 'shared', or leave blank for all)", "all"
+    )
+    now = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f"panorama_unused_objects_{now}.csv"
+    try:
+        counts = export_unused(client, filename, None if scope == "all" else [scope])
+    except Exception as e:
+        print(f"Failed to build reference index: {e}")
+        sys.exit(1)
+    for kind in OBJECT_TYPES:
+        print(f"  Unused {kind} objects: {counts.get(kind, 0)}")
+    print(f"\nCheck complete. Unused objects saved to {filename}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Find unreferenced address, service and tag objects.')
+    add_client_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    with metrics_session(args, 'panorama_find_unused_objects'):
+        main(rate=args.rate)
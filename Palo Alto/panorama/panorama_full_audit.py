@@ -0,0 +1,63 @@
+import os
+import sys
+import argparse
+from datetime import datetime
+
+from panorama_client import DEFAULT_RATE, PanoramaClient, add_client_arguments, prompt_login
+from panorama_metrics import add_metrics_arguments, metrics_session
+from panorama_bulk_config import LocalConfig, fetch_bulk_config, load_config, save_config
+from panorama_export_policies import export_policies
+from panorama_export_tags import export_tags
+from panorama_check_duplicate_objects import check_duplicates
+
+
+def main(rate=DEFAULT_RATE):
+    print("=== Panorama Full Audit (single config pull) ===\n")
+    print("Pulls the device-group and shared config once, then runs the policy export,")
+    print("tag export and duplicate object check against that one document.")
+    source = input("Enter a saved config XML to audit offline (leave blank to pull from Panorama): ").strip()
+
+    now = datetime.now().strftime('%Y%m%d_%H%M%S')
+    if source:
+        if not os.path.isfile(source):
+            print(f"File not found: {source}")
+            sys.exit(1)
+        config = load_config(source)
+    else:
+        print("Please enter your Panorama credentials.")
+        panorama_host = input("Enter Panorama IP or hostname: ").strip()
+        client = PanoramaClient(panorama_host, rate=rate)
+        prompt_login(client)
+        try:
+            root = fetch_bulk_config(client)
+        except Exception as e:
+            print(f"Failed to pull config: {e}")
+            sys.exit(1)
+        config_filename = f"panorama_config_{now}.xml"
+        save_config(root, config_filename)
+        print(f"Config saved to {config_filename}")
+        config = LocalConfig(root)
+
+    dgs = sorted(config.get_device_groups(), key=lambda x: x.lower())
+    print(f"Found {len(dgs)} device groups.\n")
+
+    policies_filename = f"panorama_export_policies_{now}.csv"
+    export_policies(config, dgs, policies_filename)
+    tags_filename = f"panorama_export_tags_from_device_groups_{now}.csv"
+    export_tags(config, dgs, tags_filename)
+    duplicates_filename = f"panorama_duplicate_objects_{now}.csv"
+    # Duplicates within shared are reported too, as by 'panorama.py duplicates'
+    check_duplicates(config, ['shared'] + dgs, duplicates_filename)
+
+    print("\nAudit complete.")
+    print(f"  Policies saved to {policies_filename}")
+    print(f"  Tags saved to {tags_filename}")
+    print(f"  Duplicate objects saved to {duplicates_filename}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run all exports from a single config pull.')
+    add_client_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    with metrics_session(args, 'panorama_full_audit'):
+        main(rate=args.rate)
@@ -0,0 +1,82 @@
+from datetime import datetime
+import xml.etree.ElementTree as ET
+
+from panorama_metrics import metrics
+
+HIT_COUNT_FIELDNAMES = ['hit_count', 'last_hit']
+DEFAULT_BATCH_SIZE = 200
+# Keep the op command (sent URL-encoded in a GET) well below common URL length limits
+MAX_CMD_CHARS = 4000
+
+
+def hit_count_cmd(dg, rulebase, names):
+    # 'pre-rulebase/security' + names -> one <show><rule-hit-count> op command for all of them
+    position, rule_type = rulebase.split('/')
+    show = ET.Element('show')
+    dg_entry = ET.SubElement(ET.SubElement(ET.SubElement(show, 'rule-hit-count'), 'device-group'), 'entry', name=dg)
+    type_entry = ET.SubElement(ET.SubElement(dg_entry, position), 'entry', name=rule_type)
+    rule_names = ET.SubElement(ET.SubElement(type_entry, 'rules'), 'rule-name')
+    for name in names:
+        ET.SubElement(rule_names, 'entry', name=name)
+    return ET.tostring(show, encoding='unicode')
+
+
+def batches(names, batch_size):
+    # Lists of at most batch_size names whose op command stays short enough
+    batch, length = [], 0
+    for name in names:
+        cost = len(name) + 20
+        if batch and (len(batch) >= batch_size or length + cost > MAX_CMD_CHARS):
+            yield batch
+            batch, length = [], 0
+        batch.append(name)
+        length += cost
+    if batch:
+        yield batch
+
+
+def timestamp(value):
+    return datetime.fromtimestamp(value).strftime('%Y-%m-%d %H:%M:%S') if value else ''
+
+
+def parse_hit_counts(root):
+    """
+    {rule name: (hit count, last hit epoch)} from a rule-hit-count response.
+    Counts are summed and the last hit is the latest over all devices/vsys the rule is pushed to.
+    """
+    counts = {}
+    for rule in root.findall('.//rules/entry'):
+        hits = last = 0
+        for device in rule.findall('device-vsys/entry'):
+            hits += int(device.findtext('hit-count') or 0)
+            last = max(last, int(device.findtext('last-hit-timestamp') or 0))
+        counts[rule.attrib.get('name', '')] = (hits, last)
+    return counts
+
+
+def fetch_hit_counts(client, rule_names, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    rule_names: {(device group, rulebase): [rule names]}. Every name list is split into
+    batches, and all batches of all device groups run together on the client's thread pool.
+    Returns {(device group, rulebase, rule name): (hit count, last hit epoch)}.
+    """
+    jobs = [(dg, rulebase, batch)
+            for (dg, rulebase), names in rule_names.items()
+            for batch in batches(names, batch_size)]
+
+    def fetch(job):
+        dg, rulebase, names = job
+        try:
+            return parse_hit_counts(ET.fromstring(client.op(hit_count_cmd(dg, rulebase, names))))
+        except Exception as e:
+            print(f"Failed to read hit counts for {dg} {rulebase}: {e}")
+            return {}
+
+    counts = {}
+    with metrics.phase('hit_counts'):
+        for (dg, rulebase, _), batch_counts in zip(jobs, client.map_ordered(fetch, jobs)):
+            for name, value in batch_counts.items():
+                counts[(dg, rulebase, name)] = value
+    print(f"Read hit counts for {len(counts)} rules in {len(jobs)} requests")
+    return counts
+
@@ -0,0 +1,146 @@
+import os
+import csv
+import json
+import hashlib
+from datetime import datetime
+import xml.etree.ElementTree as ET
+
+from panorama_client import dg_xpath
+from panorama_metrics import metrics
+from panorama_snapshot_cache import get_config_version
+
+
+def state_path(filename):
+    return filename + '.state.json'
+
+
+def load_state(filename):
+    path = state_path(filename)
+    if not os.path.isfile(filename) or not os.path.isfile(path):
+        # Without the previous CSV the stored hashes are useless: rebuild everything
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Ignoring unreadable state file {path}: {e}")
+        return {}
+
+
+def save_state(filename, state):
+    path = state_path(filename)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def fetch_subtrees(client, dg, suffixes, action='get'):
+    # One <entry> holding only the given subtrees of a device group, at their usual paths
+    # (action='get' reads the candidate config, 'show' the running config)
+    root = ET.Element('entry', name=dg)
+    for suffix in suffixes:
+        parent = root
+        for tag in suffix.strip('/').split('/')[:-1]:
+            child = parent.find(tag)
+            parent = child if child is not None else ET.SubElement(parent, tag)
+        result = client.config_get_element(dg_xpath(dg, suffix), action).find('result')
+        if result is not None:
+            parent.extend(result)
+    return root
+
+
+def incremental_export(client, dgs, filename, fieldnames, suffixes, parse_rows):
+    """
+    Re-export only the device groups whose exported subtrees changed since the last run.
+    Only the subtrees the export reads (dg_xpath(dg, suffix) for each suffix) are fetched
+    and hashed; unchanged groups are not parsed and their rows are copied from the
+    existing CSV. Changed groups replace their old rows in place, new groups are appended
+    and deleted groups are dropped.
+    When the config version (latest commit job) is known, the running config is read, so
+    the hashes belong to that commit; if it is the version of the last run, nothing is
+    fetched for groups exported then. Like the snapshot cache, this leaves out
+    uncommitted candidate changes. Without a version the candidate config is read and
+    every group is fetched and hashed.
+    parse_rows(dg, element) must return the CSV rows for one device group.
+    Returns a dict with the 'changed', 'added', 'removed' and 'unchanged' group names.
+    """
+    state = load_state(filename)
+    hashes = dict(state.get('hashes', {}))
+    # LocalConfig snapshots have no commit jobs to ask
+    version = get_config_version(client) if hasattr(client, 'op') else None
+    action = 'show' if version else 'get'
+    # Older state files did not record which config they were hashed from
+    same_version = version is not None and version == state.get('version') and state.get('config') == 'running'
+    try:
+        existing_dgs = set(client.get_device_groups())
+    except Exception as e:
+        print(f"Could not list device groups, not removing any: {e}")
+        existing_dgs = set(dgs) | set(hashes)
+
+    def check(dg):
+        if same_version and dg in hashes:
+            return dg, hashes[dg], None
+        try:
+            root = fetch_subtrees(client, dg, suffixes, action)
+            digest = hashlib.sha256(ET.tostring(root)).hexdigest()
+            if hashes.get(dg) == digest:
+                return dg, digest, None
+            return dg, digest, parse_rows(dg, root)
+        except Exception as e:
+            print(f"Failed to process {dg}, keeping previous rows: {e}")
+            return dg, None, None
+
+    fresh = {}
+    changes = {'changed': [], 'added': [], 'removed': [], 'unchanged': []}
+    for dg, digest, rows in client.map_ordered(check, dgs):
+        if rows is None:
+            changes['unchanged'].append(dg)
+            continue
+        changes['changed' if dg in hashes else 'added'].append(dg)
+        fresh[dg] = rows
+        hashes[dg] = digest
+    removed = set(dg for dg in hashes if dg not in existing_dgs)
+    changes['removed'] = sorted(removed)
+    for dg in removed:
+        del hashes[dg]
+
+    # Stream the previous CSV into a new one, swapping in the rows of changed groups
+    written = set()
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'w', encoding='utf-8', newline='') as out:
+        writer = metrics.wrap_writer(csv.DictWriter(out, fieldnames=fieldnames, extrasaction='ignore'))
+        writer.writeheader()
+        if os.path.isfile(filename):
+            with open(filename, 'r', encoding='utf-8', newline='') as f:
+                for row in csv.DictReader(f):
+                    dg = row.get('device_group', '')
+                    if dg in removed:
+                        continue
+                    if dg in fresh:
+                        if dg not in written:
+                            writer.writerows(fresh[dg])
+                            written.add(dg)
+                        continue
+                    writer.writerow(row)
+        for dg in dgs:
+            if dg in fresh and dg not in written:
+                writer.writerows(fresh[dg])
+    os.replace(tmp_filename, filename)
+
+    save_state(filename, {
+        'hashes': hashes,
+        'version': version,
+        'config': 'running' if action == 'show' else 'candidate',
+        'last_run': datetime.now().isoformat(timespec='seconds'),
+        'last_changes': changes,
+    })
+    print_changes(changes)
+    return changes
+
+
+def print_changes(changes):
+    print(f"\nIncremental export: {len(changes['changed'])} changed, {len(changes['added'])} added, "
+          f"{len(changes['removed'])} removed, {len(changes['unchanged'])} unchanged device groups.")
+    for key in ('changed', 'added', 'removed'):
+        if changes[key]:
+            print(f"  {key}: {', '.join(changes[key])}")
@@ -0,0 +1,227 @@
+import re
+
+from panorama_client import get_dg_parents, scope_chain, scope_xpath
+from panorama_records import RecordParser, ScopeRecords
+
+OBJECT_KINDS = ('address', 'address-group', 'service', 'service-group')
+PROTOCOLS = ('tcp', 'udp', 'sctp')
+# Predefined service objects
+PREDEFINED_SERVICES = {
+    'service-http': ('tcp/80', 'tcp/8080'),
+    'service-https': ('tcp/443',),
+}
+FILTER_TOKEN = re.compile(r"\s*(?:'([^']*)'|\"([^\"]*)\"|(\()|(\))|([^\s()]+))")
+
+
+def filter_tags(text):
+    # Tag names a dynamic address group filter refers to, quoted or not
+    return [quoted or dquoted or word for quoted, dquoted, lpar, rpar, word in FILTER_TOKEN.findall(text or '')
+            if not (lpar or rpar) and word not in ('and', 'or', 'not')]
+
+
+def parse_tag_filter(text):
+    """
+    Compile a dynamic address group filter ('web' and ('prod' or 'dmz')) into a
+    function of a tag set. Returns None if the filter cannot be parsed.
+    """
+    tokens = []
+    for quoted, dquoted, lpar, rpar, word in FILTER_TOKEN.findall(text or ''):
+        if lpar or rpar:
+            tokens.append(lpar or rpar)
+        elif word in ('and', 'or', 'not'):
+            tokens.append(word)
+        else:
+            tokens.append(('tag', quoted or dquoted or word))
+    pos = 0
+
+    def expr():
+        nonlocal pos
+        left = term()
+        while pos < len(tokens) and tokens[pos] == 'or':
+            pos += 1
+            right = term()
+            left = (lambda a, b: lambda tags: a(tags) or b(tags))(left, right)
+        return left
+
+    def term():
+        nonlocal pos
+        left = factor()
+        while pos < len(tokens) and tokens[pos] == 'and':
+            pos += 1
+            right = factor()
+            left = (lambda a, b: lambda tags: a(tags) and b(tags))(left, right)
+        return left
+
+    def factor():
+        nonlocal pos
+        if pos >= len(tokens):
+            raise ValueError('unexpected end of filter')
+        token = tokens[pos]
+        pos += 1
+        if token == 'not':
+            inner = factor()
+            return lambda tags: not inner(tags)
+        if token == '(':
+            inner = expr()
+            if pos >= len(tokens) or tokens[pos] != ')':
+                raise ValueError('missing )')
+            pos += 1
+            return inner
+        if isinstance(token, tuple):
+            return lambda tags: token[1] in tags
+        raise ValueError(f'unexpected {token}')
+
+    try:
+        match = expr()
+        return match if pos == len(tokens) else None
+    except ValueError:
+        return None
+
+
+class ObjectResolver:
+    """
+    Expands address, address-group and service(-group) names into concrete values,
+    following Panorama's lookup order: the referencing device group, its parents,
+    then shared. Group members are looked up from the scope that defines the group.
+    Dynamic address groups are expanded from the tags of the address objects visible
+    to them; if nothing matches (or expand_dynamic is off) the group stays
+    'dynamic:<scope>/<name>'.
+
+    Every (scope, name) is resolved once and memoized, so an object used by
+    thousands of rules costs one expansion per scope. Objects are held as
+    panorama_records name tables, not as XML.
+    Addresses resolve to ip-netmask / ip-range values as configured, 'fqdn:<name>', or
+    the member itself (literal IPs, unknown names); services to 'tcp/443', 'udp/53-54', ...
+    """
+    def __init__(self, parents, expand_dynamic=True, parser=None):
+        self.parents = parents
+        self.expand_dynamic = expand_dynamic
+        self.parser = parser or RecordParser()
+        self.scopes = {}
+        self.memo = {}
+        self.hits = 0
+        self.misses = 0
+
+    def add_scope(self, scope, elem):
+        # elem: the scope element, or an API <result> holding some of its object containers
+        self.add_records(self.parser.add_objects(ScopeRecords(scope), elem))
+
+    def add_records(self, records):
+        # Merge the object name tables of a parsed scope (panorama_records.ScopeRecords)
+        tables = self.scopes.setdefault(records.name, {kind: {} for kind in OBJECT_KINDS})
+        for kind in OBJECT_KINDS:
+            tables[kind].update(records.objects[kind])
+
+    def lookup(self, scope, kinds, name):
+        for owner in scope_chain(scope, self.parents):
+            tables = self.scopes.get(owner, {})
+            for kind in kinds:
+                if name in tables.get(kind, {}):
+                    return owner, kind, tables[kind][name]
+        return None, None, None
+
+    def memoized(self, key, compute):
+        if key in self.memo:
+            self.hits += 1
+            return self.memo[key]
+        self.misses += 1
+        # Placeholder breaks reference cycles between groups
+        self.memo[key] = ()
+        value = self.memo[key] = compute()
+        return value
+
+    def address(self, scope, name):
+        # Tuple of resolved address values for one member name
+        return self.memoized(('address', scope, name), lambda: self._address(scope, name))
+
+    def _address(self, scope, name):
+        owner, kind, record = self.lookup(scope, ('address', 'address-group'), name)
+        if record is None:
+            return (name,)
+        if owner != scope:
+            # Same object for every device group below owner
+            return self.address(owner, name)
+        if kind == 'address':
+            if record.type == 'fqdn':
+                return (f"fqdn:{record.value.strip()}",)
+            return (record.value.strip(),) if record.value else (name,)
+        if record.static is not None:
+            return self.unique(v for member in record.static for v in self.address(owner, member))
+        return self.dynamic_group(owner, name, record)
+
+    def dynamic_group(self, owner, name, record):
+        match = parse_tag_filter(record.filter or '') if self.expand_dynamic else None
+        if match is None:
+            return (f"dynamic:{owner}/{name}",)
+        values = []
+        seen = set()
+        for scope in scope_chain(owner, self.parents):
+            for obj_name, obj in self.scopes.get(scope, {}).get('address', {}).items():
+                if obj_name in seen:
+                    continue
+                seen.add(obj_name)
+                if match(set(obj.tags)):
+                    values.extend(self.address(scope, obj_name))
+        # Addresses registered at runtime (User-ID, VM info) are not in the config
+        return self.unique(values) or (f"dynamic:{owner}/{name}",)
+
+    def service(self, scope, name):
+        # Tuple of 'proto/ports' values for one member name
+        if name in PREDEFINED_SERVICES:
+            return PREDEFINED_SERVICES[name]
+        return self.memoized(('service', scope, name), lambda: self._service(scope, name))
+
+    def _service(self, scope, name):
+        owner, kind, record = self.lookup(scope, ('service', 'service-group'), name)
+        if record is None:
+            return (name,)
+        if owner != scope:
+            return self.service(owner, name)
+        if kind == 'service':
+            ports = dict(record.ports)
+            values = [f"{proto}/{port.strip()}"
+                      for proto in PROTOCOLS
+                      for port in ports.get(proto, '').split(',') if port.strip()]
+            return tuple(values) or (name,)
+        return self.unique(v for member in record.members for v in self.service(owner, member))
+
+    @staticmethod
+    def unique(values):
+        return tuple(dict.fromkeys(values))
+
+    def resolve(self, scope, kind, names):
+        # Resolved values of a member list; 'any' and empty lists stay as they are
+        if not names or 'any' in names:
+            return tuple(names)
+        lookup = self.service if kind == 'service' else self.address
+        return self.unique(v for name in names for v in lookup(scope, name))
+
+
+def load_object_resolver(client, dgs):
+    """
+    Build an ObjectResolver for the device groups in dgs and every scope above them.
+    Only the address and service subtrees are read, not the rulebases.
+    """
+    parents = get_dg_parents(client)
+    scopes = []
+    for dg in dgs:
+        for scope in scope_chain(dg, parents):
+            if scope not in scopes:
+                scopes.append(scope)
+    resolver = ObjectResolver(parents)
+    jobs = [(scope, kind) for scope in scopes for kind in OBJECT_KINDS]
+
+    def fetch(job):
+        # Parsed on the worker thread, so only the records outlive the response
+        scope, kind = job
+        try:
+            result = client.config_get_element(scope_xpath(scope, f'/{kind}')).find('result')
+            return resolver.parser.add_objects(ScopeRecords(scope), result)
+        except Exception as e:
+            print(f"Failed to read {kind} objects for {scope}: {e}")
+            return None
+
+    for records in client.map_ordered(fetch, jobs):
+        if records is not None:
+            resolver.add_records(records)
+    return resolver
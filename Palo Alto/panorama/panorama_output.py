@@ -0,0 +1,212 @@
+import os
+import csv
+import json
+import importlib
+
+SINK_FORMATS = ('csv', 'xlsx', 'parquet', 'jsonl')
+# Formats with an optional writer: format -> (module imported, pip distribution)
+SINK_REQUIREMENTS = {'xlsx': ('openpyxl', 'openpyxl'), 'parquet': ('pyarrow.parquet', 'pyarrow')}
+PARQUET_BATCH_ROWS = 50000
+
+
+class CsvSink:
+    def __init__(self, filename, fieldnames):
+        self.file = open(filename, 'w', encoding='utf-8', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=fieldnames, extrasaction='ignore')
+
+    def writeheader(self):
+        self.writer.writeheader()
+
+    def writerow(self, row):
+        self.writer.writerow(row)
+
+    def writerows(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class XlsxSink:
+    # openpyxl write-only mode: rows go to a temporary sheet file, not an in-memory grid
+    def __init__(self, filename, fieldnames):
+        from openpyxl import Workbook
+        self.filename = filename
+        self.fieldnames = fieldnames
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet()
+
+    def writeheader(self):
+        self.sheet.append(self.fieldnames)
+
+    def writerow(self, row):
+        self.sheet.append([row.get(f, '') for f in self.fieldnames])
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def close(self):
+        self.workbook.save(self.filename)
+
+
+class ParquetSink:
+    # All columns are strings; rows are buffered and written one row group per batch
+    def __init__(self, filename, fieldnames, batch_rows=PARQUET_BATCH_ROWS):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa = pa
+        self.fieldnames = fieldnames
+        self.batch_rows = batch_rows
+        self.schema = pa.schema([(f, pa.string()) for f in fieldnames])
+        self.writer = pq.ParquetWriter(filename, self.schema)
+        self.columns = {f: [] for f in fieldnames}
+        self.pending = 0
+
+    def writeheader(self):
+        pass
+
+    def writerow(self, row):
+        for f in self.fieldnames:
+            value = row.get(f, '')
+            self.columns[f].append('' if value is None else str(value))
+        self.pending += 1
+        if self.pending >= self.batch_rows:
+            self.flush()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def flush(self):
+        if self.pending:
+            self.writer.write_table(self.pa.table(self.columns, schema=self.schema))
+            self.columns = {f: [] for f in self.fieldnames}
+            self.pending = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+class JsonlSink:
+    def __init__(self, filename, fieldnames):
+        self.file = open(filename, 'w', encoding='utf-8')
+        self.fieldnames = fieldnames
+
+    def writeheader(self):
+        pass
+
+    def writerow(self, row):
+        self.file.write(json.dumps({f: row.get(f, '') for f in self.fieldnames}, ensure_ascii=False) + '\n')
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def close(self):
+        self.file.close()
+
+
+class MultiSink:
+    # Writes every row to several sinks in one pass
+    def __init__(self, sinks):
+        self.sinks = sinks
+
+    def writeheader(self):
+        for sink in self.sinks:
+            sink.writeheader()
+
+    def writerow(self, row):
+        for sink in self.sinks:
+            sink.writerow(row)
+
+    def writerows(self, rows):
+        rows = list(rows)
+        for sink in self.sinks:
+            sink.writerows(rows)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+SINKS = {'csv': CsvSink, 'xlsx': XlsxSink, 'parquet': ParquetSink, 'jsonl': JsonlSink}
+
+
+def sink_format(filename):
+    fmt = os.path.splitext(filename)[1].lstrip('.').lower()
+    return fmt if fmt in SINKS else 'csv'
+
+
+def missing_distribution(fmt):
+    # pip distribution to install before fmt can be written, None if it can be written now
+    if fmt not in SINK_REQUIREMENTS:
+        return None
+    module, distribution = SINK_REQUIREMENTS[fmt]
+    try:
+        importlib.import_module(module)
+        return None
+    except ImportError:
+        return distribution
+
+
+def skip_message(filename, distribution):
+    return f"Skipping {filename}: {distribution} is not installed. To enable, run: pip install {distribution}"
+
+
+class OpenSink:
+    """
+    Context manager returning a csv.DictWriter-like sink (writeheader/writerow/writerows).
+    The format follows the file extension (.csv, .xlsx, .parquet, .jsonl). Given a list of
+    filenames, every row goes to all of them. Files whose writer is not installed
+    (openpyxl, pyarrow) are skipped with a message; CSV and JSONL always work.
+    filenames lists the files actually written.
+    """
+    def __init__(self, filenames, fieldnames):
+        if isinstance(filenames, str):
+            filenames = [filenames]
+        self.filenames = []
+        sinks = []
+        for filename in filenames:
+            fmt = sink_format(filename)
+            try:
+                sinks.append(SINKS[fmt](filename, fieldnames))
+                self.filenames.append(filename)
+            except ImportError as e:
+                print(skip_message(filename, SINK_REQUIREMENTS.get(fmt, (None, e.name))[1]))
+        if not sinks:
+            raise RuntimeError('No usable output format')
+        self.sink = sinks[0] if len(sinks) == 1 else MultiSink(sinks)
+
+    def __enter__(self):
+        return self.sink
+
+    def __exit__(self, exc_type, exc, tb):
+        self.sink.close()
+        return False
+
+
+def output_filenames(base, formats):
+    """
+    panorama_export_tags_<ts> + ['csv', 'xlsx'] -> ['..._<ts>.csv', '..._<ts>.xlsx'].
+    Formats whose writer is not installed are dropped with a message, so the list only
+    names files that will be written (and can be reported as saved).
+    """
+    filenames = []
+    for fmt in formats:
+        filename = f"{base}.{fmt}"
+        distribution = missing_distribution(fmt)
+        if distribution:
+            print(skip_message(filename, distribution))
+        else:
+            filenames.append(filename)
+    if not filenames:
+        print(f"None of the requested formats can be written, saving {base}.csv instead.")
+        filenames.append(f"{base}.csv")
+    return filenames
+
+
+def add_format_arguments(parser, default='csv'):
+    parser.add_argument('--format', dest='formats', action='append', choices=SINK_FORMATS,
+                        help=f"Output format, repeat for several (default: {default})")
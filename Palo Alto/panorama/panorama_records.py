@@ -0,0 +1,353 @@
+import sys
+import gzip
+import hashlib
+import xml.etree.ElementTree as ET
+
+from panorama_metrics import metrics
+
+# Object containers of a scope, as named in the config
+RECORD_KINDS = ('address', 'address-group', 'service', 'service-group', 'tag')
+RULE_POSITIONS = ('pre-rulebase', 'post-rulebase')
+ADDRESS_TYPES = ('ip-netmask', 'ip-range', 'ip-wildcard', 'fqdn')
+# Member lists of a rule entry -> RuleRecord attribute
+RULE_MEMBERS = {
+    'from': 'from_zones', 'to': 'to_zones', 'source': 'source', 'destination': 'destination',
+    'source-user': 'source_user', 'application': 'application', 'category': 'category',
+    'service': 'service', 'tag': 'tags', 'hip-profiles': 'hip_profiles',
+}
+# NAT translations that can name address objects
+TRANSLATIONS = ('source-translation', 'destination-translation', 'dynamic-destination-translation')
+
+
+def fingerprint(entry):
+    # Digest of the entry's canonical form (see canonical); the same in every process and run
+    return hashlib.blake2b(canonical(entry).encode(), digest_size=16).hexdigest()
+
+
+def canonical(elem):
+    """
+    Serialize elem for comparison: tag, attributes (sorted), text and child count of
+    every element in document order, which pins down the whole tree. Whitespace-only
+    text (indentation) is left out, so pretty-printed and compact copies of an entry
+    are equal. Separators are control characters, which XML text cannot contain.
+    """
+    parts = []
+    add = parts.append
+    for e in elem.iter():
+        add(f"\x01{e.tag}\x02{len(e)}")
+        if e.attrib:
+            add(''.join(f"\x03{key}\x04{value}" for key, value in sorted(e.attrib.items())))
+        text = e.text
+        if text and not text.isspace():
+            add('\x05' + text)
+        tail = e.tail
+        if tail and not tail.isspace() and e is not elem:
+            add('\x06' + tail)
+    return ''.join(parts)
+
+
+class RuleRecord:
+    __slots__ = ('name', 'rulebase', 'from_zones', 'to_zones', 'source', 'destination', 'source_user',
+                 'application', 'category', 'service', 'tags', 'group_tag', 'hip_profiles', 'translated',
+                 'target', 'rule_type', 'schedule', 'action', 'disabled', 'negate_source', 'negate_destination', 'fingerprint')
+
+    def __init__(self, name, rulebase):
+        self.name = name
+        # 'pre-rulebase/security', 'post-rulebase/nat', ...
+        self.rulebase = rulebase
+        self.from_zones = self.to_zones = self.source = self.destination = self.source_user = ()
+        self.application = self.category = self.service = self.tags = self.hip_profiles = self.translated = ()
+        # Tag the rule is grouped under in the policy view ('' if none)
+        self.group_tag = ''
+        # Devices the rule is pushed to ('serial' or 'serial/vsys', 'not:' prefixed if negated); () for all
+        self.target = ()
+        # 'intrazone', 'interzone' or 'universal' ('' if not set, which is universal too)
+        self.rule_type = ''
+        # Schedule object name ('' if the rule is always active)
+        self.schedule = ''
+        self.action = ''
+        self.disabled = self.negate_source = self.negate_destination = False
+        self.fingerprint = None
+
+
+class AddressRecord:
+    __slots__ = ('name', 'type', 'value', 'tags', 'fingerprint')
+
+    def __init__(self, name, type='', value='', tags=(), fingerprint=None):
+        self.name = name
+        # One of ADDRESS_TYPES, '' if the entry has none
+        self.type = type
+        self.value = value
+        self.tags = tags
+        self.fingerprint = fingerprint
+
+
+class AddressGroupRecord:
+    __slots__ = ('name', 'static', 'filter', 'tags', 'fingerprint')
+
+    def __init__(self, name, static=None, filter=None, tags=(), fingerprint=None):
+        self.name = name
+        # Member tuple of a static group, None for a dynamic one
+        self.static = static
+        self.filter = filter
+        self.tags = tags
+        self.fingerprint = fingerprint
+
+
+class ServiceRecord:
+    __slots__ = ('name', 'ports', 'tags', 'fingerprint')
+
+    def __init__(self, name, ports=(), tags=(), fingerprint=None):
+        self.name = name
+        # (('tcp', '80,8080'), ...) in config order
+        self.ports = ports
+        self.tags = tags
+        self.fingerprint = fingerprint
+
+
+class ServiceGroupRecord:
+    __slots__ = ('name', 'members', 'tags', 'fingerprint')
+
+    def __init__(self, name, members=(), tags=(), fingerprint=None):
+        self.name = name
+        self.members = members
+        self.tags = tags
+        self.fingerprint = fingerprint
+
+
+class TagRecord:
+    __slots__ = ('name', 'color', 'comments', 'fingerprint')
+
+    def __init__(self, name, color='', comments='', fingerprint=None):
+        self.name = name
+        self.color = color
+        self.comments = comments
+        self.fingerprint = fingerprint
+
+
+class ScopeRecords:
+    """
+    Parsed records of one scope (shared or a device group): rules per rulebase in
+    config order, and a name table per object kind ({kind: {name: record}}).
+    """
+    __slots__ = ('name', 'rules', 'objects')
+
+    def __init__(self, name):
+        self.name = name
+        self.rules = {}
+        self.objects = {kind: {} for kind in RECORD_KINDS}
+
+    def rule_list(self, rulebase):
+        return self.rules.get(rulebase, [])
+
+
+class RecordParser:
+    """
+    Turns config <entry> elements into records. Strings are interned and member lists
+    become tuples shared between all records with the same members, so 'any', zone names,
+    applications and tags are stored once however many rules use them. intern=False skips
+    the tables for records that are thrown away right after use; fingerprints=True also
+    digests every entry (see fingerprint) for comparing snapshots.
+    The tables are only ever added to, so one parser can be shared by worker threads.
+    """
+    def __init__(self, intern=True, fingerprints=False):
+        self.intern = intern
+        self.fingerprints = fingerprints
+        self.tuples = {}
+
+    def text(self, value):
+        if not value:
+            return ''
+        return sys.intern(value) if self.intern else value
+
+    def members(self, elem):
+        # Text of the <member> children of elem (e.g. a rule's <source>)
+        return self.members_of(tuple([m.text for m in elem if m.tag == 'member' and m.text is not None]))
+
+    def members_of(self, values):
+        # Shared copy of a tuple of values; its strings are interned once, when first seen
+        if not self.intern or not values:
+            return values
+        shared = self.tuples.get(values)
+        if shared is None:
+            shared = self.tuples[values] = tuple(map(sys.intern, values))
+        return shared
+
+    def fingerprint(self, entry):
+        return fingerprint(entry) if self.fingerprints else None
+
+    def rule(self, entry, rulebase):
+        rule = RuleRecord(self.text(entry.get('name', '')), rulebase)
+        members = self.members
+        for child in entry:
+            tag = child.tag
+            field = RULE_MEMBERS.get(tag)
+            if field:
+                values = members(child)
+                if not values and tag == 'service' and (child.text or '').strip():
+                    # NAT rules carry a single <service> value instead of a member list
+                    values = self.members_of((child.text.strip(),))
+                setattr(rule, field, values)
+            elif tag == 'action':
+                rule.action = self.text(child.text)
+            elif tag == 'group-tag':
+                rule.group_tag = self.text((child.text or '').strip())
+            elif tag == 'schedule':
+                rule.schedule = self.text((child.text or '').strip())
+            elif tag == 'rule-type':
+                rule.rule_type = self.text((child.text or '').strip())
+            elif tag == 'target':
+                rule.target = self.target(child)
+            elif tag == 'disabled':
+                rule.disabled = (child.text or '').strip().lower() == 'yes'
+            elif tag == 'negate-source':
+                rule.negate_source = (child.text or '').strip() == 'yes'
+            elif tag == 'negate-destination':
+                rule.negate_destination = (child.text or '').strip() == 'yes'
+            elif tag in TRANSLATIONS:
+                # Either a member list or a single value
+                translated = []
+                for elem in child.iter('translated-address'):
+                    names = self.members(elem)
+                    if not names and (elem.text or '').strip():
+                        names = (self.text(elem.text.strip()),)
+                    translated.extend(names)
+                rule.translated = self.members_of(rule.translated + tuple(translated))
+        rule.fingerprint = self.fingerprint(entry)
+        return rule
+
+    def target(self, elem):
+        prefix = 'not:' if (elem.findtext('negate') or '').strip() == 'yes' else ''
+        devices = []
+        for device in elem.findall('devices/entry'):
+            name = device.get('name', '')
+            vsys = [v.get('name', '') for v in device.findall('vsys/entry')]
+            if vsys:
+                devices.extend(f"{prefix}{name}/{v}" for v in vsys)
+            else:
+                devices.append(prefix + name)
+        return self.members_of(tuple(devices))
+
+    def tag_members(self, entry):
+        elem = entry.find('tag')
+        return self.members(elem) if elem is not None else ()
+
+    def address(self, entry):
+        record = AddressRecord(self.text(entry.get('name', '')), tags=self.tag_members(entry),
+                               fingerprint=self.fingerprint(entry))
+        for child in entry:
+            if child.tag in ADDRESS_TYPES and child.text:
+                record.type = child.tag
+                record.value = self.text(child.text)
+                break
+        return record
+
+    def address_group(self, entry):
+        static = entry.find('static')
+        return AddressGroupRecord(self.text(entry.get('name', '')),
+                                  static=self.members(static) if static is not None else None,
+                                  filter=entry.findtext('dynamic/filter'), tags=self.tag_members(entry),
+                                  fingerprint=self.fingerprint(entry))
+
+    def service(self, entry):
+        ports = []
+        for proto in entry.findall('protocol/*'):
+            port = proto.findtext('port')
+            if port is not None:
+                ports.append((self.text(proto.tag), self.text(port)))
+        return ServiceRecord(self.text(entry.get('name', '')), ports=tuple(ports), tags=self.tag_members(entry),
+                             fingerprint=self.fingerprint(entry))
+
+    def service_group(self, entry):
+        members = entry.find('members')
+        return ServiceGroupRecord(self.text(entry.get('name', '')),
+                                  members=self.members(members) if members is not None else (),
+                                  tags=self.tag_members(entry), fingerprint=self.fingerprint(entry))
+
+    def tag(self, entry):
+        return TagRecord(self.text(entry.get('name', '')), color=self.text(entry.findtext('color', '')),
+                         comments=entry.findtext('comments', ''), fingerprint=self.fingerprint(entry))
+
+    def object(self, kind, entry):
+        return getattr(self, kind.replace('-', '_'))(entry)
+
+    def add_objects(self, records, elem):
+        # elem: a scope element, or an API <result> holding some of its object containers
+        for kind in RECORD_KINDS:
+            table = records.objects[kind]
+            for entry in elem.findall(f'{kind}/entry'):
+                record = self.object(kind, entry)
+                table[record.name] = record
+        return records
+
+    def add_rules(self, records, elem):
+        # All rulebase types (security, nat, decryption, pbf, ...) of a scope element
+        for position in RULE_POSITIONS:
+            for rule_type in elem.findall(f'{position}/*'):
+                rulebase = f'{position}/{rule_type.tag}'
+                records.rules.setdefault(rulebase, []).extend(self.rule(entry, rulebase)
+                                                              for entry in rule_type.findall('rules/entry'))
+        return records
+
+    def scope(self, name, elem):
+        # ScopeRecords of a whole scope element (shared or a device group entry)
+        records = ScopeRecords(name)
+        self.add_rules(records, elem)
+        return self.add_objects(records, elem)
+
+
+def iter_snapshot_scopes(fileobj, parser):
+    """
+    Incrementally parse a <config> document (a bulk pull or cached snapshot) and yield
+    ScopeRecords for shared and every device group. Each entry is dropped from the tree
+    as soon as its record is made, so only the records are ever held in memory.
+    """
+    stack = []
+    current = None
+    base = 0
+    for event, elem in ET.iterparse(fileobj, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            if current is None and is_scope(stack):
+                name = 'shared' if elem.tag == 'shared' else elem.get('name', '')
+                current, base = ScopeRecords(parser.text(name)), len(stack)
+            continue
+        stack.pop()
+        if current is None:
+            if len(stack) == 1:
+                # Finished top-level section (mgt-config, readonly, ...)
+                stack[0].remove(elem)
+            continue
+        depth = len(stack) - base
+        if depth == -1:
+            yield current
+            current = None
+            stack[-1].remove(elem)
+        elif depth == 0:
+            # A finished container of the scope (rulebase, object kind, profiles, ...)
+            stack[-1].remove(elem)
+        elif elem.tag != 'entry':
+            continue
+        elif depth == 1 and stack[-1].tag in RECORD_KINDS:
+            record = parser.object(stack[-1].tag, elem)
+            current.objects[stack[-1].tag][record.name] = record
+            stack[-1].remove(elem)
+        elif depth == 3 and stack[-1].tag == 'rules' and stack[-3].tag in RULE_POSITIONS:
+            rulebase = f'{stack[-3].tag}/{stack[-2].tag}'
+            current.rules.setdefault(rulebase, []).append(parser.rule(elem, rulebase))
+            stack[-1].remove(elem)
+
+def is_scope(stack):
+    # config/shared or config/devices/entry/device-group/entry
+    if len(stack) == 2:
+        return stack[0].tag == 'config' and stack[1].tag == 'shared'
+    return len(stack) == 5 and [e.tag for e in stack] == ['config', 'devices', 'entry', 'device-group', 'entry']
+
+
+def load_snapshot_records(filename, parser=None):
+    # [ScopeRecords] of a plain or gzip-compressed config XML, shared first
+    parser = parser or RecordParser()
+    opener = gzip.open if filename.endswith('.gz') else open
+    with metrics.phase('parse'), opener(filename, 'rb') as f:
+        scopes = list(iter_snapshot_scopes(f, parser))
+    return sorted(scopes, key=lambda records: records.name != 'shared')
@@ -0,0 +1,384 @@
+import sys
+import bisect
+import argparse
+from datetime import datetime
+
+from panorama_client import add_client_arguments, get_dg_parents, scope_chain, scope_xpath
+from panorama_bulk_config import load_config
+from panorama_check_duplicate_objects import address_range
+from panorama_objects import PROTOCOLS, ObjectResolver
+from panorama_records import RULE_MEMBERS
+from panorama_snapshot_cache import add_cache_arguments, open_config_source
+from panorama_metrics import add_metrics_arguments, metrics, metrics_session
+from panorama_output import add_format_arguments, OpenSink, output_filenames
+
+FIELDNAMES = [
+    'device_group', 'rule_scope', 'rulebase', 'rule_name', 'action', 'finding',
+    'shadowed_by_scope', 'shadowed_by_rulebase', 'shadowed_by_rule', 'shadowed_by_action', 'reason'
+]
+# Match criteria compared between rules; token dimensions are plain name sets.
+# A rule only covers rules pushed to the same (or a subset of its) target devices, and
+# a universal rule covers intrazone and interzone rules but not the other way round.
+# A scheduled rule only covers rules with the same schedule (an unscheduled one is always
+# active). Negated targets ('all devices but these') are opaque and never cover a rule.
+TOKEN_DIMENSIONS = ('from', 'to', 'application', 'source-user', 'category', 'hip-profiles', 'target', 'rule-type',
+                    'schedule')
+RANGE_DIMENSIONS = ('source', 'destination', 'service')
+ANY = None
+
+
+def prompt_with_default(prompt, default):
+    value = input(f"{prompt} (default: {default}): ").strip()
+    return value if value else default
+
+
+class RangeSet:
+    """
+    A set of integer ranges per key (IP version, or protocol for services) plus opaque
+    tokens for values that cannot be expanded (fqdn, dynamic groups, unknown names).
+    Ranges are merged and kept sorted, so containment of a range is one bisect.
+    """
+    __slots__ = ('ranges', 'tokens')
+
+    def __init__(self, ranges=(), tokens=()):
+        merged = {}
+        for key, first, last in sorted(ranges):
+            spans = merged.setdefault(key, ([], []))
+            if spans[0] and first <= spans[1][-1] + 1:
+                spans[1][-1] = max(spans[1][-1], last)
+            else:
+                spans[0].append(first)
+                spans[1].append(last)
+        self.ranges = merged
+        self.tokens = frozenset(tokens)
+
+    def contains_range(self, key, first, last):
+        spans = self.ranges.get(key)
+        if not spans:
+            return False
+        i = bisect.bisect_right(spans[0], first) - 1
+        return i >= 0 and spans[1][i] >= last
+
+    def covers(self, other):
+        if not other.tokens <= self.tokens:
+            return False
+        return all(self.contains_range(key, first, last)
+                   for key, (starts, ends) in other.ranges.items()
+                   for first, last in zip(starts, ends))
+
+
+class ObjectTables:
+    """
+    Expands rule members into RangeSets on top of the shared ObjectResolver (lookup
+    order dg, parents, shared; every object resolved once per scope). Identical member
+    lists are converted once per scope as well.
+    """
+    def __init__(self, parents):
+        # Dynamic groups stay opaque: addresses registered at runtime would change the findings
+        self.resolver = ObjectResolver(parents, expand_dynamic=False)
+        self.sets = {}
+
+    def add_scope(self, records):
+        self.resolver.add_records(records)
+
+    def resolve(self, scope, dimension, names):
+        # RangeSet for a source/destination/service member list, ANY for 'any'
+        if not names or 'any' in names:
+            return ANY
+        key = (scope, dimension, tuple(names))
+        if key not in self.sets:
+            kind = 'service' if dimension == 'service' else 'address'
+            to_range = service_range if kind == 'service' else address_range
+            ranges, tokens = [], set()
+            for value in self.resolver.resolve(scope, kind, names):
+                rng = to_range(value)
+                if rng:
+                    ranges.append(rng)
+                else:
+                    # fqdn, wildcard, unresolved dynamic group or unknown name
+                    tokens.add(value)
+            self.sets[key] = RangeSet(ranges, tokens)
+        return self.sets[key]
+
+
+def service_range(value):
+    # 'tcp/8000-8100' -> ('tcp', 8000, 8100)
+    proto, _, ports = value.partition('/')
+    first, _, last = ports.partition('-')
+    if proto in PROTOCOLS and first.isdigit() and (not last or last.isdigit()):
+        return proto, int(first), int(last or first)
+    return None
+
+
+class Rule:
+    __slots__ = ('index', 'scope', 'rulebase', 'name', 'action', 'match')
+
+    def __init__(self, scope, rulebase, name, action, match):
+        self.index = -1
+        self.scope = scope
+        self.rulebase = rulebase
+        self.name = name
+        self.action = action
+        # dimension -> frozenset of names / RangeSet, or ANY
+        self.match = match
+
+
+def parse_rules(records, tables):
+    """
+    Security rules of one scope (panorama_records.ScopeRecords) as {rulebase: [Rule, ...]}.
+    Disabled rules and rules with negated source/destination are left out.
+    """
+    scope = records.name
+    rules = {}
+    for rulebase in ('pre-rulebase', 'post-rulebase'):
+        rules[rulebase] = []
+        for record in records.rule_list(f'{rulebase}/security'):
+            if record.disabled or record.negate_source or record.negate_destination:
+                continue
+            match = {}
+            for dimension in TOKEN_DIMENSIONS:
+                names = rule_tokens(record, dimension)
+                match[dimension] = ANY if not names or 'any' in names else frozenset(names)
+            for dimension in RANGE_DIMENSIONS:
+                match[dimension] = tables.resolve(scope, dimension, getattr(record, RULE_MEMBERS[dimension]))
+            rules[rulebase].append(Rule(scope, rulebase, record.name, record.action, match))
+    return rules
+
+
+def rule_tokens(record, dimension):
+    if dimension == 'target':
+        return record.target
+    if dimension == 'rule-type':
+        return () if record.rule_type in ('', 'universal') else (record.rule_type,)
+    if dimension == 'schedule':
+        return (record.schedule,) if record.schedule else ()
+    return getattr(record, RULE_MEMBERS[dimension])
+
+
+def negated_target(rule):
+    target = rule.match['target']
+    return target is not ANY and any(name.startswith('not:') for name in target)
+
+
+def covers(a, b):
+    # True if every packet matched by b's criteria is also matched by a's
+    if negated_target(a):
+        return False
+    for dimension in TOKEN_DIMENSIONS:
+        if a.match[dimension] is not ANY and (b.match[dimension] is ANY or not b.match[dimension] <= a.match[dimension]):
+            return False
+    for dimension in RANGE_DIMENSIONS:
+        if a.match[dimension] is not ANY and (b.match[dimension] is ANY or not a.match[dimension].covers(b.match[dimension])):
+            return False
+    return True
+
+
+def bucket_shift(key):
+    # Address ranges are bucketed per /16 (IPv4 and IPv6), service ports per 256 ports
+    return {4: 16, 6: 112}.get(key, 8)
+
+
+class ShadowIndex:
+    """
+    Index of the rules seen so far, for finding earlier rules that cover a rule.
+    Rule sets are Python ints used as bitsets (bit i = rule i). Every dimension keeps
+    a bitset of rules using 'any' and one per name; address and service ranges are
+    also registered in coarse buckets (ranges spanning more than MAX_SPAN_BUCKETS
+    buckets go to a 'wide' bitset). A covering rule must use 'any' or have every name
+    and a range over every bucket of the rule, so the candidates are a few ANDs/ORs;
+    only those are checked exactly (covers), in rule order.
+    """
+    MAX_SPAN_BUCKETS = 256
+
+    def __init__(self):
+        self.rules = []
+        self.any = {d: 0 for d in TOKEN_DIMENSIONS + RANGE_DIMENSIONS}
+        self.postings = {d: {} for d in TOKEN_DIMENSIONS + RANGE_DIMENSIONS}
+        self.buckets = {d: {} for d in RANGE_DIMENSIONS}
+        self.wide = {d: 0 for d in RANGE_DIMENSIONS}
+
+    def add(self, rule):
+        rule.index = len(self.rules)
+        self.rules.append(rule)
+        bit = 1 << rule.index
+        for dimension in TOKEN_DIMENSIONS + RANGE_DIMENSIONS:
+            match = rule.match[dimension]
+            if match is ANY:
+                self.any[dimension] |= bit
+                continue
+            if dimension == 'target' and negated_target(rule):
+                # Never a candidate: a rule pushed to all but some devices covers nothing here
+                continue
+            postings = self.postings[dimension]
+            for name in (match if dimension in TOKEN_DIMENSIONS else match.tokens):
+                postings[name] = postings.get(name, 0) | bit
+            if dimension in TOKEN_DIMENSIONS:
+                continue
+            buckets = self.buckets[dimension]
+            for key, (starts, ends) in match.ranges.items():
+                shift = bucket_shift(key)
+                for first, last in zip(starts, ends):
+                    if (last >> shift) - (first >> shift) >= self.MAX_SPAN_BUCKETS:
+                        self.wide[dimension] |= bit
+                        continue
+                    for bucket in range(first >> shift, (last >> shift) + 1):
+                        buckets[(key, bucket)] = buckets.get((key, bucket), 0) | bit
+
+    def allowed(self, dimension, rule, everything):
+        # Bitset of earlier rules that could cover rule in this dimension
+        match = rule.match[dimension]
+        if match is ANY:
+            return self.any[dimension]
+        mask = everything
+        postings = self.postings[dimension]
+        for name in (match if dimension in TOKEN_DIMENSIONS else match.tokens):
+            mask &= postings.get(name, 0)
+            if not mask:
+                return self.any[dimension]
+        if dimension in RANGE_DIMENSIONS:
+            buckets, wide = self.buckets[dimension], self.wide[dimension]
+            for key, (starts, ends) in match.ranges.items():
+                shift = bucket_shift(key)
+                for first, last in zip(starts, ends):
+                    for bucket in range(first >> shift, min(last >> shift, (first >> shift) + 3) + 1):
+                        mask &= buckets.get((key, bucket), 0) | wide
+                    if not mask:
+                        return self.any[dimension]
+        return self.any[dimension] | mask
+
+    def shadowing_rule(self, rule):
+        everything = (1 << len(self.rules)) - 1
+        candidates = everything
+        for dimension in TOKEN_DIMENSIONS + RANGE_DIMENSIONS:
+            candidates &= self.allowed(dimension, rule, everything)
+            if not candidates:
+                return None
+        # Lowest set bit first: earliest rule wins
+        while candidates:
+            lowest = candidates & -candidates
+            earlier = self.rules[lowest.bit_length() - 1]
+            if covers(earlier, rule):
+                return earlier
+            candidates ^= lowest
+        return None
+
+
+def evaluation_order(dg, parents, rules_by_scope):
+    # Pre rules from shared down to the device group, then post rules back up to shared
+    chain = scope_chain(dg, parents)
+    ordered = []
+    for scope in reversed(chain):
+        ordered.extend(rules_by_scope.get(scope, {}).get('pre-rulebase', []))
+    for scope in chain:
+        ordered.extend(rules_by_scope.get(scope, {}).get('post-rulebase', []))
+    return ordered
+
+
+def analyze_rules(dg, ordered):
+    """
+    Yield a finding row for every rule fully covered by an earlier rule: 'shadowed'
+    if the actions differ (the later rule never matches), 'redundant' if they are the same.
+    """
+    index = ShadowIndex()
+    for rule in ordered:
+        earlier = index.shadowing_rule(rule)
+        if earlier is None:
+            index.add(rule)
+            continue
+        same_action = earlier.action == rule.action
+        yield {
+            'device_group': dg,
+            'rule_scope': rule.scope,
+            'rulebase': rule.rulebase,
+            'rule_name': rule.name,
+            'action': rule.action,
+            'finding': 'redundant' if same_action else 'shadowed',
+            'shadowed_by_scope': earlier.scope,
+            'shadowed_by_rulebase': earlier.rulebase,
+            'shadowed_by_rule': earlier.name,
+            'shadowed_by_action': earlier.action,
+            'reason': (f"'{earlier.name}' ({earlier.action}) matches all of this rule's zones, addresses, "
+                       f"applications, services, users, categories, HIP profiles, target devices and schedule"
+                       + ("; same action, this rule can be removed" if same_action
+                          else f"; this rule ({rule.action}) is never hit")),
+        }
+
+
+def fetch_scope(client, scope, parser):
+    # Runs on a worker thread; returns the parsed records of one scope (or None on failure)
+    print(f"Reading rules and objects for: {scope}")
+    try:
+        elem = client.config_get_element(scope_xpath(scope)).find('result/*')
+        return parser.scope(scope, elem) if elem is not None else None
+    except Exception as e:
+        print(f"Failed to read config for {scope}: {e}")
+        return None
+
+
+def analyze_shadowing(client, dgs, filename):
+    """
+    client can be a PanoramaClient or any config source with the same interface (e.g. LocalConfig).
+    Each device group is analyzed with its effective rule order (shared and parent rules included).
+    Returns the number of findings.
+    """
+    parents = get_dg_parents(client)
+    scopes = []
+    for dg in dgs:
+        for scope in scope_chain(dg, parents):
+            if scope not in scopes:
+                scopes.append(scope)
+    tables = ObjectTables(parents)
+    parser = tables.resolver.parser
+    scope_records = [records for records in client.map_ordered(lambda scope: fetch_scope(client, scope, parser), scopes)
+                     if records is not None]
+    for records in scope_records:
+        tables.add_scope(records)
+    with metrics.phase('parse_rules'):
+        rules_by_scope = {records.name: parse_rules(records, tables) for records in scope_records}
+
+    findings = 0
+    with OpenSink(filename, FIELDNAMES) as sink:
+        writer = metrics.wrap_writer(sink)
+        writer.writeheader()
+        for dg in dgs:
+            with metrics.phase('analyze'):
+                rows = list(analyze_rules(dg, evaluation_order(dg, parents, rules_by_scope)))
+            writer.writerows(rows)
+            findings += len(rows)
+    return findings
+
+
+def main(client, formats=None):
+    device_group = prompt_with_default("Enter device group to analyze (or leave blank for all)", "all")
+    if device_group == "all":
+        try:
+            dgs = client.get_device_groups()
+        except Exception as e:
+            print(f"Failed to parse device groups: {e}")
+            sys.exit(1)
+    else:
+        dgs = [device_group]
+
+    now = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filenames = output_filenames(f"panorama_rule_shadowing_{now}", formats or ['csv'])
+    findings = analyze_shadowing(client, dgs, filenames)
+    print(f"\nAnalysis complete. {findings} shadowed or redundant rules saved to {', '.join(filenames)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Find security rules shadowed by or redundant with earlier rules.')
+    parser.add_argument('--config', metavar='XML', help='Analyze a saved config XML instead of querying Panorama')
+    add_cache_arguments(parser)
+    add_client_arguments(parser)
+    add_metrics_arguments(parser)
+    add_format_arguments(parser)
+    args = parser.parse_args()
+
+    print("=== Panorama Rule Shadowing Analyzer ===\n")
+    if args.config:
+        client = load_config(args.config)
+    else:
+        print("Please enter your Panorama credentials.")
+        panorama_host = input("Enter Panorama IP or hostname: ").strip()
+        client = open_config_source(panorama_host, args)
+    with metrics_session(args, 'panorama_rule_shadowing'):
+        main(client, formats=args.formats)
@@ -0,0 +1,165 @@
+import os
+import re
+import sys
+import gzip
+import time
+import xml.etree.ElementTree as ET
+
+from panorama_client import DEFAULT_RATE, PanoramaClient, prompt_login
+from panorama_bulk_config import LocalConfig, fetch_bulk_config
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'panorama_snapshots')
+DEFAULT_MAX_AGE_DAYS = 7
+DEFAULT_MAX_MB = 512
+SNAPSHOT_SUFFIX = '.xml.gz'
+
+
+def get_config_version(client):
+    """
+    Identify the running config by the ID of the most recent commit job.
+    Returns None if no commit job can be found. Candidate changes that have not
+    been committed yet do not change the version, which is why cached snapshots
+    hold the running config; use --no-cache to see the candidate config.
+    """
+    try:
+        root = ET.fromstring(client.op('<show><jobs><all></all></jobs></show>'))
+    except Exception as e:
+        print(f"Failed to read commit jobs: {e}")
+        return None
+    job_ids = [
+        int(job.findtext('id', '0')) for job in root.findall('.//job')
+        if 'commit' in job.findtext('type', '').lower() and job.findtext('id', '').isdigit()
+    ]
+    return f"job{max(job_ids)}" if job_ids else None
+
+
+class SnapshotCache:
+    """
+    Gzip-compressed bulk config snapshots on disk, one file per (host, config version).
+    Snapshots older than max_age_days are dropped, then the oldest ones until the
+    cache fits in max_mb.
+    """
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+                 max_mb: float = DEFAULT_MAX_MB):
+        self.cache_dir = cache_dir
+        self.max_age = max_age_days * 86400
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _host_prefix(self, panorama_host):
+        return re.sub(r'[^A-Za-z0-9_.-]', '_', panorama_host) + '__'
+
+    def _path(self, panorama_host, version):
+        return os.path.join(self.cache_dir, f"{self._host_prefix(panorama_host)}{version}{SNAPSHOT_SUFFIX}")
+
+    def _snapshots(self, prefix=''):
+        # (mtime, size, path) for every snapshot, oldest first
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(prefix) and name.endswith(SNAPSHOT_SUFFIX):
+                path = os.path.join(self.cache_dir, name)
+                st = os.stat(path)
+                entries.append((st.st_mtime, st.st_size, path))
+        return sorted(entries)
+
+    def _load(self, path):
+        with gzip.open(path, 'rb') as f:
+            return LocalConfig(ET.parse(f).getroot())
+
+    def get(self, panorama_host, version):
+        path = self._path(panorama_host, version)
+        if not os.path.isfile(path):
+            return None
+        return self._load(path)
+
+    def history(self, panorama_host):
+        # Snapshot paths for the host, oldest first
+        return [path for _, _, path in self._snapshots(self._host_prefix(panorama_host))]
+
+    def latest(self, panorama_host):
+        snapshots = self._snapshots(self._host_prefix(panorama_host))
+        if not snapshots:
+            return None
+        return self._load(snapshots[-1][2])
+
+    def put(self, panorama_host, version, config: ET.Element):
+        path = self._path(panorama_host, version)
+        tmp_path = path + '.tmp'
+        with gzip.open(tmp_path, 'wb', compresslevel=6) as f:
+            ET.ElementTree(config).write(f, encoding='utf-8', xml_declaration=True)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        now = time.time()
+        snapshots = []
+        for mtime, size, path in self._snapshots():
+            if now - mtime > self.max_age:
+                os.remove(path)
+            else:
+                snapshots.append((mtime, size, path))
+        total = sum(size for _, size, _ in snapshots)
+        for _, size, path in snapshots:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+
+def cached_config(client, cache: SnapshotCache) -> LocalConfig:
+    # Serve the bulk config from disk when the commit version is unchanged, else pull and store it.
+    # The version names a commit, so the snapshot stored under it is the running config; without
+    # a version nothing is cached and the candidate config is read as with --no-cache.
+    version = get_config_version(client)
+    if version:
+        config = cache.get(client.panorama_host, version)
+        if config is not None:
+            print(f"Config unchanged since last run ({version}), using cached snapshot.")
+            return config
+    root = fetch_bulk_config(client, 'show' if version else 'get')
+    if version:
+        cache.put(client.panorama_host, version, root)
+    return LocalConfig(root)
+
+
+def add_cache_arguments(parser):
+    parser.add_argument('--offline', action='store_true',
+                        help='Use the latest cached snapshot for the host; no API calls are made')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always query Panorama directly and bypass the snapshot cache')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help=f'Snapshot cache directory (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--cache-max-age-days', type=float, default=DEFAULT_MAX_AGE_DAYS,
+                        help=f'Evict snapshots older than this (default: {DEFAULT_MAX_AGE_DAYS})')
+    parser.add_argument('--cache-max-mb', type=float, default=DEFAULT_MAX_MB,
+                        help=f'Evict oldest snapshots beyond this total size (default: {DEFAULT_MAX_MB})')
+
+
+def open_config_source(panorama_host, args, client=None):
+    """
+    Return the object the exporters read config from, based on the cache arguments:
+    a cached LocalConfig (--offline), a live PanoramaClient (--no-cache),
+    or a LocalConfig refreshed only when the config version changed (default).
+    An already logged-in client is used as is; otherwise the user is prompted to log in.
+    """
+    if args.no_cache and not args.offline:
+        if client is None:
+            client = PanoramaClient(panorama_host, rate=getattr(args, 'rate', DEFAULT_RATE))
+            prompt_login(client)
+        return client
+    cache = SnapshotCache(args.cache_dir, args.cache_max_age_days, args.cache_max_mb)
+    if args.offline:
+        config = cache.latest(panorama_host)
+        if config is None:
+            print(f"No cached snapshot for {panorama_host} in {args.cache_dir}. Run once without --offline.")
+            sys.exit(1)
+        print("Offline mode: using latest cached snapshot.")
+        return config
+    if client is None:
+        client = PanoramaClient(panorama_host, rate=getattr(args, 'rate', DEFAULT_RATE))
+        prompt_login(client)
+    try:
+        return cached_config(client, cache)
+    except Exception as e:
+        print(f"Snapshot cache unavailable ({e}), querying Panorama directly.")
+        return client
@@ -0,0 +1,198 @@
+import sys
+import bisect
+import argparse
+from datetime import datetime
+from collections import Counter
+
+from panorama_check_duplicate_objects import address_value
+from panorama_export_policies import RULEBASES, record_to_row
+from panorama_export_tags import record_to_row as tag_record_to_row
+from panorama_records import RecordParser, load_snapshot_records
+from panorama_snapshot_cache import DEFAULT_CACHE_DIR, SnapshotCache
+from panorama_metrics import add_metrics_arguments, metrics, metrics_session
+from panorama_output import add_format_arguments, OpenSink, output_filenames
+
+FIELDNAMES = [
+    'device_group', 'object_type', 'rulebase', 'name', 'change', 'changed_fields', 'old_value', 'new_value'
+]
+CHANGES = ('added', 'removed', 'modified', 'moved')
+# Fields named in the report for modified entries (as exported by the policy, tag and duplicate scripts)
+RULE_FIELDS = ['source', 'destination', 'application', 'service', 'action', 'enabled']
+TAG_FIELDS = ['color', 'comments']
+# Modified, but none of the exported fields changed (zones, profiles, description, attributes, ...)
+OTHER_FIELDS = 'other settings'
+
+
+def load_snapshot(path):
+    # Records only, with a fingerprint of every entry; the XML tree is never held in full.
+    # Fingerprints digest all elements, attributes and text, ignoring indentation, so snapshots
+    # written by different tools or runs compare equal unless the config itself differs.
+    return load_snapshot_records(path, RecordParser(fingerprints=True))
+
+
+def snapshot_sections(scopes):
+    """
+    Split a snapshot's ScopeRecords into sections: {(scope, object_type, rulebase): [(name, fingerprint, record), ...]}.
+    Rules keep their rulebase order; tags and address objects are unordered.
+    """
+    sections = {}
+    for records in scopes:
+        for rulebase in RULEBASES:
+            sections[(records.name, 'rule', rulebase)] = [(r.name, r.fingerprint, r)
+                                                          for r in records.rule_list(rulebase)]
+        for object_type in ('tag', 'address'):
+            sections[(records.name, object_type, '')] = [(r.name, r.fingerprint, r)
+                                                         for r in records.objects[object_type].values()]
+    return sections
+
+
+def increasing_subsequence(seq):
+    """
+    Indexes of one longest strictly increasing subsequence of seq (patience sorting, O(n log n)).
+    """
+    tails, tail_index, prev = [], [], [-1] * len(seq)
+    for i, value in enumerate(seq):
+        k = bisect.bisect_left(tails, value)
+        if k:
+            prev[i] = tail_index[k - 1]
+        if k == len(tails):
+            tails.append(value)
+            tail_index.append(i)
+        else:
+            tails[k] = value
+            tail_index[k] = i
+    keep = set()
+    i = tail_index[-1] if tail_index else -1
+    while i >= 0:
+        keep.add(i)
+        i = prev[i]
+    return keep
+
+
+def diff_section(old, new, ordered):
+    """
+    Yield (change, name, old entry, new entry, old position, new position) for one section.
+    Entries are matched by name. For ordered sections, the rules that kept their relative
+    order are the longest increasing run of old positions; every other common rule moved.
+    """
+    old_index = {name: (pos, fp, entry) for pos, (name, fp, entry) in enumerate(old)}
+    new_names = {name for name, _, _ in new}
+    for pos, (name, _, entry) in enumerate(old):
+        if name not in new_names:
+            yield 'removed', name, entry, None, pos, None
+    common = []
+    for pos, (name, fp, entry) in enumerate(new):
+        match = old_index.get(name)
+        if match is None:
+            yield 'added', name, None, entry, None, pos
+            continue
+        if match[1] != fp:
+            yield 'modified', name, match[2], entry, match[0], pos
+        common.append((match[0], pos, name))
+    if ordered:
+        keep = increasing_subsequence([old_pos for old_pos, _, _ in common])
+        for i, (old_pos, new_pos, name) in enumerate(common):
+            if i not in keep:
+                yield 'moved', name, old_index[name][2], None, old_pos, new_pos
+
+
+def entry_fields(object_type, record):
+    if object_type == 'rule':
+        row = record_to_row('', record)
+        return {f: row[f] for f in RULE_FIELDS}
+    if object_type == 'tag':
+        row = tag_record_to_row('', record)
+        return {f: row[f] for f in TAG_FIELDS}
+    return {'value': address_value(record)}
+
+
+def change_row(scope, object_type, rulebase, change, name, old_entry, new_entry, old_pos, new_pos):
+    row = {'device_group': scope, 'object_type': object_type, 'rulebase': rulebase, 'name': name, 'change': change}
+    if change == 'moved':
+        row['old_value'] = f"position {old_pos + 1}"
+        row['new_value'] = f"position {new_pos + 1}"
+    elif change == 'modified':
+        # Field values are only extracted for the few entries that changed
+        old_fields = entry_fields(object_type, old_entry)
+        new_fields = entry_fields(object_type, new_entry)
+        changed = [f for f in old_fields if old_fields[f] != new_fields[f]]
+        row['changed_fields'] = ','.join(changed) or OTHER_FIELDS
+        row['old_value'] = '; '.join(f"{f}={old_fields[f]}" for f in changed)
+        row['new_value'] = '; '.join(f"{f}={new_fields[f]}" for f in changed)
+    elif object_type == 'address':
+        row['old_value' if old_entry is not None else 'new_value'] = address_value(
+            old_entry if old_entry is not None else new_entry)
+    return row
+
+
+def diff_snapshots(old_scopes, new_scopes):
+    """
+    Compare two snapshots given as ScopeRecords (see load_snapshot). Returns the change rows,
+    grouped by device group (shared first, then the new snapshot's order, then removed device groups).
+    """
+    old_sections = snapshot_sections(old_scopes)
+    new_sections = snapshot_sections(new_scopes)
+    rows = []
+    with metrics.phase('diff'):
+        for key in list(new_sections) + [k for k in old_sections if k not in new_sections]:
+            scope, object_type, rulebase = key
+            for change in diff_section(old_sections.get(key, []), new_sections.get(key, []), object_type == 'rule'):
+                rows.append(change_row(scope, object_type, rulebase, *change))
+    return rows
+
+
+def print_summary(rows):
+    counts = Counter((row['device_group'], row['change']) for row in rows)
+    scopes = list(dict.fromkeys(row['device_group'] for row in rows))
+    if not scopes:
+        print("No changes.")
+        return
+    width = max(len('Device group'), *(len(s) for s in scopes))
+    print(f"{'Device group':<{width}}  " + '  '.join(f"{c:>8}" for c in CHANGES))
+    for scope in scopes:
+        print(f"{scope:<{width}}  " + '  '.join(f"{counts[(scope, c)]:>8}" for c in CHANGES))
+
+
+def main(old_path, new_path, formats=None):
+    print(f"Comparing {old_path}\n     with {new_path}\n")
+    try:
+        old_scopes = load_snapshot(old_path)
+        new_scopes = load_snapshot(new_path)
+    except Exception as e:
+        print(f"Failed to load snapshot: {e}")
+        sys.exit(1)
+    rows = diff_snapshots(old_scopes, new_scopes)
+    print_summary(rows)
+
+    now = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filenames = output_filenames(f"panorama_snapshot_diff_{now}", formats or ['csv'])
+    with OpenSink(filenames, FIELDNAMES) as sink:
+        writer = metrics.wrap_writer(sink)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"\nDiff complete. {len(rows)} changes saved to {', '.join(filenames)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Report rules, tags and address objects added, removed, modified or reordered between two '
+                    'config snapshots (.xml or .xml.gz, e.g. from the snapshot cache).')
+    parser.add_argument('old', nargs='?', help='Older snapshot')
+    parser.add_argument('new', nargs='?', help='Newer snapshot')
+    parser.add_argument('--host', help='Compare the two newest cached snapshots of this Panorama instead')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help=f'Snapshot directory (default: {DEFAULT_CACHE_DIR})')
+    add_metrics_arguments(parser)
+    add_format_arguments(parser)
+    args = parser.parse_args()
+
+    if args.host:
+        history = SnapshotCache(args.cache_dir).history(args.host)
+        if len(history) < 2:
+            print(f"Need two cached snapshots for {args.host} in {args.cache_dir}, found {len(history)}.")
+            sys.exit(1)
+        args.old, args.new = history[-2:]
+    elif not (args.old and args.new):
+        parser.error('give two snapshot files, or --host')
+
+    with metrics_session(args, 'panorama_snapshot_diff'):
+        main(args.old, args.new, formats=args.formats)
@@ -1,19 +1,55 @@
+import os
+import re
+import sys
+import csv
+import time
+import argparse
+import tempfile
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
 from fpdf import FPDF
 from fpdf.enums import XPos, YPos
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterable, List, Optional, Any, Tuple
+
+from run_metrics import add_metrics_arguments, instrumented_run
+
+OPEN_GROUP_FILES = 128
+
+class CharWidths(dict):
+    """Character widths of the current font, measured once per character."""
+    def __init__(self, pdf: FPDF):
+        super().__init__()
+        self.pdf = pdf
+
+    def __missing__(self, char: str) -> float:
+        width = self[char] = self.pdf.get_string_width(char)
+        return width
+
+# One width table per font and size, shared by every document this process renders
+_char_widths: Dict[Tuple[str, float], CharWidths] = {}
+
+def char_widths(pdf: FPDF) -> CharWidths:
+    key = (pdf.current_font.fontkey, pdf.font_size_pt)
+    if key not in _char_widths:
+        _char_widths[key] = CharWidths(pdf)
+    widths = _char_widths[key]
+    widths.pdf = pdf
+    return widths
 
 class CustomPDF(FPDF):
     """
     Generic PDF class for creating structured documents with cover page, sections, and tables.
     Extend or modify as needed for your document structure.
     """
+    doc_title = 'Document Title'
+
     def header(self):
         if self.page_no() == 1:
             return  # No header on cover page
         self.set_font('Helvetica', 'B', 12)
         self.set_text_color(40, 40, 40)
-        # Edit the document title below or pass as an argument if needed
-        self.cell(0, 10, 'Document Title', new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
+        # Edit doc_title above or pass doc_title to generate_pdf_document
+        self.cell(0, 10, self.doc_title, new_x=XPos.LMARGIN, new_y=YPos.NEXT, align='C')
         self.ln(2)
 
     def footer(self):
@@ -49,41 +85,122 @@ class CustomPDF(FPDF):
         self.multi_cell(0, 8, body)
         self.ln(2)
 
-    def add_table(self, table_data: List[Dict[str, str]], col_widths: List[int], col_names: List[str]):
+    def add_table(self, table_data: Iterable[Dict[str, str]], col_widths: List[int], col_names: List[str]):
         """
         Add a table to the PDF.
-        table_data: List of dicts, each dict is a row with column names as keys.
+        table_data: List (or any iterable) of dicts, each dict is a row with column names as keys.
         col_widths: List of column widths (ints).
         col_names: List of column names (headers, must match dict keys).
         """
+        self.add_table_rows(table_data, col_widths, col_names)
+
+    def table_header(self, col_widths: List[int], col_names: List[str], height: float = 10):
         self.set_font('Helvetica', 'B', 11)
         self.set_fill_color(220, 230, 241)
-        row_height = 10
-        # Header
-        for i, col_name in enumerate(col_names):
-            self.cell(col_widths[i], row_height, col_name, border=1, fill=True, align='C')
-        self.ln(row_height)
-        self.set_font('Helvetica', '', 10)
-        # Rows
-        for row in table_data:
-            for i, col_name in enumerate(col_names):
-                self.multi_cell(col_widths[i], row_height, row.get(col_name, ''), border=1, align='L', max_line_height=self.font_size)
-                self.set_xy(self.get_x() + col_widths[i], self.get_y() - row_height)
-            self.ln(row_height)
+        for width, col_name in zip(col_widths, col_names):
+            self.cell(width, height, col_name, border=1, fill=True, align='C')
+        self.ln(height)
+
+    def pdf_text(self, value: Any) -> str:
+        text = '' if value is None else str(value)
+        if not self.is_ttf_font:
+            # Core fonts only cover latin-1
+            text = text.encode('latin-1', 'replace').decode('latin-1')
+        return text
+
+    @staticmethod
+    def wrap_text(text: str, width: float, widths: 'CharWidths') -> List[str]:
+        # Single pass word wrap, breaking after spaces or commas (member lists), else anywhere
+        lines = []
+        for paragraph in text.split('\n'):
+            if sum(map(widths.__getitem__, paragraph)) <= width:
+                lines.append(paragraph)
+                continue
+            start, used, brk, used_at_brk = 0, 0.0, -1, 0.0
+            for i, char in enumerate(paragraph):
+                char_width = widths[char]
+                # After a break at a space, the carried-over text plus char can still be too
+                # wide; the second pass then breaks right before char
+                while used + char_width > width and i > start:
+                    if brk > start:
+                        lines.append(paragraph[start:brk].strip())
+                        start, used = brk, used - used_at_brk
+                    else:
+                        lines.append(paragraph[start:i])
+                        start, used = i, 0.0
+                    brk = -1
+                used += char_width
+                if char in ' ,':
+                    brk, used_at_brk = i + 1, used
+            lines.append(paragraph[start:].strip())
+        return lines
+
+    def body_font(self, font_size: float):
+        self.set_font('Helvetica', '', font_size)
+        self.set_text_color(0, 0, 0)
+        self.set_draw_color(0, 0, 0)
+
+    def add_table_rows(self, rows: Iterable[Dict[str, str]], col_widths: List[int], col_names: List[str],
+                       font_size: float = 10, line_height: float = 5) -> int:
+        """
+        Render a table from any iterable of row dicts, one row at a time, so memory does not
+        grow with the row count. Each row is wrapped and measured once with cached character
+        widths, then drawn as cell borders (rect) and text lines (text) instead of multi_cell(),
+        which would measure every cell again; at a page break the header is repeated. Rows
+        taller than a page are cut off with '...'. Returns the number of rows rendered.
+        """
+        padding = self.c_margin
+        bottom = self.h - self.b_margin
+        self.table_header(col_widths, col_names)
+        self.body_font(font_size)
+        widths = char_widths(self)
+        # Only a row on a fresh page may be cut to fit; anywhere else it moves to a new page
+        fresh_page = False
+        count = 0
+        for row in rows:
+            cells = [self.wrap_text(self.pdf_text(row.get(col_name, '')), width - 2 * padding, widths)
+                     for width, col_name in zip(col_widths, col_names)]
+            lines = max(len(cell) for cell in cells)
+            height = lines * line_height + 2 * padding
+            if self.get_y() + height > bottom and not fresh_page:
+                self.add_page()
+                self.table_header(col_widths, col_names)
+                self.body_font(font_size)
+                fresh_page = True
+            max_lines = max(1, int((bottom - self.get_y() - 2 * padding) // line_height))
+            if lines > max_lines:
+                cells = [cell[:max_lines - 1] + ['...'] if len(cell) > max_lines else cell for cell in cells]
+                lines = max_lines
+                height = lines * line_height + 2 * padding
+            x, y = self.l_margin, self.get_y()
+            for width, cell in zip(col_widths, cells):
+                self.rect(x, y, width, height)
+                for i, line in enumerate(cell):
+                    if line:
+                        self.text(x + padding, y + padding + (i + 0.75) * line_height, line)
+                x += width
+            self.set_xy(self.l_margin, y + height)
+            fresh_page = False
+            count += 1
+        return count
 
 def generate_pdf_document(
     output_path: str,
     title: str,
     subtitle: str,
     sections: List[Dict[str, str]],
-    tables: Optional[List[Optional[Dict[str, Any]]]] = None
-) -> None:
+    tables: Optional[List[Optional[Dict[str, Any]]]] = None,
+    doc_title: str = CustomPDF.doc_title,
+    orientation: str = 'P',
+    verbose: bool = True
+) -> int:
     """
-    Generate a generic PDF document.
+    Generate a generic PDF document and return its page count.
     sections: List of dicts with 'title' and 'body' keys.
-    tables: List of dicts with 'data', 'col_widths', and 'col_names' keys (optional).
+    tables: List of dicts with 'data' (rows), 'col_widths', and 'col_names' keys (optional).
     """
-    pdf = CustomPDF()
+    pdf = CustomPDF(orientation=orientation)
+    pdf.doc_title = doc_title
     pdf.set_auto_page_break(auto=True, margin=18)
     pdf.cover_page(title=title, subtitle=subtitle)
     pdf.add_page()
@@ -97,8 +214,8 @@ def generate_pdf_document(
                 table and isinstance(table, dict)
                 and 'data' in table and 'col_widths' in table and 'col_names' in table
             ):
-                # Cast to correct types for linter
-                data = table['data'] if isinstance(table['data'], list) else []
+                # Rows can be a list or any iterable (e.g. a csv.DictReader), rendered as they come
+                data = table['data'] if table['data'] is not None else []
                 col_widths = table['col_widths'] if isinstance(table['col_widths'], list) else []
                 col_names = table['col_names'] if isinstance(table['col_names'], list) else []
                 pdf.add_table(
@@ -107,10 +224,192 @@ def generate_pdf_document(
                     col_names=col_names
                 )
     pdf.output(output_path)
-    print(f"PDF created successfully at {output_path}")
+    if verbose:
+        print(f"PDF created successfully at {output_path}")
+    return pdf.page
+
+def safe_filename(value: str) -> str:
+    return re.sub(r'[^\w.-]+', '_', value).strip('_') or 'empty'
+
+def unique_filenames(groups: List[str]) -> Dict[str, str]:
+    # One PDF name per group; groups that sanitize to the same name ('a b', 'a_b') get a
+    # numeric suffix. Compared case-insensitively for Windows and macOS file systems.
+    names, taken = {}, set()
+    for group in groups:
+        base = safe_filename(group)
+        name, n = f"{base}.pdf", 1
+        while name.lower() in taken:
+            n += 1
+            name = f"{base}_{n}.pdf"
+        taken.add(name.lower())
+        names[group] = name
+    return names
+
+def partition_csv(csv_path: str, group_by: str, tmpdir: str) -> Tuple[List[str], List[Tuple[str, str, int]]]:
+    """
+    Split a CSV into one temporary CSV per value of group_by in a single pass.
+    Returns (columns, [(group, path, rows), ...]) in first-seen order. At most
+    OPEN_GROUP_FILES files are open at once; others are reopened for appending.
+    """
+    groups: Dict[str, List[Any]] = {}
+    open_files: Dict[str, Any] = {}
+    with open(csv_path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(f)
+        columns = list(reader.fieldnames or [])
+        if group_by not in columns:
+            raise ValueError(f"Column '{group_by}' not found in {csv_path}")
+        try:
+            for row in reader:
+                group = row.get(group_by) or ''
+                if group not in groups:
+                    groups[group] = [os.path.join(tmpdir, f"{len(groups)}.csv"), 0]
+                path = groups[group][0]
+                if group not in open_files:
+                    if len(open_files) >= OPEN_GROUP_FILES:
+                        open_files.pop(next(iter(open_files)))[0].close()
+                    new = groups[group][1] == 0
+                    handle = open(path, 'a', encoding='utf-8', newline='')
+                    writer = csv.DictWriter(handle, fieldnames=columns)
+                    if new:
+                        writer.writeheader()
+                    open_files[group] = (handle, writer)
+                open_files[group][1].writerow(row)
+                groups[group][1] += 1
+        finally:
+            for handle, _ in open_files.values():
+                handle.close()
+    return columns, [(group, path, rows) for group, (path, rows) in groups.items()]
+
+# Per-process batch settings, set once by init_batch_worker
+_batch_template: Dict[str, Any] = {}
+
+def init_batch_worker(template: Dict[str, Any]) -> None:
+    # Runs once per worker process: keep the layout and measure the table font once
+    _batch_template.update(template)
+    pdf = CustomPDF(orientation=template['orientation'])
+    pdf.add_page()
+    pdf.set_font('Helvetica', '', 10)
+    widths = char_widths(pdf)
+    for code in range(32, 256):
+        widths[chr(code)]
+
+def render_group(group: str, rows_path: str, rows: int, output_path: str) -> Tuple[str, int, int, float, str]:
+    # Worker task: one document per group; returns (group, rows, pages, seconds, file name)
+    start = time.perf_counter()
+    template = _batch_template
+    with open(rows_path, 'r', encoding='utf-8', newline='') as f:
+        pages = generate_pdf_document(
+            output_path=output_path,
+            title=template['title'].format(group=group),
+            subtitle=template['subtitle'].format(group=group, rows=rows),
+            sections=[{'title': template['section'], 'body': f"{rows} rows where {template['group_by']} is {group}."}],
+            tables=[{'data': csv.DictReader(f), 'col_widths': template['col_widths'],
+                     'col_names': template['columns']}],
+            doc_title=template['title'].format(group=group),
+            orientation=template['orientation'],
+            verbose=False
+        )
+    return group, rows, pages, time.perf_counter() - start, os.path.basename(output_path)
+
+def generate_batch_pdfs(
+    csv_path: str,
+    group_by: str,
+    output_dir: str,
+    columns: Optional[List[str]] = None,
+    col_widths: Optional[List[float]] = None,
+    title: str = '{group}',
+    orientation: str = 'L',
+    workers: Optional[int] = None,
+    run: Any = None
+) -> List[Tuple[str, int, int, float, str]]:
+    """
+    Render one PDF per value of group_by (e.g. device_group) in a CSV export, across
+    a process pool. The CSV is split into per-group files first, so workers only read
+    their own rows. Returns (group, rows, pages, seconds, file name) per document.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix='pdf_batch_') as tmpdir:
+        with run.phase('partition') if run is not None else nullcontext():
+            all_columns, groups = partition_csv(csv_path, group_by, tmpdir)
+        columns = columns or [c for c in all_columns if c != group_by]
+        if not col_widths:
+            usable = (297 if orientation == 'L' else 210) - 20
+            col_widths = [usable / len(columns)] * len(columns)
+        template = {
+            'title': title, 'subtitle': f"{{rows}} rows from {os.path.basename(csv_path)}",
+            'section': 'Details', 'group_by': group_by, 'columns': columns,
+            'col_widths': list(col_widths), 'orientation': orientation,
+        }
+        filenames = unique_filenames([group for group, _, _ in groups])
+        results = []
+        with run.phase('render') if run is not None else nullcontext(), \
+                ProcessPoolExecutor(max_workers=workers, initializer=init_batch_worker, initargs=(template,)) as pool:
+            futures = [pool.submit(render_group, group, path, rows,
+                                   os.path.join(output_dir, filenames[group]))
+                       for group, path, rows in groups]
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    print(f"Failed to render a document: {e}")
+    if run is not None:
+        run.count('documents', len(results))
+        run.count('rows', sum(r[1] for r in results))
+        run.count('pages', sum(r[2] for r in results))
+    return results
+
+def print_batch_report(results: List[Tuple[str, int, int, float, str]], elapsed: float, workers: int) -> None:
+    rows = sum(r[1] for r in results)
+    pages = sum(r[2] for r in results)
+    busy = sum(r[3] for r in results)
+    print(f"\nRendered {len(results)} documents ({rows} rows, {pages} pages) in {elapsed:.2f}s with {workers} workers")
+    if elapsed > 0:
+        print(f"  {len(results) / elapsed:.1f} documents/s, {rows / elapsed:.0f} rows/s, {pages / elapsed:.1f} pages/s")
+    if results:
+        print(f"  Worker time per document: {busy / len(results):.3f}s average, "
+              f"average worker concurrency {busy / elapsed if elapsed > 0 else 0:.1f}")
+        slowest = max(results, key=lambda r: r[3])
+        print(f"  Slowest: {slowest[0]} ({slowest[1]} rows, {slowest[3]:.2f}s)")
+        print("\nFiles:")
+        for group, rows, pages, _, filename in results:
+            print(f"  {group} -> {filename} ({rows} rows, {pages} pages)")
+
+def batch_main(args: argparse.Namespace) -> None:
+    workers = args.workers or os.cpu_count() or 1
+    columns = [c.strip() for c in args.columns.split(',')] if args.columns else None
+    col_widths = [float(w) for w in args.col_widths.split(',')] if args.col_widths else None
+    if columns and col_widths and len(columns) != len(col_widths):
+        print("--columns and --col-widths must have the same number of entries.")
+        sys.exit(1)
+    with instrumented_run(args, 'pdf_batch', prefix='pdf_batch') as run:
+        start = time.perf_counter()
+        try:
+            results = generate_batch_pdfs(args.csv, args.group_by, args.output_dir, columns, col_widths,
+                                          args.title, 'P' if args.portrait else 'L', workers, run)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+        print_batch_report(results, time.perf_counter() - start, workers)
+    print(f"PDFs saved to {args.output_dir}")
 
 # Example usage for any document type
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Generate the example PDF, or with --csv one PDF per group of rows in a CSV export.')
+    parser.add_argument('--csv', help='CSV export to render (e.g. a policy or tag export)')
+    parser.add_argument('--group-by', default='device_group', help='One document per value of this column')
+    parser.add_argument('--output-dir', default='pdf_reports', help='Folder for the generated PDFs')
+    parser.add_argument('--columns', help='Comma-separated columns to include (default: all but --group-by)')
+    parser.add_argument('--col-widths', help='Comma-separated column widths in mm (default: equal widths)')
+    parser.add_argument('--title', default='{group}', help="Document title; {group} is replaced (default: '{group}')")
+    parser.add_argument('--portrait', action='store_true', help='Portrait pages (default: landscape)')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: CPU count)')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    if args.csv:
+        batch_main(args)
+        sys.exit(0)
+
     # Example: Replace with your own document structure and data
     sections = [
         {
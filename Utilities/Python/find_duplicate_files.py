@@ -0,0 +1,261 @@
+import os
+import sys
+import csv
+import mmap
+import sqlite3
+import hashlib
+import argparse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from run_metrics import add_metrics_arguments, instrumented_run
+
+PARTIAL_BYTES = 64 * 1024
+DEFAULT_WORKERS = 8
+DEFAULT_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'find_duplicate_files.sqlite')
+
+
+def scan_files(root, min_size=0):
+    """
+    Yield (path, os.stat_result) for every regular file under root, without following symlinks.
+    """
+    stack = [root]
+    while stack:
+        folder = stack.pop()
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            st = entry.stat(follow_symlinks=False)
+                            if st.st_size < min_size:
+                                continue
+                            yield entry.path, st
+                    except OSError as e:
+                        print(f"Skipped: {entry.path} - {e}")
+        except OSError as e:
+            print(f"Skipped: {folder} - {e}")
+
+
+def group_by_size(files):
+    # Only sizes shared by two or more files can hold duplicates
+    sizes = defaultdict(list)
+    for path, st in files:
+        sizes[st.st_size].append((path, st))
+    return {size: group for size, group in sizes.items() if len(group) > 1}
+
+
+def partial_hash(path, size):
+    # Head and tail blocks; for small files this covers the whole content
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        h.update(f.read(PARTIAL_BYTES))
+        if size > PARTIAL_BYTES:
+            f.seek(max(PARTIAL_BYTES, size - PARTIAL_BYTES))
+            h.update(f.read(PARTIAL_BYTES))
+    return h.hexdigest()
+
+
+def full_hash(path, size):
+    # SHA-256 over an mmap of the file; hashlib releases the GIL, so threads hash in parallel
+    h = hashlib.sha256()
+    if size:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            h.update(m)
+    return h.hexdigest()
+
+
+class HashCache:
+    """
+    Persistent partial/full hashes keyed on (device, inode, size, mtime), so unchanged
+    files are never read again on a re-scan. Only used from the main thread.
+    """
+    def __init__(self, path):
+        self.db = None
+        if not path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS hashes (dev INTEGER, ino INTEGER, size INTEGER, '
+                        'mtime INTEGER, partial TEXT, full TEXT, PRIMARY KEY (dev, ino, size, mtime))')
+
+    @staticmethod
+    def key(st):
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def get(self, st):
+        # (partial, full); either can be None
+        if self.db is None:
+            return None, None
+        row = self.db.execute('SELECT partial, full FROM hashes WHERE dev=? AND ino=? AND size=? AND mtime=?',
+                              self.key(st)).fetchone()
+        return row if row else (None, None)
+
+    def put(self, st, partial=None, full=None):
+        if self.db is None:
+            return
+        self.db.execute('INSERT INTO hashes VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (dev, ino, size, mtime) DO UPDATE '
+                        'SET partial=coalesce(excluded.partial, partial), full=coalesce(excluded.full, full)',
+                        (*self.key(st), partial, full))
+
+    def close(self):
+        if self.db is not None:
+            self.db.commit()
+            self.db.close()
+
+
+def hash_stage(candidates, hash_func, cached, store, executor, run, counter):
+    """
+    Hash (path, st) candidates, taking cached digests where available and computing
+    the rest in parallel. Candidates of any size can be passed in one call, so the pool
+    stays busy across size groups. Returns {(size, digest): [(path, st), ...]} without
+    singletons.
+    """
+    groups = defaultdict(list)
+    todo = []
+    for path, st in candidates:
+        digest = cached(st)
+        if digest:
+            run.count('cache_hits')
+            groups[(st.st_size, digest)].append((path, st))
+        else:
+            todo.append((path, st))
+
+    def work(item):
+        path, st = item
+        try:
+            return hash_func(path, st.st_size)
+        except (OSError, ValueError) as e:
+            print(f"Skipped: {path} - {e}")
+            return None
+
+    for (path, st), digest in zip(todo, executor.map(work, todo)):
+        if digest is None:
+            continue
+        run.count(counter)
+        store(st, digest)
+        groups[(st.st_size, digest)].append((path, st))
+    return {d: g for d, g in groups.items() if len(g) > 1}
+
+
+def find_duplicates(root, run, workers=DEFAULT_WORKERS, cache_path=DEFAULT_CACHE, min_size=0):
+    """
+    Return lists of duplicate paths (each sorted, groups sorted by first path).
+    Files are grouped by size, then by a head+tail partial hash, and only files
+    that still collide get a full SHA-256.
+    """
+    cache = HashCache(cache_path)
+    try:
+        with run.phase('scan'):
+            files = list(scan_files(root, min_size))
+        run.count('files_scanned', len(files))
+        # Hard links share an inode: hash it once, report every path
+        links = defaultdict(list)
+        unique = []
+        for path, st in files:
+            if (st.st_dev, st.st_ino) not in links:
+                unique.append((path, st))
+            links[(st.st_dev, st.st_ino)].append(path)
+        by_size = group_by_size(unique)
+        duplicates = []
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            with run.phase('partial_hash'):
+                candidates = []
+                for size, group in by_size.items():
+                    if size == 0:
+                        duplicates.append(group)
+                    else:
+                        candidates.extend(group)
+                partial = hash_stage(candidates, partial_hash, lambda st: cache.get(st)[0],
+                                     lambda st, d: cache.put(st, partial=d), executor, run, 'partial_hashed')
+            with run.phase('full_hash'):
+                candidates = []
+                for (size, _), group in partial.items():
+                    if size <= 2 * PARTIAL_BYTES:
+                        # The partial hash already covered every byte
+                        duplicates.append(group)
+                    else:
+                        candidates.extend(group)
+                duplicates.extend(hash_stage(candidates, full_hash, lambda st: cache.get(st)[1],
+                                             lambda st, d: cache.put(st, full=d), executor, run,
+                                             'full_hashed').values())
+    finally:
+        cache.close()
+    groups = sorted(sorted(p for _, st in group for p in links[(st.st_dev, st.st_ino)]) for group in duplicates)
+    run.count('duplicate_groups', len(groups))
+    run.count('rows', sum(len(g) for g in groups))
+    return groups
+
+
+def write_report(groups, filename):
+    with open(filename, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['group', 'path', 'size', 'keep'])
+        for idx, group in enumerate(groups, 1):
+            for i, path in enumerate(group):
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    size = ''
+                writer.writerow([idx, path, size, 'yes' if i == 0 else 'no'])
+
+
+def delete_duplicates(groups, run):
+    # Keep the first file of each group (path order), delete the rest
+    for group in groups:
+        for path in group[1:]:
+            try:
+                os.remove(path)
+                run.count('deleted')
+                print(f"Deleted duplicate: {path}")
+            except OSError as e:
+                print(f"Could not delete: {path} - {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Find duplicate files (report only, or delete all but one copy).')
+    parser.add_argument('folder', nargs='?', help='Folder to scan (default: your Downloads folder)')
+    parser.add_argument('--delete', action='store_true', help='Delete all but one file in each duplicate group')
+    parser.add_argument('--yes', action='store_true', help='Do not ask for confirmation before deleting')
+    parser.add_argument('--csv', metavar='PATH', help='Also write the duplicate groups to a CSV file')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'Files hashed in parallel (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--min-size', type=int, default=1, help='Ignore files smaller than this many bytes (default: 1)')
+    parser.add_argument('--cache', default=DEFAULT_CACHE, help=f'Hash cache database (default: {DEFAULT_CACHE})')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the hash cache')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    # Change the folder path to the location you want to scan for duplicates
+    folder = args.folder or os.path.join(os.path.expanduser('~'), 'Downloads')
+    if not os.path.isdir(folder):
+        print(f"Folder not found: {folder}")
+        sys.exit(1)
+
+    with instrumented_run(args, 'find_duplicate_files', prefix='duplicate_files') as run:
+        groups = find_duplicates(folder, run, args.workers, None if args.no_cache else args.cache, args.min_size)
+
+        if not groups:
+            print(f"No duplicate files found in {folder}")
+        else:
+            print("Duplicate files found:\n")
+            for group in groups:
+                print("Duplicate group:")
+                for path in group:
+                    print(f"  - {path}")
+                print()
+        if args.csv:
+            write_report(groups, args.csv)
+            print(f"Report saved to {args.csv}")
+
+        if args.delete and groups:
+            count = sum(len(g) - 1 for g in groups)
+            if not args.yes:
+                confirm = input(f"Delete {count} duplicate files, keeping the first of each group? (y/n): ")
+                if confirm.strip().lower() != 'y':
+                    print("Nothing deleted.")
+                    sys.exit(0)
+            delete_duplicates(groups, run)
+            print(f"\nCleanup complete. All duplicate files (except one copy) have been deleted from {folder}.")
@@ -1,37 +1,330 @@
 import os
+import sys
 import csv
+import gzip
+import heapq
+import queue
+import tempfile
+import threading
+import argparse
+from itertools import groupby
+from concurrent.futures import ThreadPoolExecutor
 
-# Prompt the user for the folder path
-# It is recommended to save this script in the folder containing the CSV files.
-folder = input("Enter the path to the folder containing CSV files (leave blank for current directory): ").strip()
-if not folder:
-    folder = os.getcwd()
+from run_metrics import add_metrics_arguments, instrumented_run
 
-output_file = os.path.join(folder, 'merge.csv')
+BATCH_ROWS = 5000
+QUEUE_BATCHES = 4
+DEFAULT_WORKERS = 4
+DEFAULT_SORT_ROWS = 200000
+MAX_MERGE_FILES = 64
 
-# Find all CSV files in the folder (excluding the output file)
-csv_files = [f for f in os.listdir(folder) if f.endswith('.csv') and f != 'merge.csv']
 
-all_rows = []
-all_headers = set()
+def open_text(path, mode='r'):
+    # .gz files are (de)compressed transparently
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
 
-# Read all CSV files and collect headers and rows
-for filename in csv_files:
-    with open(os.path.join(folder, filename), 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
-        all_rows.extend(rows)
-        all_headers.update(reader.fieldnames or [])
 
-all_headers = list(all_headers)
+def find_csv_files(folder, output_file):
+    # All .csv / .csv.gz files in the folder (excluding the output file), in name order
+    output_name = os.path.basename(output_file)
+    return sorted(f for f in os.listdir(folder)
+                  if (f.endswith('.csv') or f.endswith('.csv.gz')) and f != output_name)
 
-# Write merged CSV
-with open(output_file, 'w', encoding='utf-8', newline='') as f:
-    writer = csv.DictWriter(f, fieldnames=all_headers)
-    writer.writeheader()
-    for row in all_rows:
-        # Fill missing columns with empty string
-        full_row = {header: row.get(header, '') for header in all_headers}
-        writer.writerow(full_row)
 
-print(f"Merged {len(csv_files)} CSV files into {output_file}") 
+def read_header(path):
+    with open_text(path) as f:
+        return next(csv.reader(f), [])
+
+
+def merged_headers(headers):
+    # Columns in first-seen order over the files (in name order), so the output is deterministic
+    columns = []
+    seen = set()
+    for header in headers:
+        for column in header:
+            if column not in seen:
+                seen.add(column)
+                columns.append(column)
+    return columns
+
+
+def put(out, item, stop):
+    # Blocking put that gives up once the consumer has stopped
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def read_batches(path, out, stop):
+    # Reader thread: pushes lists of rows, then None; a bounded queue keeps memory flat
+    try:
+        with open_text(path) as f:
+            batch = []
+            for row in csv.DictReader(f):
+                batch.append(row)
+                if len(batch) >= BATCH_ROWS:
+                    if not put(out, batch, stop):
+                        return
+                    batch = []
+            if batch and not put(out, batch, stop):
+                return
+        put(out, None, stop)
+    except Exception as e:
+        put(out, e, stop)
+
+
+def iter_rows(paths, workers=DEFAULT_WORKERS):
+    """
+    Yield the rows of all files in order while up to `workers` files are read ahead in
+    parallel. Each file has a small bounded queue, so memory stays at roughly
+    workers * QUEUE_BATCHES * BATCH_ROWS rows no matter how large the inputs are.
+    """
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        try:
+            queues = []
+            for path in paths:
+                q = queue.Queue(maxsize=QUEUE_BATCHES)
+                executor.submit(read_batches, path, q, stop)
+                queues.append(q)
+            for path, q in zip(paths, queues):
+                while True:
+                    batch = q.get()
+                    if batch is None:
+                        break
+                    if isinstance(batch, Exception):
+                        raise RuntimeError(f"Failed to read {path}: {batch}")
+                    yield from batch
+        finally:
+            # Unblocks the readers if we stop early (error or abandoned generator)
+            stop.set()
+
+
+def merge_csv_files(folder, output_file, run, workers=DEFAULT_WORKERS):
+    csv_files = find_csv_files(folder, output_file)
+    paths = [os.path.join(folder, f) for f in csv_files]
+    for path in paths:
+        run.count('bytes_read', os.path.getsize(path))
+    run.count('files', len(csv_files))
+
+    # First pass: headers only
+    with run.phase('headers'):
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            all_headers = merged_headers(executor.map(read_header, paths))
+
+    # Second pass: stream rows straight to the output, filling missing columns with ''
+    rows = 0
+    with run.phase('merge'):
+        with open_text(output_file, 'w') as f:
+            writer = csv.DictWriter(f, fieldnames=all_headers, restval='', extrasaction='ignore')
+            writer.writeheader()
+            for row in iter_rows(paths, workers):
+                writer.writerow(row)
+                rows += 1
+    run.count('rows', rows)
+    return len(csv_files)
+
+
+def spill(records, tmpdir, run):
+    # Write sorted (key, seq, values) records to a temporary run file
+    fd, path = tempfile.mkstemp(suffix='.csv', dir=tmpdir)
+    with open(fd, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        for key, seq, values in records:
+            writer.writerow([*key, seq, *values])
+    run.count('spill_files')
+    return path
+
+
+def read_spill(path, key_len):
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.reader(f):
+            yield tuple(row[:key_len]), int(row[key_len]), row[key_len + 1:]
+
+
+def merge_spills(paths, key_len):
+    return heapq.merge(*(read_spill(p, key_len) for p in paths), key=lambda r: (r[0], r[1]))
+
+
+def external_sort(records, key_len, tmpdir, run, max_rows=DEFAULT_SORT_ROWS):
+    """
+    Sort (key tuple, seq, values) records by (key, seq) with at most max_rows in memory.
+    Full buffers are sorted and spilled to run files in tmpdir, which are then merged
+    lazily; more than MAX_MERGE_FILES runs are first merged in rounds to cap open files.
+    """
+    buffer = []
+    runs = []
+    for record in records:
+        buffer.append(record)
+        if len(buffer) >= max_rows:
+            buffer.sort(key=lambda r: (r[0], r[1]))
+            runs.append(spill(buffer, tmpdir, run))
+            buffer = []
+    buffer.sort(key=lambda r: (r[0], r[1]))
+    if not runs:
+        return iter(buffer)
+    if buffer:
+        runs.append(spill(buffer, tmpdir, run))
+    while len(runs) > MAX_MERGE_FILES:
+        merged = spill(merge_spills(runs[:MAX_MERGE_FILES], key_len), tmpdir, run)
+        for path in runs[:MAX_MERGE_FILES]:
+            os.remove(path)
+        runs = runs[MAX_MERGE_FILES:] + [merged]
+    return merge_spills(runs, key_len)
+
+
+def keyed_records(rows, keys, columns):
+    # (key tuple, input order, values in column order) per row
+    for seq, row in enumerate(rows):
+        yield tuple(row.get(k) or '' for k in keys), seq, [row.get(c) or '' for c in columns]
+
+
+def check_keys(keys, columns, what):
+    missing = [k for k in keys if k not in columns]
+    if missing:
+        raise ValueError(f"Key column(s) {', '.join(missing)} not found in {what}")
+
+
+def dedupe_csv_files(paths, output_file, keys, run, workers=DEFAULT_WORKERS, max_rows=DEFAULT_SORT_ROWS,
+                     tmpdir=None):
+    """
+    Merge the files keeping one row per key: the latest one, i.e. the last row for
+    that key in file name order (timestamped export names sort chronologically).
+    Output is sorted by key.
+    """
+    with run.phase('headers'):
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            columns = merged_headers(executor.map(read_header, paths))
+    check_keys(keys, columns, 'the input files')
+
+    rows = 0
+    with tempfile.TemporaryDirectory(prefix='merge_csv_', dir=tmpdir) as spill_dir:
+        with run.phase('sort'):
+            records = external_sort(keyed_records(iter_rows(paths, workers), keys, columns),
+                                    len(keys), spill_dir, run, max_rows)
+        with run.phase('merge'):
+            with open_text(output_file, 'w') as f:
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                for _, group in groupby(records, key=lambda r: r[0]):
+                    *_, latest = group
+                    writer.writerow(latest[2])
+                    rows += 1
+    run.count('rows', rows)
+    return rows
+
+
+def join_csv_files(left, right, output_file, keys, run, how='inner', max_rows=DEFAULT_SORT_ROWS, tmpdir=None):
+    """
+    Sort-merge join of two CSV files on the key columns (how: inner, left or outer).
+    Both sides are sorted externally; only the right-hand rows of one key are held
+    in memory at a time. Right-hand columns that clash with left ones get a _right suffix.
+    """
+    left_columns, right_columns = read_header(left), read_header(right)
+    check_keys(keys, left_columns, left)
+    check_keys(keys, right_columns, right)
+    right_extra = [c for c in right_columns if c not in keys]
+    output_columns = left_columns + [c + '_right' if c in left_columns else c for c in right_extra]
+    empty_left = [''] * len(left_columns)
+    empty_right = [''] * len(right_extra)
+
+    def output(key, left_values, right_values):
+        if left_values is empty_left:
+            # Right-only row (outer join): the key columns come from the right side
+            left_values = list(empty_left)
+            for k, v in zip(keys, key):
+                left_values[left_columns.index(k)] = v
+        return left_values + right_values
+
+    rows = 0
+    with tempfile.TemporaryDirectory(prefix='merge_csv_', dir=tmpdir) as spill_dir:
+        with run.phase('sort'):
+            left_sorted = groupby(external_sort(keyed_records(iter_rows([left], 1), keys, left_columns),
+                                                len(keys), spill_dir, run, max_rows), key=lambda r: r[0])
+            right_sorted = groupby(external_sort(keyed_records(iter_rows([right], 1), keys, right_extra),
+                                                 len(keys), spill_dir, run, max_rows), key=lambda r: r[0])
+        with run.phase('merge'):
+            with open_text(output_file, 'w') as f:
+                writer = csv.writer(f)
+                writer.writerow(output_columns)
+                lkey, lgroup = next(left_sorted, (None, None))
+                rkey, rgroup = next(right_sorted, (None, None))
+                while lkey is not None or rkey is not None:
+                    if rkey is None or (lkey is not None and lkey < rkey):
+                        if how in ('left', 'outer'):
+                            for record in lgroup:
+                                writer.writerow(output(lkey, record[2], empty_right))
+                                rows += 1
+                        lkey, lgroup = next(left_sorted, (None, None))
+                    elif lkey is None or rkey < lkey:
+                        if how == 'outer':
+                            for record in rgroup:
+                                writer.writerow(output(rkey, empty_left, record[2]))
+                                rows += 1
+                        rkey, rgroup = next(right_sorted, (None, None))
+                    else:
+                        matches = [record[2] for record in rgroup]
+                        for record in lgroup:
+                            for right_values in matches:
+                                writer.writerow(output(lkey, record[2], right_values))
+                                rows += 1
+                        lkey, lgroup = next(left_sorted, (None, None))
+                        rkey, rgroup = next(right_sorted, (None, None))
+    run.count('rows', rows)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Merge all CSV files (.csv or .csv.gz) in a folder into merge.csv.')
+    parser.add_argument('folder', nargs='?', help='Folder containing the CSV files (prompted if omitted)')
+    parser.add_argument('--output', default='merge.csv',
+                        help='Output file name inside the folder; .gz compresses it (default: merge.csv)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'Files read in parallel (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--key', help='Comma-separated key columns, e.g. device_group,rule_name. '
+                                      'Keeps only the latest row per key (files in name order)')
+    parser.add_argument('--join', nargs=2, metavar=('LEFT', 'RIGHT'),
+                        help='Join these two CSV files of the folder on --key instead of concatenating')
+    parser.add_argument('--how', choices=['inner', 'left', 'outer'], default='inner', help='Join type (default: inner)')
+    parser.add_argument('--sort-rows', type=int, default=DEFAULT_SORT_ROWS,
+                        help=f'Rows sorted in memory before spilling to disk (default: {DEFAULT_SORT_ROWS})')
+    parser.add_argument('--tmpdir', help='Directory for sort spill files (default: system temp)')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    folder = args.folder
+    if folder is None:
+        # Prompt the user for the folder path
+        # It is recommended to save this script in the folder containing the CSV files.
+        folder = input("Enter the path to the folder containing CSV files (leave blank for current directory): ").strip()
+    if not folder:
+        folder = os.getcwd()
+
+    keys = [k.strip() for k in (args.key or '').split(',') if k.strip()]
+    if args.join and not keys:
+        print("--join needs --key.")
+        sys.exit(1)
+
+    output_file = os.path.join(folder, args.output)
+    with instrumented_run(args, 'merge_csv_files', prefix='merge_csv') as run:
+        try:
+            if args.join:
+                left, right = (os.path.join(folder, f) for f in args.join)
+                rows = join_csv_files(left, right, output_file, keys, run, args.how, args.sort_rows, args.tmpdir)
+                print(f"Joined {args.join[0]} and {args.join[1]} into {output_file} ({rows} rows)")
+            elif keys:
+                paths = [os.path.join(folder, f) for f in find_csv_files(folder, output_file)]
+                rows = dedupe_csv_files(paths, output_file, keys, run, args.workers, args.sort_rows, args.tmpdir)
+                print(f"Merged {len(paths)} CSV files into {output_file} ({rows} unique keys)")
+            else:
+                count = merge_csv_files(folder, output_file, run, args.workers)
+                print(f"Merged {count} CSV files into {output_file}")
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
@@ -0,0 +1,204 @@
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# HELP text of the Prometheus metrics every script writes; other counters get a generic one
+METRIC_HELP = {
+    'duration_seconds': 'Wall-clock duration of the last run.',
+    'phase_seconds': 'Time per phase in the last run, summed across threads.',
+    'rows_per_second': 'Rows written per second in the last run.',
+    'process_peak_rss_bytes': 'Peak resident set size of the process so far, earlier runs included.',
+    'last_run_timestamp_seconds': 'Start time of the last run.',
+    'requests': 'API requests made in the last run.',
+    'request_errors': 'Failed API requests in the last run.',
+    'request_bytes': 'Response bytes received in the last run.',
+    'rows': 'Rows written in the last run.',
+}
+
+
+def process_peak_rss_bytes():
+    # ru_maxrss is the high-water mark of the whole process, not of the current run
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class RunMetrics:
+    """
+    Run instrumentation shared by the utility scripts: wall time per phase, named
+    counters, throughput and the process's peak memory, written as JSON and/or as a
+    Prometheus textfile-collector file. Safe to update from worker threads; phase times
+    are summed across threads, so with concurrent workers a phase can exceed the run's
+    duration. Palo Alto/panorama/panorama_metrics.py carries a copy for the Panorama
+    scripts; keep the two in step.
+    """
+    def __init__(self, script: str = '', prefix: str = 'utility'):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.reset(script)
+
+    def reset(self, script: str = ''):
+        with self.lock:
+            self.script = script
+            self.started = time.time()
+            self.start_perf = time.perf_counter()
+            self.phases = {}
+            self.counters = {}
+
+    def add_time(self, phase: str, seconds: float):
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def count(self, name: str, value: int = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_rows(self, count: int):
+        self.count('rows', count)
+
+    def record_request(self, seconds: float, size: int, ok: bool = True):
+        with self.lock:
+            for name, value in (('requests', 1), ('request_bytes', size or 0), ('request_errors', 0 if ok else 1)):
+                self.counters[name] = self.counters.get(name, 0) + value
+            self.phases['api'] = self.phases.get('api', 0.0) + seconds
+
+    def wrap_writer(self, writer):
+        return MetricsWriter(writer, self)
+
+    def summary(self):
+        duration = time.perf_counter() - self.start_perf
+        with self.lock:
+            rows = self.counters.get('rows', 0)
+            return {
+                'script': self.script,
+                'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+                'duration_seconds': round(duration, 3),
+                'phase_seconds': {k: round(v, 3) for k, v in sorted(self.phases.items())},
+                'counters': dict(sorted(self.counters.items())),
+                'rows_per_second': round(rows / duration, 1) if duration > 0 else 0.0,
+                'process_peak_rss_bytes': process_peak_rss_bytes(),
+            }
+
+    def write_json(self, path: str, extra=None):
+        data = self.summary()
+        if extra:
+            data.update(extra)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+
+    def write_prometheus(self, path: str):
+        data = self.summary()
+        label = f'script="{self.script}"'
+        samples = [('duration_seconds', label, data['duration_seconds'])]
+        samples += [('phase_seconds', f'{label},phase="{k}"', v) for k, v in data['phase_seconds'].items()]
+        samples += [(name, label, v) for name, v in data['counters'].items()]
+        samples.append(('rows_per_second', label, data['rows_per_second']))
+        if data['process_peak_rss_bytes'] is not None:
+            samples.append(('process_peak_rss_bytes', label, data['process_peak_rss_bytes']))
+        samples.append(('last_run_timestamp_seconds', label, int(self.started)))
+        lines = []
+        for name, labels, value in samples:
+            metric = f"{self.prefix}_{name}"
+            if f"# TYPE {metric} gauge" not in lines:
+                lines.append(f"# HELP {metric} {METRIC_HELP.get(name, f'{name} in the last run.')}")
+                lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric}{{{labels}}} {value}")
+        # Atomic replace, so a node exporter scrape never sees half a file
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(path + '.tmp', path)
+
+
+class MetricsWriter:
+    # Wraps a csv writer to time writes and count rows
+    def __init__(self, writer, run_metrics):
+        self.writer = writer
+        self.metrics = run_metrics
+
+    def writeheader(self):
+        self.writer.writeheader()
+
+    def writerow(self, row):
+        with self.metrics.phase('write'):
+            self.writer.writerow(row)
+        self.metrics.add_rows(1)
+
+    def writerows(self, rows):
+        rows = list(rows)
+        with self.metrics.phase('write'):
+            self.writer.writerows(rows)
+        self.metrics.add_rows(len(rows))
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument('--metrics-json', metavar='PATH', help='Write a JSON run summary to PATH')
+    parser.add_argument('--metrics-prom', metavar='PATH', help='Write a Prometheus textfile-collector file to PATH')
+    parser.add_argument('--profile', choices=['cprofile', 'tracemalloc'],
+                        help='Profile the run: cProfile stats or tracemalloc top allocations')
+
+
+@contextmanager
+def instrumented_run(args, script: str, prefix: str = 'utility', run: RunMetrics = None):
+    """
+    Yield a RunMetrics for one run (run, reset, if given), optionally profile the run,
+    and write the JSON / Prometheus outputs requested on the command line at the end.
+    """
+    if run is None:
+        run = RunMetrics(script, prefix)
+    else:
+        run.reset(script)
+    profile = getattr(args, 'profile', None)
+    profiler = None
+    if profile == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif profile == 'tracemalloc':
+        import tracemalloc
+        tracemalloc.start(25)
+    extra = {}
+    try:
+        yield run
+    finally:
+        if profile == 'cprofile':
+            import pstats
+            profiler.disable()
+            stats_path = f"{script}.prof"
+            profiler.dump_stats(stats_path)
+            print(f"\ncProfile stats saved to {stats_path}. Top functions by cumulative time:")
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+        elif profile == 'tracemalloc':
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            top = snapshot.statistics('lineno')[:10]
+            extra['tracemalloc_peak_bytes'] = peak
+            extra['tracemalloc_top'] = [f"{stat.traceback} size={stat.size} count={stat.count}" for stat in top]
+            print("\nTop allocation sites:")
+            for line in extra['tracemalloc_top']:
+                print(f"  {line}")
+        if getattr(args, 'metrics_json', None):
+            run.write_json(args.metrics_json, extra)
+            print(f"Run summary saved to {args.metrics_json}")
+        if getattr(args, 'metrics_prom', None):
+            run.write_prometheus(args.metrics_prom)
+            print(f"Prometheus metrics saved to {args.metrics_prom}")